@@ -0,0 +1,208 @@
+"""
+Offline benchmark harness for the detectors and the pipeline stages.
+
+Runs each stage over deterministic synthetic price series (see
+``ivtool.pipeline.synthetic``) and records wall time, ticks/sec and peak
+traced memory. Results are written as JSON under ``benchmarks/results/`` and
+can be compared against an earlier run to catch throughput regressions:
+
+    python -m benchmarks.run --sizes day month --save
+    python -m benchmarks.run --sizes day month --compare benchmarks/results/baseline.json
+"""
+from __future__ import annotations
+
+import argparse
+import contextlib
+import io
+import json
+import platform
+import sys
+import time
+import tracemalloc
+from collections.abc import Callable
+from dataclasses import asdict, dataclass
+from datetime import UTC, datetime
+from pathlib import Path
+
+import numpy as np
+import pandas as pd
+
+from src.ivtool.detectors import kernels
+from src.ivtool.detectors.bocpe import run_bocpe
+from src.ivtool.detectors.cusum import run_cusum
+from src.ivtool.detectors.page_hinkley import run_page_hinkley
+from src.ivtool.pipeline import main_factory
+from src.ivtool.pipeline.synthetic import SCALES, scale_prices
+
+RESULTS_DIR = Path(__file__).resolve().parent / "results"
+
+
+@dataclass
+class BenchmarkInput:
+    frame: pd.DataFrame
+    returns: pd.Series
+    high_timestamps: list[pd.Timestamp]
+    low_timestamps: list[pd.Timestamp]
+
+    @classmethod
+    def from_frame(cls, frame: pd.DataFrame) -> BenchmarkInput:
+        prices = frame["price"].astype(float)
+        returns = np.log(prices / prices.shift(1)).dropna().reset_index(drop=True)
+        # Ground-truth regime switches stand in for detector alarms.
+        switches = frame["regime"].diff().fillna(0)
+        return cls(
+            frame=frame,
+            returns=returns,
+            high_timestamps=frame.loc[switches > 0, "time"].tolist(),
+            low_timestamps=frame.loc[switches < 0, "time"].tolist(),
+        )
+
+
+@dataclass
+class BenchmarkResult:
+    stage: str
+    scale: str
+    ticks: int
+    seconds: float
+    ticks_per_sec: float
+    peak_mb: float
+    jit: bool
+
+
+def _high_regime_minutes(data: BenchmarkInput) -> object:
+    final_timestamp = data.frame["time"].iloc[-1]
+    return main_factory._high_regime_minutes(data.high_timestamps, data.low_timestamps, final_timestamp)
+
+
+STAGES: dict[str, Callable[[BenchmarkInput], object]] = {
+    "run_cusum": lambda data: run_cusum(data.returns, **main_factory.DEFAULT_CUSUM_PARAMS),
+    "run_page_hinkley": lambda data: run_page_hinkley(data.frame, **main_factory.DEFAULT_PAGE_HINKLEY_PARAMS),
+    "run_bocpe": lambda data: run_bocpe(data.returns, **main_factory.DEFAULT_BOCPE_PARAMS),
+    "_high_regime_minutes": _high_regime_minutes,
+    "calibrate_detectors": lambda data: main_factory.calibrate_detectors(data.frame),
+}
+
+# Calibration needs flagged days from every detector, which one session cannot give.
+MIN_SCALE = {"calibrate_detectors": "month"}
+
+
+def _scales_for(stage: str, sizes: list[str]) -> list[str]:
+    smallest = SCALES[MIN_SCALE.get(stage, "day")]
+    return [scale for scale in sizes if SCALES[scale] >= smallest]
+
+
+def _quiet(func: Callable[[BenchmarkInput], object], data: BenchmarkInput) -> None:
+    # The pipeline functions print progress; keep benchmark output readable.
+    with contextlib.redirect_stdout(io.StringIO()):
+        func(data)
+
+
+def measure(stage: str, scale: str, data: BenchmarkInput, repeat: int = 3) -> BenchmarkResult:
+    func = STAGES[stage]
+    timings = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        _quiet(func, data)
+        timings.append(time.perf_counter() - start)
+
+    # Memory is traced in a separate pass so tracing overhead does not skew timings.
+    tracemalloc.start()
+    _quiet(func, data)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    seconds = min(timings)
+    ticks = len(data.frame)
+    return BenchmarkResult(
+        stage=stage,
+        scale=scale,
+        ticks=ticks,
+        seconds=seconds,
+        ticks_per_sec=ticks / seconds if seconds > 0 else float("inf"),
+        peak_mb=peak / 2**20,
+        jit=kernels.jit_available(),
+    )
+
+
+def run_benchmarks(sizes: list[str], stages: list[str], repeat: int = 3, seed: int = 0) -> list[BenchmarkResult]:
+    # Compile the kernels (and warm the caches) before anything is timed.
+    for stage in stages:
+        if _scales_for(stage, sizes):
+            warmup = BenchmarkInput.from_frame(scale_prices(MIN_SCALE.get(stage, "day"), seed=seed))
+            _quiet(STAGES[stage], warmup)
+
+    results = []
+    for scale in sizes:
+        data = BenchmarkInput.from_frame(scale_prices(scale, seed=seed))
+        for stage in stages:
+            if scale not in _scales_for(stage, [scale]):
+                print(f"{stage:<22} {scale:<7} skipped (needs --sizes {MIN_SCALE[stage]} or larger)")
+                continue
+            result = measure(stage, scale, data, repeat=repeat)
+            print(
+                f"{stage:<22} {scale:<7} {result.ticks:>9} ticks  {result.seconds:9.4f}s  "
+                f"{result.ticks_per_sec:>12.0f} ticks/s  {result.peak_mb:8.1f} MB"
+            )
+            results.append(result)
+    return results
+
+
+def save_results(results: list[BenchmarkResult], path: Path | None = None) -> Path:
+    if path is None:
+        stamp = datetime.now(UTC).strftime("%Y%m%dT%H%M%SZ")
+        path = RESULTS_DIR / f"{platform.node() or 'local'}-{stamp}.json"
+    path.parent.mkdir(parents=True, exist_ok=True)
+    payload = {
+        "created": datetime.now(UTC).isoformat(),
+        "python": platform.python_version(),
+        "machine": platform.machine(),
+        "results": [asdict(result) for result in results],
+    }
+    path.write_text(json.dumps(payload, indent=2))
+    return path
+
+
+def compare_results(results: list[BenchmarkResult], baseline_path: Path, tolerance: float = 0.25) -> list[str]:
+    """Returns a message for every stage whose throughput fell more than ``tolerance`` below the baseline."""
+    baseline = {
+        (row["stage"], row["scale"]): row
+        for row in json.loads(Path(baseline_path).read_text())["results"]
+    }
+    regressions = []
+    for result in results:
+        previous = baseline.get((result.stage, result.scale))
+        if previous is None:
+            continue
+        if result.ticks_per_sec < (1.0 - tolerance) * previous["ticks_per_sec"]:
+            regressions.append(
+                f"{result.stage} @ {result.scale}: {result.ticks_per_sec:.0f} ticks/s "
+                f"vs baseline {previous['ticks_per_sec']:.0f} ticks/s"
+            )
+    return regressions
+
+
+def main(argv: list[str] | None = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--sizes", nargs="+", default=["day", "month"], choices=list(SCALES))
+    parser.add_argument("--stages", nargs="+", default=list(STAGES), choices=list(STAGES))
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--save", nargs="?", const="", default=None, help="write results JSON (optionally to a path)")
+    parser.add_argument("--compare", type=Path, help="baseline results JSON to check for regressions")
+    parser.add_argument("--tolerance", type=float, default=0.25)
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.sizes, args.stages, repeat=args.repeat, seed=args.seed)
+    if args.save is not None:
+        path = save_results(results, Path(args.save) if args.save else None)
+        print(f"Results written to {path}")
+    if args.compare is not None:
+        regressions = compare_results(results, args.compare, tolerance=args.tolerance)
+        for message in regressions:
+            print(f"REGRESSION {message}")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -1,31 +1,39 @@
-import os
-import psycopg2
-import pandas as pd
-from dotenv import load_dotenv
- 
-load_dotenv()
-database_url = os.getenv("DATABASE_URL2")
-table_name = "SPY_DATA_V2"
- 
- 
-try:
-    conn = psycopg2.connect(database_url)
-    #query = f'SELECT * FROM "{table_name}" ORDER BY time DESC;' 
-    #full csv with all data
-
-    #top 100 rows only, modify as needed
-    query = f'SELECT * FROM "{table_name}" ORDER BY time ASC;'
-
- 
-    df = pd.read_sql(query, conn)
- 
-    print(f"Fetched {len(df)} rows from '{table_name}':\n")
-    print(df.head())
- 
-    df.to_csv(f"{table_name}full.csv", index=False)
-    print("done")
-except Exception as e:
-    print(f"error fetching data: {e}")
-finally:
-    if 'conn' in locals():
-        conn.close()
\ No newline at end of file
+import argparse
+import sys
+from pathlib import Path
+
+# Run as a script from the repository root or from data/.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from src.ivtool import storage
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Export the price table, or a range of it, to CSV")
+    parser.add_argument("--table", default=storage.DEFAULT_TABLE)
+    parser.add_argument("--symbol", default=None)
+    parser.add_argument("--start", default=None, help="first time included (UTC)")
+    parser.add_argument("--end", default=None, help="first time excluded (UTC)")
+    parser.add_argument("--out", default=None, help="default <table>full.csv")
+    args = parser.parse_args(argv)
+
+    store = storage.store_from_env(args.table)
+    out = args.out or f"{args.table}full.csv"
+    rows = 0
+    try:
+        # Streamed in chunks, so the export never holds the whole table.
+        for i, chunk in enumerate(store.iter_range(args.symbol, args.start, args.end)):
+            chunk.to_csv(out, mode="w" if i == 0 else "a", header=i == 0, index=False)
+            rows += len(chunk)
+    except Exception as e:
+        print(f"error fetching data: {e}")
+        raise
+    finally:
+        store.pool.close()
+
+    print(f"Fetched {rows} rows from '{args.table}' into {out}")
+    return rows
+
+
+if __name__ == "__main__":
+    main()
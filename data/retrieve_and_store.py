@@ -1,25 +1,19 @@
-import databento as db
-import pandas as pd
-import os
-from dotenv import load_dotenv
-from datetime import datetime, timezone, timedelta
-import psycopg2
-from psycopg2.extras import execute_values
+import argparse
 import logging
+import os
+import sys
+from datetime import UTC, datetime, timedelta
+from pathlib import Path
 
-logging.basicConfig(
-    filename="spy_ingestion.log",
-    level=logging.INFO,
-    format="%(asctime)s | %(levelname)s | %(message)s",
-)
-
-logger = logging.getLogger(__name__)
+import pandas as pd
 
+# Run as a script from the repository root or from data/.
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
 
-load_dotenv()
+from src.ivtool import storage
+from src.ivtool.pipeline import ingestion
 
-client = db.Historical(os.getenv("DATABENTO_API_KEY"))
-database_url = os.getenv("DATABASE_URL2")
+logger = logging.getLogger(__name__)
 
 
 def fetch_from_databento_and_clean(client, symbol="SPY", days_back=7, start_date=None, end_date=None):
@@ -29,7 +23,7 @@ def fetch_from_databento_and_clean(client, symbol="SPY", days_back=7, start_date
         end = end_date
 
     else:
-        today_utc = datetime.now(timezone.utc)
+        today_utc = datetime.now(UTC)
         start_utc = today_utc - timedelta(days=days_back)
 
         # Set end to midnight today to avoid requesting future data, we set to 2 to get fridays data. 
@@ -55,67 +49,62 @@ def fetch_from_databento_and_clean(client, symbol="SPY", days_back=7, start_date
     )
 
     # Convert to DataFrame
-    df = data.to_df().reset_index()
-    logger.info(f"Fetched {len(df)} raw rows")
-
-    df["ts_event"] = pd.to_datetime(df["ts_event"], utc=True)
-    df["time"] = df["ts_event"].dt.tz_convert("US/Eastern")
-    
-    # Filter to regular trading hours (09:30–16:00 ET)
-    df = (
-        df.set_index("time")
-        .between_time("09:30", "16:00", inclusive="both")
-        .reset_index()
-    )
-    
-
-    # Rename and select columns
-    df = df.rename(columns={"close": "price"})
-    df["time"] = df["time"].dt.strftime("%Y-%m-%d %H:%M:%S %Z")
-    df = df[["time", "symbol", "price"]]
-    df = df.sort_values("time", ascending=True).reset_index(drop=True)
-
-    logger.info(f"Cleaned data to {len(df)} rows after filtering trading hours.")
+    df = ingestion.clean_bars(data.to_df())
+    logger.info(f"Fetched {len(df)} regular-session rows")
 
     return df
 
-def insert_data_to_db(df: pd.DataFrame, db_url: str, table_name: str):
+def insert_data_to_db(df: pd.DataFrame, store: storage.PriceStore):
     if df is None or df.empty:
         logger.warning("No data to insert — skipping DB insert")
+        return 0
 
-        return
-    
-
-
-    rows = df[["time", "symbol", "price"]].values.tolist()
-    logger.info(f"Inserting {len(rows)} rows into {table_name}")
-
-    sql = f'''
-        INSERT INTO "{table_name}" ("time", "symbol", "price")
-        VALUES %s
-        ON CONFLICT ("time", "symbol") DO NOTHING
-    '''
-
-    conn = psycopg2.connect(db_url)
+    logger.info(f"Inserting {len(df)} rows into {store.table}")
     try:
-        with conn.cursor() as cur:
-            execute_values(cur, sql, rows, page_size=10_000)
-        conn.commit()
+        inserted = store.insert(df)
         logger.info("Database insert committed successfully")
-    except Exception as e:
+    except Exception:
         logger.exception("Database insert failed")
         raise
+    return inserted
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Fetch the sessions missing since the stored watermark")
+    parser.add_argument("--symbols", nargs="+", default=["SPY"])
+    parser.add_argument("--table", default=storage.DEFAULT_TABLE)
+    parser.add_argument("--until", default=None, help="fetch sessions closing by this time; default today 00:00 UTC")
+    parser.add_argument("--backfill-days", type=int, default=7, help="history fetched for a symbol with no stored rows")
+    parser.add_argument("--since", default=None, help="re-fetch from this time regardless of the watermark")
+    parser.add_argument("--runs-log", default="ingestion_runs.jsonl")
+    parser.add_argument("--index", choices=storage.INDEXES, default="btree",
+                        help="index created with the table if missing; brin suits append-only history")
+    args = parser.parse_args(argv)
+
+    import databento as db
+    from dotenv import load_dotenv
+
+    logging.basicConfig(
+        filename="spy_ingestion.log",
+        level=logging.INFO,
+        format="%(asctime)s | %(levelname)s | %(message)s",
+    )
+    load_dotenv()
+    client = db.Historical(os.getenv("DATABENTO_API_KEY"))
+    store = storage.store_from_env(args.table)
 
+    logger.info("Starting ingestion job")
+    try:
+        store.ensure_schema(args.index)
+        runs = ingestion.ingest(
+            client, store, args.symbols, until=args.until, backfill_days=args.backfill_days, since=args.since
+        )
     finally:
-        conn.close()
+        store.pool.close()
+    ingestion.append_runs(runs, args.runs_log)
+    logger.info("Ingestion job completed")
+    return runs
 
 
 if __name__ == "__main__":
-    logger.info("Starting SPY ingestion job")
-
-    df_cleaned = fetch_from_databento_and_clean(client, days_back=7)
-    insert_data_to_db(df_cleaned, database_url, table_name="SPY_DATA_V2")
-    logger.info("SPY ingestion job completed")
-
-    
-
+    main()
@@ -1 +1,11 @@
-__all__ = ["detectors", "pipeline"]
+import importlib
+from types import ModuleType
+
+__all__ = ["detectors", "pipeline", "storage"]
+
+
+def __getattr__(name: str) -> ModuleType:
+    # Submodules are imported on first access so `import ivtool` stays cheap.
+    if name in __all__:
+        return importlib.import_module(f"{__name__}.{name}")
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
@@ -0,0 +1,230 @@
+from __future__ import annotations
+
+import math
+from collections.abc import Sequence
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+DEFAULT_HAZARDS = (1.0 / 100.0, 1.0 / 390.0, 1.0 / (390.0 * 3), 1.0 / (390.0 * 10))
+
+
+class AdaptiveVolatilityBOCPE:
+    """
+    VolatilityBOCPE with hazard and prior scale learned from the stream.
+
+    Hazard: a bank of hazard hypotheses, each with its own run-length
+    posterior, weighted by its (exponentially forgotten) log evidence. The
+    Student-t predictive density only depends on the run length, so it is
+    computed once per tick and shared by every hypothesis. Decisions use the
+    weight-averaged run-length posterior.
+
+    Prior scale: each run length stores its observation count and sum of
+    squares, so ``beta_r = prior_beta_t + 0.5 * ss_r`` follows the learned
+    ``prior_beta_t``. ``prior_beta_t`` takes a gradient step on the log
+    evidence of each observation (in log space, ``prior_learning_rate``).
+
+    With a single hazard and ``prior_learning_rate=0`` this is VolatilityBOCPE.
+    """
+
+    def __init__(
+        self,
+        hazards: Sequence[float] = DEFAULT_HAZARDS,
+        threshold: float = 0.5,
+        prior_alpha: float = 2.0,
+        prior_beta: float = 0.01,
+        vol_threshold: float = 0.02,
+        max_run_length: int | None = None,
+        prior_learning_rate: float = 0.01,
+        hazard_forgetting: float = 0.999,
+    ) -> None:
+        self.hazards = np.asarray(hazards, dtype=np.float64)
+        if self.hazards.ndim != 1 or self.hazards.size == 0:
+            raise ValueError("hazards must be a non-empty sequence")
+        if np.any(self.hazards <= 0.0) or np.any(self.hazards >= 1.0):
+            raise ValueError("hazards must be in (0, 1)")
+        if not (0.0 < threshold < 1.0):
+            raise ValueError("threshold must be in (0, 1)")
+        if prior_alpha <= 1.0:
+            raise ValueError("prior_alpha must be > 1.0 for defined expected variance")
+        if prior_beta <= 0.0:
+            raise ValueError("prior_beta must be positive")
+        if vol_threshold <= 0.0:
+            raise ValueError("vol_threshold must be positive")
+        if max_run_length is not None and max_run_length < 1:
+            raise ValueError("max_run_length must be >= 1")
+        if prior_learning_rate < 0.0:
+            raise ValueError("prior_learning_rate must be non-negative")
+        if not (0.0 < hazard_forgetting <= 1.0):
+            raise ValueError("hazard_forgetting must be in (0, 1]")
+
+        self.threshold = float(threshold)
+        self.prior_alpha = float(prior_alpha)
+        self.initial_prior_beta = float(prior_beta)
+        self.vol_threshold = float(vol_threshold)
+        self.max_run_length = max_run_length
+        self.prior_learning_rate = float(prior_learning_rate)
+        self.hazard_forgetting = float(hazard_forgetting)
+
+        self.reset()
+
+    def reset(self) -> None:
+        self.t = 0
+        self.prior_beta = self.initial_prior_beta
+        # (hypotheses, run lengths) posterior; counts / sums of squares per run length.
+        self._probs = np.ones((self.hazards.size, 1))
+        self._counts = np.zeros(1)
+        self._sum_squares = np.zeros(1)
+        self._log_weights = np.zeros(self.hazards.size)
+        self._lgamma_table = np.empty(0)
+        self._cp_prob = 0.0
+        self._map_run_length = 0
+        self._current_regime = "Low Volatility"
+
+    @property
+    def hazard_weights(self) -> np.ndarray:
+        weights = np.exp(self._log_weights - self._log_weights.max())
+        return weights / weights.sum()
+
+    @property
+    def hazard(self) -> float:
+        """Posterior-mean hazard over the bank."""
+        return float(self.hazard_weights @ self.hazards)
+
+    def run_length_posterior(self) -> np.ndarray:
+        return self.hazard_weights @ self._probs
+
+    def _log_gamma_ratio(self, counts: np.ndarray) -> np.ndarray:
+        # lgamma(alpha + 0.5) - lgamma(alpha) depends only on the integer count; tabulated once.
+        needed = int(counts.max()) + 1
+        if needed > self._lgamma_table.size:
+            alphas = self.prior_alpha + 0.5 * np.arange(max(needed, 2 * self._lgamma_table.size, 64))
+            self._lgamma_table = np.array([math.lgamma(a + 0.5) - math.lgamma(a) for a in alphas])
+        return self._lgamma_table[counts.astype(np.int64)]
+
+    def update(self, x: float) -> tuple[bool, str]:
+        x = float(x)
+        x2 = x ** 2
+        alphas = self.prior_alpha + 0.5 * self._counts
+        betas = self.prior_beta + 0.5 * self._sum_squares
+
+        log_pred = (
+            self._log_gamma_ratio(self._counts)
+            - 0.5 * np.log(2.0 * math.pi * betas)
+            - (alphas + 0.5) * np.log1p(x2 / (2.0 * betas))
+        )
+        # Scaled by the largest density; the scale cancels in every normalisation below.
+        scale = log_pred.max()
+        pred = np.exp(log_pred - scale)
+
+        joint = self._probs * pred
+        evidence = joint.sum(axis=1)
+        if np.any(evidence <= 0.0):
+            raise FloatingPointError("numerical instability in adaptive BOCPE update")
+
+        weights = self.hazard_weights
+        if self.prior_learning_rate > 0.0:
+            # d log p(x | r) / d prior_beta, averaged under the predictive mixture.
+            dlog_pred = -0.5 / betas + (alphas + 0.5) * (x2 / (2.0 * betas ** 2)) / (1.0 + x2 / (2.0 * betas))
+            mixture = weights @ joint
+            gradient = float(mixture @ dlog_pred / mixture.sum())
+            step = float(np.clip(self.prior_learning_rate * self.prior_beta * gradient, -0.5, 0.5))
+            self.prior_beta *= math.exp(step)
+
+        self._log_weights = self.hazard_forgetting * self._log_weights + np.log(evidence) + scale
+        self._log_weights -= self._log_weights.max()
+
+        hazards = self.hazards[:, None]
+        new_probs = np.empty((self.hazards.size, joint.shape[1] + 1))
+        new_probs[:, 0] = evidence * self.hazards
+        new_probs[:, 1:] = joint * (1.0 - hazards)
+        new_probs /= evidence[:, None]
+        self._counts = np.concatenate([[1.0], self._counts + 1.0])
+        self._sum_squares = np.concatenate([[x2], self._sum_squares + x2])
+
+        if self.max_run_length is not None and new_probs.shape[1] > self.max_run_length + 1:
+            keep = self.max_run_length + 1
+            new_probs = new_probs[:, :keep]
+            total = new_probs.sum(axis=1)
+            if np.any(total <= 0.0):
+                raise FloatingPointError("numerical instability after truncation")
+            new_probs /= total[:, None]
+            self._counts = self._counts[:keep]
+            self._sum_squares = self._sum_squares[:keep]
+        self._probs = new_probs
+
+        posterior = self.run_length_posterior()
+        new_map = int(np.argmax(posterior))
+        new_cp_prob = float(posterior[0])
+        triggered = (new_cp_prob >= self.threshold) or (self.t > 0 and new_map < self._map_run_length)
+
+        map_alpha = self.prior_alpha + 0.5 * self._counts[new_map]
+        map_beta = self.prior_beta + 0.5 * self._sum_squares[new_map]
+        expected_variance = map_beta / (map_alpha - 1.0)
+        regime_label = "High Volatility" if expected_variance > self.vol_threshold else "Low Volatility"
+
+        self._cp_prob = new_cp_prob
+        self._map_run_length = new_map
+        self._current_regime = regime_label
+        self.t += 1
+        return triggered, regime_label
+
+    def state(self) -> dict[str, float | str]:
+        return {
+            "t": float(self.t),
+            "cp_prob": float(self._cp_prob),
+            "map_run_length": float(self._map_run_length),
+            "hazard": self.hazard,
+            "prior_beta": float(self.prior_beta),
+            "current_regime": self._current_regime,
+        }
+
+
+def run_adaptive_bocpe(returns: pd.Series, **params: Any) -> tuple[pd.Series, pd.Series, pd.DataFrame]:
+    """Alarms, regimes and the learned ``hazard`` / ``prior_beta`` per tick."""
+    import pandas as pd
+
+    detector = AdaptiveVolatilityBOCPE(**params)
+    alarms = np.zeros(len(returns), dtype=bool)
+    regimes = []
+    learned = np.empty((len(returns), 2))
+    for i, x in enumerate(returns):
+        triggered, regime = detector.update(float(x))
+        alarms[i] = triggered
+        regimes.append(regime)
+        learned[i] = detector.hazard, detector.prior_beta
+    return (
+        pd.Series(alarms, index=returns.index),
+        pd.Series(regimes, index=returns.index, dtype=object),
+        pd.DataFrame(learned, index=returns.index, columns=["hazard", "prior_beta"]),
+    )
+
+
+def main_adaptive_bocpe_run(df: pd.DataFrame, threshold: float = 0.5, vol_threshold: float = 0.0003, max_run_length: int = 1200, **params: Any) -> pd.DataFrame:
+    """Same input and output as ``main_bocpe_run``, without a fixed hazard or prior scale."""
+    import pandas as pd
+
+    print("Running adaptive Volatility BOCPE change point detection...")
+    from src.ivtool.detectors.inputs import detector_inputs
+
+    inputs = detector_inputs(df)
+    returns = inputs["log_return"]
+    timestamps = inputs["time"]
+    alarms, regimes, learned = run_adaptive_bocpe(
+        returns, threshold=threshold, vol_threshold=vol_threshold, max_run_length=max_run_length, **params
+    )
+
+    flagged = pd.DataFrame({
+        "timestamp": timestamps[alarms],
+        "alarm": True,
+        "new_regime": regimes[alarms],
+    }).reset_index(drop=True)
+    print(
+        "Adaptive BOCPE run complete. Number of change points detected:", len(flagged),
+        f"(final hazard {learned['hazard'].iloc[-1]:.2e}, prior_beta {learned['prior_beta'].iloc[-1]:.2e})"
+        if len(learned) else "",
+    )
+    return flagged
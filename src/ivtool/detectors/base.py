@@ -1,81 +1,134 @@
 # Calculating 30 min rolling std and finding alarm flags (Saanvi)
 
-import pandas as pd
+from __future__ import annotations
+
+from typing import TYPE_CHECKING, Any
+
 import numpy as np
-import matplotlib.pyplot as plt
-
-# Loading data from CSV (SPY_Datafull.csv)
-df = pd.read_csv('SPY_Datafull.csv', parse_dates=['timestamp']) # convert to Python datetime objects to sort chronologically
-df = df.sort_values('timestamp')
-df = df.reset_index(drop=True) # discard old index
-
-# Calculating returns
-df['returns'] = df['price'].pct_change()
-# Printing first 10 or so return values to check
-print(f"\nFirst 10 returns:")
-print(df[['timestamp', 'price', 'returns']].head(10))
-
-# Calculating 30 min rolling std
-df['rolling_std'] = df['returns'].rolling(window=30, min_periods=30).std() # min_periods=30 to compute only after 30 values
-# Printing first 10 or so rows of rolling std values to check
-print(f"\nFirst 10 values of rolling std:")
-print(f"\n{df[['timestamp', 'price', 'rolling_std']].head(10)}") # shows needs min 30 values to compute
-# Printing first 10 real rolling std values to show that calculations happen
-print(f"\nFirst 10 real values of rolling std (index 30:40):")
-print(f"\n{df[['timestamp', 'price', 'rolling_std']].iloc[30:40]}\n") # shows NaN to rolling std
-
-# Calculating threshold (Using 95th percentile to start)
-# Can adjust threshold to find optimal sensitivity of alarm
-threshold = df['rolling_std'].quantile(0.95)
-
-# Alarm flag condition
-df['alarm'] = df['rolling_std'] > threshold
-
-# Calculating alarm rate
-total_alarms = df['alarm'].sum()
-print(f"Total alarms: {total_alarms}/{len(df)}\n")
-print(f"Alarm rate (%): {100 * total_alarms / len(df):.2f}%\n")
-
-# Grouping by day to make finding the quietest 3 and the busiest 3 easier
-df['date'] = df['timestamp'].dt.date
-daily_stats = df.groupby('date').agg({
-    'alarm': 'sum', 
-    'rolling_std': ['mean', 'max', 'std'], 
-    'returns': 'std'
-}).round(5)
-
-daily_stats.columns = ['num_alarms', 'avg_rolling_std', 'max_rolling_std', 
-                       'std_rolling_std', 'daily_return_std'
-                       ]
-
-sorted_by_alarms = daily_stats.sort_values('num_alarms')
-
-# Getting 3 most quiet and 3 most busy days
-print(f"\nThree quietest days:")
-print(sorted_by_alarms.head(3))
-print(f"\nThree busiest days:")
-print(sorted_by_alarms.tail(3))
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+
+def load_prices(path: str = 'SPY_Datafull.csv') -> pd.DataFrame:
+    # Loading data from CSV (SPY_Datafull.csv)
+    df = pd.read_csv(path, parse_dates=['timestamp']) # convert to Python datetime objects to sort chronologically
+    df = df.sort_values('timestamp')
+    return df.reset_index(drop=True) # discard old index
+
+
+def compute_baseline_alarms(df: pd.DataFrame, window: int = 30, quantile: float = 0.95) -> tuple[pd.DataFrame, float]:
+    """
+    Adds returns, rolling std and alarm columns to the price frame.
+    Returns the frame and the rolling std threshold used for the alarm flag.
+    """
+    # Calculating returns
+    df['returns'] = df['price'].pct_change()
+    # Printing first 10 or so return values to check
+    print("\nFirst 10 returns:")
+    print(df[['timestamp', 'price', 'returns']].head(10))
+
+    # Calculating 30 min rolling std
+    df['rolling_std'] = df['returns'].rolling(window=window, min_periods=window).std() # min_periods=30 to compute only after 30 values
+    # Printing first 10 or so rows of rolling std values to check
+    print("\nFirst 10 values of rolling std:")
+    print(f"\n{df[['timestamp', 'price', 'rolling_std']].head(10)}") # shows needs min 30 values to compute
+    # Printing first 10 real rolling std values to show that calculations happen
+    print("\nFirst 10 real values of rolling std (index 30:40):")
+    print(f"\n{df[['timestamp', 'price', 'rolling_std']].iloc[30:40]}\n") # shows NaN to rolling std
+
+    # Calculating threshold (Using 95th percentile to start)
+    # Can adjust threshold to find optimal sensitivity of alarm
+    threshold = df['rolling_std'].quantile(quantile)
+
+    # Alarm flag condition
+    df['alarm'] = df['rolling_std'] > threshold
+
+    # Calculating alarm rate
+    total_alarms = df['alarm'].sum()
+    print(f"Total alarms: {total_alarms}/{len(df)}\n")
+    print(f"Alarm rate (%): {100 * total_alarms / len(df):.2f}%\n")
+    return df, threshold
+
+
+def daily_alarm_stats(df: pd.DataFrame) -> pd.DataFrame:
+    # Grouping by day to make finding the quietest 3 and the busiest 3 easier
+    df['date'] = df['timestamp'].dt.date
+    daily_stats = df.groupby('date').agg({
+        'alarm': 'sum', 
+        'rolling_std': ['mean', 'max', 'std'], 
+        'returns': 'std'
+    }).round(5)
+
+    daily_stats.columns = ['num_alarms', 'avg_rolling_std', 'max_rolling_std', 
+                           'std_rolling_std', 'daily_return_std'
+                           ]
+
+    sorted_by_alarms = daily_stats.sort_values('num_alarms')
+
+    # Getting 3 most quiet and 3 most busy days
+    print("\nThree quietest days:")
+    print(sorted_by_alarms.head(3))
+    print("\nThree busiest days:")
+    print(sorted_by_alarms.tail(3))
+    return sorted_by_alarms
+
+
+def date_slices(df: pd.DataFrame) -> dict:
+    """Position slice of every 'date' in a frame sorted by timestamp, so a day is looked up without a scan."""
+    dates = df['date'].to_numpy()
+    starts = np.flatnonzero(np.concatenate([[True], dates[1:] != dates[:-1]])) if len(dates) else np.empty(0, dtype=int)
+    stops = np.append(starts[1:], len(dates))
+    if len(set(dates[starts])) < starts.size:
+        raise ValueError("rows of each date must be contiguous; sort the frame by timestamp")
+    return {dates[start]: slice(int(start), int(stop)) for start, stop in zip(starts, stops)}
 
 
 # Plotting price, rolling std, and alarm flags (Marco)
-def plot_daily_volatility(target_date, data_df, alarm_threshold):
+def plot_daily_volatility(
+    target_date: Any,
+    data_df: pd.DataFrame,
+    alarm_threshold: float,
+    rows: slice | None = None,
+    path: str | None = None,
+) -> None:
     """
     Plots the price, rolling standard deviation, and alarm flags for a given date.
     Parameters:
         target_date: The date to plot in 'YYYY-MM-DD'
         data_df (pd.DataFrame): The DataFrame containing the data.
         alarm_threshold (float): The threshold for alarm flags.
+        rows (slice): Positions of the date in data_df (see date_slices); without it the frame is filtered.
+        path (str): Saves the figure there on an Agg canvas instead of showing it; pyplot is not used.
     Uses a dual-axis plot to show price and standard deviation on different scales.
+    For many days, pipeline.reports renders downsampled reports in parallel.
     """
+    # matplotlib is only imported when a plot is actually drawn; a saved plot
+    # gets its own Agg canvas, so pyplot's global backend is left alone.
+    if path is None:
+        import matplotlib.pyplot as plt
+
+        fig = plt.figure(figsize=(14, 7))
+    else:
+        from matplotlib.backends.backend_agg import FigureCanvasAgg
+        from matplotlib.figure import Figure
+
+        fig = Figure(figsize=(14, 7))
+        FigureCanvasAgg(fig)
+
     print(f"\nPlotting data for {target_date}...\n")
-    # Filter data for the target date
-    day_df = data_df[data_df['date'] == target_date].copy()
+    # Slice (or filter) data for the target date
+    day_df = (data_df.iloc[rows] if rows is not None else data_df[data_df['date'] == target_date]).copy()
 
     #create the column for alarm markers
     day_df['alarm_point'] = np.where(day_df['alarm'], day_df['price'], np.nan)
 
     #set up the plot
-    fig, ax1 = plt.subplots(figsize=(14, 7))
+    ax1 = fig.subplots()
 
     #create ax2, a second y-axis that shares the same x-axis
     ax2 = ax1.twinx()
@@ -97,7 +150,7 @@ def plot_daily_volatility(target_date, data_df, alarm_threshold):
     ax2.tick_params(axis='y', labelcolor='green')
 
     #set title
-    plt.title(f'Intraday Volatility Monitoring for {target_date}')
+    ax1.set_title(f'Intraday Volatility Monitoring for {target_date}')
 
     #combine legends from both axes
     lines_1, labels_1 = ax1.get_legend_handles_labels()
@@ -105,18 +158,40 @@ def plot_daily_volatility(target_date, data_df, alarm_threshold):
     ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc='upper left')
 
     fig.tight_layout()
-    plt.show()
+    if path is None:
+        plt.show()
+    else:
+        fig.savefig(path)
+
+
+def main(path: str = 'SPY_Datafull.csv', out_dir: str | None = None) -> None:
+    """Plots the 3 quietest and 3 busiest days; with out_dir they are saved as PNGs instead of shown."""
+    import os
+
+    df, threshold = compute_baseline_alarms(load_prices(path))
+    sorted_by_alarms = daily_alarm_stats(df)
+    days = date_slices(df)
+    if out_dir is not None:
+        os.makedirs(out_dir, exist_ok=True)
+
+    def plot(day: Any) -> None:
+        target = None if out_dir is None else os.path.join(out_dir, f"{day}.png")
+        plot_daily_volatility(day, df, threshold, rows=days[day], path=target)
+
+    #get the lists of quiet days and busy days
+    quiet_days = sorted_by_alarms.head(3).index
+    busy_days = sorted_by_alarms.tail(3).index
+
+    #plot quiet days
+    print("\n--- Plotting 3 Quietest Days ---")
+    for day in quiet_days:
+        plot(day)
 
-#get the lists of quiet days and busy days
-quiet_days = sorted_by_alarms.head(3).index
-busy_days = sorted_by_alarms.tail(3).index
+    #plot busy days
+    print("\n--- Plotting 3 Busiest Days ---")
+    for day in busy_days:
+        plot(day)
 
-#plot quiet days
-print("\n--- Plotting 3 Quietest Days ---")
-for day in quiet_days:
-    plot_daily_volatility(day, df, threshold)
 
-#plot busy days
-print("\n--- Plotting 3 Busiest Days ---")
-for day in busy_days:
-    plot_daily_volatility(day, df, threshold)
+if __name__ == "__main__":
+    main()
@@ -1,17 +1,73 @@
 from __future__ import annotations
  
-import numpy as np
-import pandas as pd
 from dataclasses import dataclass
-from math import exp, log, pi, lgamma
-from typing import Dict, List, Optional, Tuple
+from math import exp, lgamma, log, pi
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.ivtool.detectors.inputs import detector_inputs
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from src.ivtool.detectors.bocpe_recorder import PosteriorRecorder
+else:
+    pd = lazy_module("pandas")
  
  
 @dataclass
 class _PosteriorState:
-    run_length_probs: List[float]
-    alpha_posteriors: List[float]
-    beta_posteriors: List[float]
+    run_length_probs: list[float]
+    alpha_posteriors: list[float]
+    beta_posteriors: list[float]
+
+
+@dataclass(frozen=True)
+class BOCPECheckpoint:
+    """Snapshot of a VolatilityBOCPE detector that ``restore`` resumes from."""
+    t: int
+    run_length_probs: tuple[float, ...]
+    alpha_posteriors: tuple[float, ...]
+    beta_posteriors: tuple[float, ...]
+    cp_prob: float
+    map_run_length: int
+    current_regime: str
+ 
+ 
+@dataclass(frozen=True)
+class BOCPETrajectory:
+    """
+    Per-tick posterior summary of a VolatilityBOCPE run. ``threshold`` and
+    ``vol_threshold`` are decision rules applied after the recursion, so any
+    number of them can be evaluated over one trajectory.
+    """
+    cp_prob: np.ndarray
+    map_run_length: np.ndarray
+    expected_variance: np.ndarray
+    initial_map_run_length: int = 0
+    first_update: bool = True
+
+    def __len__(self) -> int:
+        return len(self.cp_prob)
+
+    def map_drops(self) -> np.ndarray:
+        previous = np.concatenate([[self.initial_map_run_length], self.map_run_length[:-1]])
+        drops = self.map_run_length < previous
+        if self.first_update and drops.size:
+            drops[0] = False
+        return drops
+
+    def alarms(self, threshold: Any) -> np.ndarray:
+        """Alarm flags per tick; an array of thresholds gives one row per threshold."""
+        threshold = np.asarray(threshold, dtype=np.float64)
+        return (self.cp_prob >= threshold[..., None]) | self.map_drops()
+
+    def high_regime(self, vol_threshold: Any) -> np.ndarray:
+        """High-volatility flags per tick; an array of thresholds gives one row per threshold."""
+        vol_threshold = np.asarray(vol_threshold, dtype=np.float64)
+        return self.expected_variance > vol_threshold[..., None]
  
  
 class VolatilityBOCPE:
@@ -24,7 +80,8 @@ class VolatilityBOCPE:
         prior_alpha: float = 2.0,   
         prior_beta: float = 0.01,
         vol_threshold: float = 0.02, 
-        max_run_length: Optional[int] = None,
+        max_run_length: int | None = None,
+        recorder: PosteriorRecorder | None = None,
     ) -> None:
         if not (0.0 < hazard < 1.0):
             raise ValueError("hazard must be in (0, 1)")
@@ -45,6 +102,9 @@ class VolatilityBOCPE:
         self.prior_beta = float(prior_beta)
         self.vol_threshold = float(vol_threshold)
         self.max_run_length = max_run_length
+        self.recorder = recorder
+        if recorder is not None:
+            recorder.attach(max_run_length)
  
         self.reset()
  
@@ -68,13 +128,14 @@ class VolatilityBOCPE:
         )
         return exp(log_pdf)
  
-    def _predictive_density(self, x: float) -> List[float]:
-        pred: List[float] = []
+    def _predictive_density(self, x: float) -> list[float]:
+        pred: list[float] = []
         for alpha, beta in zip(self._state.alpha_posteriors, self._state.beta_posteriors):
             pred.append(self._student_t_pdf(x, alpha, beta))
         return pred
  
-    def update(self, x: float) -> Tuple[bool, str]:
+    def update(self, x: float, timestamp: int | None = None) -> tuple[bool, str]:
+        """One tick. ``timestamp`` (int64 ns) only labels the tick for the recorder; it defaults to ``t``."""
         x = float(x)
         prev_probs = self._state.run_length_probs
         pred = self._predictive_density(x)
@@ -126,10 +187,107 @@ class VolatilityBOCPE:
         self._cp_prob = new_cp_prob
         self._map_run_length = new_map
         self._current_regime = regime_label
+        if self.recorder is not None:
+            self.recorder.record(self.t if timestamp is None else timestamp, new_probs, new_alphas, new_betas, evidence)
         self.t += 1
         return triggered, regime_label
  
-    def state(self) -> Dict[str, float | str]:
+    def checkpoint(self) -> BOCPECheckpoint:
+        return BOCPECheckpoint(
+            t=self.t,
+            run_length_probs=tuple(self._state.run_length_probs),
+            alpha_posteriors=tuple(self._state.alpha_posteriors),
+            beta_posteriors=tuple(self._state.beta_posteriors),
+            cp_prob=self._cp_prob,
+            map_run_length=self._map_run_length,
+            current_regime=self._current_regime,
+        )
+
+    def restore(self, checkpoint: BOCPECheckpoint) -> None:
+        self.t = checkpoint.t
+        self._state = _PosteriorState(
+            run_length_probs=list(checkpoint.run_length_probs),
+            alpha_posteriors=list(checkpoint.alpha_posteriors),
+            beta_posteriors=list(checkpoint.beta_posteriors),
+        )
+        self._cp_prob = checkpoint.cp_prob
+        self._map_run_length = checkpoint.map_run_length
+        self._current_regime = checkpoint.current_regime
+
+    def trajectory(
+        self, returns: np.ndarray, use_jit: bool | None = None, timestamps: np.ndarray | None = None
+    ) -> BOCPETrajectory:
+        """
+        Feeds a block of returns through the posterior recursion and records the
+        per-tick summary that every threshold / vol_threshold rule is read from.
+        Uses the compiled kernel when available; either way the detector ends in
+        the same state as after calling ``update`` per tick. With a recorder
+        attached every tick goes through ``update``, labelled by ``timestamps``.
+        """
+        from src.ivtool.detectors import kernels
+
+        values = np.ascontiguousarray(returns, dtype=np.float64)
+        start_map, first_update = self._map_run_length, self.t == 0
+        if use_jit is None:
+            use_jit = kernels.jit_available()
+        if self.recorder is not None:
+            use_jit = False
+        if not use_jit or values.size == 0:
+            cp_prob = np.zeros(values.size)
+            map_run_length = np.zeros(values.size, dtype=np.int32)
+            expected_variance = np.zeros(values.size)
+            for i, x in enumerate(values):
+                self.update(float(x), None if timestamps is None else int(timestamps[i]))
+                cp_prob[i] = self._cp_prob
+                map_run_length[i] = self._map_run_length
+                expected_variance[i] = self._expected_variance(self._map_run_length)
+        else:
+            cp_prob, map_run_length, expected_variance, probs, alphas, betas, length = kernels.get_kernel("bocpe")(
+                values, *self._kernel_args(values.size)
+            )
+            self.t += int(values.size)
+            self._state = _PosteriorState(
+                run_length_probs=probs[:length].tolist(),
+                alpha_posteriors=alphas[:length].tolist(),
+                beta_posteriors=betas[:length].tolist(),
+            )
+            self._cp_prob = float(cp_prob[-1])
+            self._map_run_length = int(map_run_length[-1])
+            self._current_regime = (
+                "High Volatility" if expected_variance[-1] > self.vol_threshold else "Low Volatility"
+            )
+        return BOCPETrajectory(cp_prob, map_run_length, expected_variance, start_map, first_update)
+
+    def run_array(self, returns: np.ndarray, use_jit: bool | None = None) -> tuple[np.ndarray, np.ndarray]:
+        """``trajectory`` read with this detector's rules: (alarms, high_regime) boolean arrays."""
+        trajectory = self.trajectory(returns, use_jit=use_jit)
+        return trajectory.alarms(self.threshold), trajectory.high_regime(self.vol_threshold)
+
+    def _expected_variance(self, run_length: int) -> float:
+        return self._state.beta_posteriors[run_length] / (self._state.alpha_posteriors[run_length] - 1.0)
+
+    def _kernel_args(self, n: int) -> tuple:
+        """Arguments after ``returns`` for ``kernels.bocpe_kernel``, starting from the current state."""
+        length = len(self._state.run_length_probs)
+        if self.max_run_length is not None:
+            capacity = max(self.max_run_length, length) + 2
+        else:
+            capacity = length + n + 1
+        buffers = []
+        for values in (self._state.run_length_probs, self._state.alpha_posteriors, self._state.beta_posteriors):
+            buffer = np.zeros(capacity)
+            buffer[:length] = values
+            buffers.append(buffer)
+        return (
+            self.hazard,
+            self.prior_alpha,
+            self.prior_beta,
+            self.max_run_length or 0,
+            *buffers,
+            length,
+        )
+
+    def state(self) -> dict[str, float | str]:
         probs = self._state.run_length_probs
         map_run_length = self._map_run_length
         return {
@@ -141,18 +299,42 @@ class VolatilityBOCPE:
         }
  
  
-def run_bocpe(returns: pd.Series, hazard: float = 1.0/250.0, threshold: float = 0.5, vol_threshold: float = 0.02, max_run_length: int = 1200) -> Tuple[pd.Series, pd.Series]:
+def run_bocpe(returns: pd.Series, hazard: float = 1.0/250.0, threshold: float = 0.5, vol_threshold: float = 0.02, max_run_length: int = 1200, use_jit: bool | None = None) -> tuple[pd.Series, pd.Series]:
     print("Running Volatility BOCPE on returns...")
     detector = VolatilityBOCPE(hazard=hazard, threshold=threshold, vol_threshold=vol_threshold, max_run_length=max_run_length)
-    alarms = []
-    regimes = []
-    for x in returns:
-        triggered, regime = detector.update(float(x))
-        alarms.append(triggered)
-        regimes.append(regime)
+    alarms, high = detector.run_array(np.asarray(returns, dtype=np.float64), use_jit=use_jit)
+    regimes = np.where(high, "High Volatility", "Low Volatility")
     return pd.Series(alarms, index=returns.index), pd.Series(regimes, index=returns.index)
  
  
+def bocpe_trajectory(df: pd.DataFrame, hazard: float = 1/(390*3), max_run_length: int = 1200, use_jit: bool | None = None, recorder: PosteriorRecorder | None = None, **params: Any) -> tuple[pd.Series, BOCPETrajectory]:
+    """
+    Return timestamps of a 'time'/'price' df and the BOCPE trajectory over its log returns.
+    A ``recorder`` receives the run-length posterior of every tick, labelled with its timestamp.
+    """
+    inputs = detector_inputs(df)
+    detector = VolatilityBOCPE(hazard=hazard, max_run_length=max_run_length, recorder=recorder, **params)
+    timestamps = None
+    if recorder is not None:
+        timestamps = pd.to_datetime(inputs["time"], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return inputs["time"], detector.trajectory(inputs["log_return"].to_numpy(), use_jit=use_jit, timestamps=timestamps)
+
+
+def flag_bocpe(timestamps: pd.Series, trajectory: BOCPETrajectory, threshold: float = 0.5, vol_threshold: float = 0.0003) -> pd.DataFrame:
+    """The flagged-change-point frame of ``main_bocpe_run`` for one threshold / vol_threshold rule."""
+    if not (0.0 < threshold < 1.0):
+        raise ValueError("threshold must be in (0, 1)")
+    if vol_threshold <= 0.0:
+        raise ValueError("vol_threshold must be positive")
+    alarms = trajectory.alarms(threshold)
+    regimes = np.where(trajectory.high_regime(vol_threshold)[alarms], "High Volatility", "Low Volatility")
+    return pd.DataFrame({
+        "timestamp": timestamps[alarms],
+        "alarm": True,
+        "new_regime": regimes,
+    }).reset_index(drop=True)
+
+
 def main_bocpe_run(df: pd.DataFrame, hazard: float = 1/(390*3), threshold: float = 0.5, vol_threshold: float = 0.0003, max_run_length: int = 1200) -> pd.DataFrame:
     """
     Main entry point. Takes a df with 'time' and 'price' columns.
@@ -160,21 +342,7 @@ def main_bocpe_run(df: pd.DataFrame, hazard: float = 1/(390*3), threshold: float
     along with their identified volatility regime.
     """
     print("Running Volatility BOCPE change point detection...")
-    df = df.sort_values("time").reset_index(drop=True)
-    prices = df["price"].astype(float)
- 
-    returns = np.log(prices / prices.shift(1))
-    returns = returns.dropna().reset_index(drop=True)
- 
-    timestamps = df["time"].iloc[1:].reset_index(drop=True)
-    # Unpack both alarms and regimes
-    alarms, regimes = run_bocpe(returns, hazard=hazard, threshold=threshold, vol_threshold=vol_threshold, max_run_length=max_run_length)
- 
-    # Filter for only the points where an alarm was triggered
-    flagged = pd.DataFrame({
-        "timestamp": timestamps[alarms],
-        "alarm": True,
-        "new_regime": regimes[alarms]
-    }).reset_index(drop=True)
+    timestamps, trajectory = bocpe_trajectory(df, hazard=hazard, max_run_length=max_run_length)
+    flagged = flag_bocpe(timestamps, trajectory, threshold=threshold, vol_threshold=vol_threshold)
     print("BOCPE run complete. Number of change points detected:", len(flagged))
-    return flagged
\ No newline at end of file
+    return flagged
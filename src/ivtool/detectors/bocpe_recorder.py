@@ -0,0 +1,287 @@
+"""
+On-disk record of BOCPE run-length posteriors, for diagnostics without a rerun.
+
+``PosteriorRecorder`` is attached to a ``VolatilityBOCPE`` and keeps, per
+tick, the top ``k`` run lengths and their probabilities plus a few scalars,
+written as memory-mappable ``.npy`` chunks per New York session.
+``PosteriorStore`` reads them back by day or time range as a
+``RunLengthPosterior``.
+"""
+from __future__ import annotations
+
+import json
+import os
+from collections.abc import Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Any, Self
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+MANIFEST = "manifest.json"
+DEFAULT_TOP_K = 16
+DEFAULT_CHUNK_TICKS = 390 * 5
+SESSION_TZ = "America/New_York"
+
+# Per-tick arrays of a chunk, with their on-disk dtype (run_length is uint16
+# or int32, see PosteriorRecorder.attach).
+FIELDS = {
+    "time": np.int64,
+    "run_length": None,
+    "prob": np.float16,
+    "tail_mass": np.float16,
+    "cp_prob": np.float32,
+    "expected_variance": np.float32,
+    "log_evidence": np.float32,
+}
+
+
+@dataclass
+class RunLengthPosterior:
+    """
+    Recorded ticks of a VolatilityBOCPE run. ``run_length[i]``/``prob[i]``
+    are the ``k`` most probable run lengths at tick ``i``, most probable
+    first (so ``run_length[:, 0]`` is the MAP run length); ``tail_mass`` is
+    the probability left outside them. ``expected_variance`` is the
+    posterior mean variance and ``log_evidence`` the log predictive density
+    of the tick's return. Arrays read from a store are memory-mapped.
+    """
+    time: np.ndarray
+    run_length: np.ndarray
+    prob: np.ndarray
+    tail_mass: np.ndarray
+    cp_prob: np.ndarray
+    expected_variance: np.ndarray
+    log_evidence: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.time)
+
+    @property
+    def map_run_length(self) -> np.ndarray:
+        return self.run_length[:, 0]
+
+    def heatmap(self, max_run_length: int | None = None) -> np.ndarray:
+        """Dense (ticks, run lengths) float32 posterior, zero outside the top ``k``."""
+        if max_run_length is None:
+            max_run_length = int(self.run_length.max()) if len(self) else 0
+        dense = np.zeros((len(self), max_run_length + 1), dtype=np.float32)
+        rows = np.broadcast_to(np.arange(len(self))[:, None], self.run_length.shape)
+        keep = self.run_length <= max_run_length
+        dense[rows[keep], self.run_length[keep]] = self.prob[keep]
+        return dense
+
+    def to_frame(self) -> pd.DataFrame:
+        """Per-tick summary (without the top-k columns)."""
+        return pd.DataFrame({
+            "timestamp": pd.to_datetime(np.asarray(self.time), utc=True),
+            "cp_prob": self.cp_prob,
+            "map_run_length": self.map_run_length,
+            "tail_mass": self.tail_mass.astype(np.float32),
+            "expected_variance": self.expected_variance,
+            "log_evidence": self.log_evidence,
+        })
+
+
+def _next_session_start(timestamp_ns: int) -> int:
+    local = pd.Timestamp(timestamp_ns, tz="UTC").tz_convert(SESSION_TZ)
+    return int((local.normalize() + pd.Timedelta(days=1)).value)
+
+
+def _utc_ns(value: Any) -> int:
+    timestamp = pd.Timestamp(value)
+    return int((timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp).value)
+
+
+def _session_day(timestamp_ns: int) -> str:
+    return pd.Timestamp(timestamp_ns, tz="UTC").tz_convert(SESSION_TZ).strftime("%Y-%m-%d")
+
+
+class PosteriorRecorder:
+    """
+    Collects one row per ``VolatilityBOCPE.update`` and writes them to ``root``
+    in chunks of ``.npy`` files, one directory per chunk. A chunk closes after
+    ``chunk_ticks`` ticks or at the next New York session, so a day is
+    loaded by memory-mapping its own chunks. ``manifest.json`` lists the
+    chunks and is replaced after every chunk, so a store can be read while it
+    is being written. Opening an existing store appends to it.
+
+    Attach with ``VolatilityBOCPE(recorder=...)`` or ``bocpe_trajectory(df,
+    recorder=...)``; the detector calls ``attach`` with its ``max_run_length``.
+    Call ``close()`` (or use ``with``) to write the last chunk.
+    """
+
+    def __init__(self, root: str, k: int = DEFAULT_TOP_K, chunk_ticks: int = DEFAULT_CHUNK_TICKS) -> None:
+        if k < 1:
+            raise ValueError("k must be >= 1")
+        if chunk_ticks < 1:
+            raise ValueError("chunk_ticks must be >= 1")
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+        manifest = _read_manifest(root)
+        if manifest is not None:
+            if manifest["k"] != k:
+                raise ValueError(f"store at {root!r} records k={manifest['k']}, not {k}")
+            self.run_length_dtype = np.dtype(manifest["run_length_dtype"])
+            self._chunks: list[dict] = manifest["chunks"]
+        else:
+            self.run_length_dtype = np.dtype(np.int32)
+            self._chunks = []
+        self.k = k
+        self.chunk_ticks = chunk_ticks
+        self._rows: dict[str, list] = {name: [] for name in FIELDS}
+        self._session_end: int | None = None
+
+    def __enter__(self) -> Self:
+        return self
+
+    def __exit__(self, *exc: object) -> None:
+        self.close()
+
+    def attach(self, max_run_length: int | None) -> None:
+        """
+        Sizes ``run_length`` for the detector recording into it. Once ticks
+        are recorded the dtype is fixed, and a detector whose run lengths do
+        not fit it is rejected.
+        """
+        # uint16 holds any run length when the posterior is truncated below 65535.
+        small = max_run_length is not None and max_run_length < np.iinfo(np.uint16).max
+        dtype = np.dtype(np.uint16 if small else np.int32)
+        if not self._chunks and not self._rows["time"]:
+            self.run_length_dtype = dtype
+        elif dtype.itemsize > self.run_length_dtype.itemsize:
+            raise ValueError(
+                f"store at {self.root!r} records {self.run_length_dtype.name} run lengths, "
+                f"too small for max_run_length={max_run_length}"
+            )
+
+    def record(self, timestamp: int, probs: Sequence[float], alphas: Sequence[float], betas: Sequence[float], evidence: float) -> None:
+        """One tick: the normalised run-length posterior, its Normal-Gamma parameters and the update's evidence."""
+        timestamp = int(timestamp)
+        if self._session_end is not None and timestamp >= self._session_end:
+            self.flush()
+        if self._session_end is None:
+            self._session_end = _next_session_start(timestamp)
+
+        p = np.asarray(probs, dtype=np.float64)
+        variances = np.asarray(betas, dtype=np.float64) / (np.asarray(alphas, dtype=np.float64) - 1.0)
+        if p.size > self.k:
+            top = np.argpartition(p, p.size - self.k)[p.size - self.k:]
+        else:
+            top = np.arange(p.size)
+        top = top[np.argsort(-p[top], kind="stable")]
+        run_lengths = np.zeros(self.k, dtype=self.run_length_dtype)
+        top_probs = np.zeros(self.k, dtype=np.float16)
+        run_lengths[: top.size] = top
+        top_probs[: top.size] = p[top]
+
+        rows = self._rows
+        rows["time"].append(timestamp)
+        rows["run_length"].append(run_lengths)
+        rows["prob"].append(top_probs)
+        rows["tail_mass"].append(max(1.0 - float(p[top].sum()), 0.0))
+        rows["cp_prob"].append(p[0])
+        rows["expected_variance"].append(float(p @ variances))
+        rows["log_evidence"].append(np.log(evidence))
+        if len(rows["time"]) >= self.chunk_ticks:
+            self.flush()
+
+    def flush(self) -> None:
+        """Writes the buffered ticks as a new chunk."""
+        rows = self._rows
+        self._session_end = None
+        if not rows["time"]:
+            return
+        name = f"chunk_{len(self._chunks):06d}"
+        directory = os.path.join(self.root, name)
+        os.makedirs(directory, exist_ok=True)
+        for field, dtype in FIELDS.items():
+            values = rows[field]
+            array = np.stack(values) if field in ("run_length", "prob") else np.asarray(values, dtype=dtype)
+            np.save(os.path.join(directory, f"{field}.npy"), array)
+        times = rows["time"]
+        self._chunks.append({
+            "name": name,
+            "day": _session_day(times[0]),
+            "rows": len(times),
+            "first": times[0],
+            "last": times[-1],
+        })
+        self._rows = {field: [] for field in FIELDS}
+        manifest = {"k": self.k, "run_length_dtype": self.run_length_dtype.name, "chunks": self._chunks}
+        tmp = os.path.join(self.root, MANIFEST + ".tmp")
+        with open(tmp, "w") as fh:
+            json.dump(manifest, fh)
+        os.replace(tmp, os.path.join(self.root, MANIFEST))
+
+    def close(self) -> None:
+        self.flush()
+
+
+def _read_manifest(root: str) -> dict | None:
+    path = os.path.join(root, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as fh:
+        return json.load(fh)
+
+
+class PosteriorStore:
+    """Read side of a ``PosteriorRecorder`` directory."""
+
+    def __init__(self, root: str) -> None:
+        manifest = _read_manifest(root)
+        if manifest is None:
+            raise FileNotFoundError(f"no {MANIFEST} in {root!r}")
+        self.root = root
+        self.k = manifest["k"]
+        self.chunks: list[dict] = manifest["chunks"]
+
+    def __len__(self) -> int:
+        return sum(chunk["rows"] for chunk in self.chunks)
+
+    def days(self) -> list[str]:
+        return sorted({chunk["day"] for chunk in self.chunks})
+
+    def _load_chunk(self, chunk: dict) -> RunLengthPosterior:
+        directory = os.path.join(self.root, chunk["name"])
+        return RunLengthPosterior(**{
+            field: np.load(os.path.join(directory, f"{field}.npy"), mmap_mode="r") for field in FIELDS
+        })
+
+    @staticmethod
+    def _concat(parts: list[RunLengthPosterior]) -> RunLengthPosterior:
+        if len(parts) == 1:
+            return parts[0]
+        return RunLengthPosterior(**{field: np.concatenate([getattr(part, field) for part in parts]) for field in FIELDS})
+
+    def day(self, day: Any) -> RunLengthPosterior:
+        """Ticks of one New York session date (``"2024-03-04"`` or a date/timestamp)."""
+        key = pd.Timestamp(day).strftime("%Y-%m-%d")
+        parts = [self._load_chunk(chunk) for chunk in self.chunks if chunk["day"] == key]
+        if not parts:
+            raise KeyError(f"no recorded ticks on {key}")
+        return self._concat(parts)
+
+    def load(self, start: Any = None, end: Any = None) -> RunLengthPosterior:
+        """Ticks with ``start <= time < end`` (open when ``None``)."""
+        lo = np.iinfo(np.int64).min if start is None else _utc_ns(start)
+        hi = np.iinfo(np.int64).max if end is None else _utc_ns(end)
+        parts = []
+        for chunk in self.chunks:
+            if chunk["last"] < lo or chunk["first"] >= hi:
+                continue
+            part = self._load_chunk(chunk)
+            rows = slice(np.searchsorted(part.time, lo), np.searchsorted(part.time, hi))
+            parts.append(RunLengthPosterior(**{field: getattr(part, field)[rows] for field in FIELDS}))
+        if not parts:
+            return RunLengthPosterior(**{
+                field: np.empty((0, self.k) if field in ("run_length", "prob") else 0) for field in FIELDS
+            })
+        return self._concat(parts)
@@ -1,6 +1,11 @@
-from typing import Dict
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
 import numpy as np
-import pandas as pd
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 class CUSUM:
     """
@@ -30,11 +35,22 @@ class CUSUM:
             return True
         return False
 
-    def state(self) -> Dict[str, float]:
+    def state(self) -> dict[str, float]:
         return {"gp": self.gp, "gn": self.gn, "t": float(self.t)}
 
 
-def run_cusum(returns, k, h, mu=0.0):
+def run_cusum(returns: pd.Series, k: float, h: float, mu: float = 0.0, use_jit: bool | None = None) -> pd.Series:
+    import pandas as pd
+
+    from src.ivtool.detectors import kernels
+
+    if use_jit is None:
+        use_jit = kernels.jit_available()
+    if use_jit:
+        values = np.ascontiguousarray(returns, dtype=np.float64)
+        alarms = kernels.get_kernel("cusum")(values, float(k), float(h), float(mu))
+        return pd.Series(alarms, index=returns.index)
+
     detector = CUSUM(k=k, h=h, mu=mu)
     alarms = []
     for x in returns:
@@ -43,14 +59,13 @@ def run_cusum(returns, k, h, mu=0.0):
 
 
 def main_cusum_run(df: pd.DataFrame, k: float = 0.00005, h: float = 0.0023) -> pd.DataFrame:
+    import pandas as pd
 
-    df = df.sort_values("time").reset_index(drop=True)
-    prices = df["price"].astype(float)
-
-    returns = np.log(prices / prices.shift(1))
-    returns = returns.dropna().reset_index(drop=True)
+    from src.ivtool.detectors.inputs import detector_inputs
 
-    timestamps = df["time"].iloc[1:].reset_index(drop=True)
+    inputs = detector_inputs(df)
+    returns = inputs["log_return"]
+    timestamps = inputs["time"]
     alarms = run_cusum(returns, k=k, h=h)
 
     flagged = pd.DataFrame({
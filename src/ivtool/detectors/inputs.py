@@ -0,0 +1,39 @@
+from __future__ import annotations
+
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+
+def detector_inputs(df: pd.DataFrame) -> pd.DataFrame:
+    """
+    The returns every detector runs on, with columns ``time`` (the bar the
+    return ends at), ``prev_time`` (the bar before it) and ``log_return``.
+
+    A ``log_return`` column prepared by ``pipeline.quality`` is used as is,
+    skipping the returns it masked with NaN; otherwise returns are taken
+    between consecutive rows.
+    """
+    import pandas as pd
+
+    df = df.sort_values("time").reset_index(drop=True)
+    if "log_return" in df:
+        valid = df["log_return"].notna().to_numpy()
+        previous = df["time"].shift(1)
+        return pd.DataFrame({
+            "time": df["time"][valid].reset_index(drop=True),
+            "prev_time": previous[valid].reset_index(drop=True),
+            "log_return": df["log_return"][valid].astype(float).reset_index(drop=True),
+        })
+
+    prices = df["price"].astype(float)
+    returns = np.log(prices / prices.shift(1))
+    returns = returns.dropna().reset_index(drop=True)
+    return pd.DataFrame({
+        "time": df["time"].iloc[1:].reset_index(drop=True),
+        "prev_time": df["time"].iloc[:-1].reset_index(drop=True),
+        "log_return": returns,
+    })
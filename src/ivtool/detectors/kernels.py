@@ -0,0 +1,181 @@
+"""
+Compiled per-tick kernels for the offline detector loops.
+
+Each kernel mirrors the ``update`` recursion of its detector class operation for
+operation, so the class stays the reference implementation. Numba is optional:
+when it is installed the kernels are JIT-compiled on first use, otherwise
+``run_cusum``, ``run_page_hinkley`` and ``run_bocpe`` fall back to the classes.
+Set ``IVTOOL_JIT=0`` to force the fallback.
+"""
+from __future__ import annotations
+
+import importlib.util
+import math
+import os
+from collections.abc import Callable
+
+import numpy as np
+
+
+def cusum_kernel(returns: np.ndarray, k: float, h: float, mu: float) -> np.ndarray:
+    n = returns.shape[0]
+    alarms = np.zeros(n, dtype=np.bool_)
+    gp = 0.0
+    gn = 0.0
+    for i in range(n):
+        x = returns[i]
+        gp = max(0.0, gp + x - (mu + k))
+        gn = min(0.0, gn + x - (mu - k))
+        if gp > h or gn < -h:
+            gp = 0.0
+            gn = 0.0
+            alarms[i] = True
+    return alarms
+
+
+def page_hinkley_kernel(std_series: np.ndarray, alarm_threshold: float) -> tuple[np.ndarray, np.ndarray]:
+    """Returns the indices of high and low regime alarms into ``std_series``."""
+    n = std_series.shape[0]
+    high = np.empty(n, dtype=np.int64)
+    low = np.empty(n, dtype=np.int64)
+    n_high = 0
+    n_low = 0
+    sigma = 0.625188
+    mu = -8.288934
+    s = 0.0
+    s_min = 0.0
+    s_max = 0.0
+    for i in range(n):
+        x_std = std_series[i]
+        f_x = 1 / (x_std * sigma * (pow(2 * math.pi, 1 / 2)))
+        f_low_ln = -pow(math.log(x_std) - (mu - 0.2), 2)
+        f_high_ln = -pow(math.log(x_std) - (mu + 0.2), 2)
+        f_low = f_x * pow(math.e, f_low_ln / (2 * (pow(sigma, 2))))
+        f_high = f_x * pow(math.e, f_high_ln / (2 * (pow(sigma, 2))))
+        s += math.log(f_high) - math.log(f_low)
+        s_min = min(s_min, s)
+        s_max = max(s_max, s)
+        if s - s_min > alarm_threshold:
+            high[n_high] = i
+            n_high += 1
+            s = 0.0
+            s_min = 0.0
+            s_max = 0.0
+        elif s_max - s > alarm_threshold:
+            low[n_low] = i
+            n_low += 1
+            s = 0.0
+            s_min = 0.0
+            s_max = 0.0
+    return high[:n_high], low[:n_low]
+
+
+def bocpe_kernel(
+    returns: np.ndarray,
+    hazard: float,
+    prior_alpha: float,
+    prior_beta: float,
+    max_run_length: int,
+    probs: np.ndarray,
+    alphas: np.ndarray,
+    betas: np.ndarray,
+    length: int,
+) -> tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, np.ndarray, int]:
+    """
+    Runs the VolatilityBOCPE recursion over ``returns``, resuming from the
+    posterior in the first ``length`` entries of ``probs``/``alphas``/``betas``.
+    The buffers must hold ``length + n + 1`` entries, or ``max_run_length + 2``
+    when truncating (``max_run_length > 0``). Returns the per-tick change-point
+    probability, MAP run length and expected variance at the MAP run length,
+    then the final (probs, alphas, betas, length).
+    """
+    n = returns.shape[0]
+    cp_prob = np.zeros(n)
+    map_run_length = np.zeros(n, dtype=np.int32)
+    expected_variance = np.zeros(n)
+    new_probs = np.zeros_like(probs)
+    new_alphas = np.zeros_like(alphas)
+    new_betas = np.zeros_like(betas)
+
+    for i in range(n):
+        x = returns[i]
+        x2 = x ** 2
+        cp_unnorm = 0.0
+        for j in range(length):
+            alpha = alphas[j]
+            beta = betas[j]
+            log_pdf = (
+                math.lgamma(alpha + 0.5)
+                - math.lgamma(alpha)
+                - 0.5 * math.log(2.0 * math.pi * beta)
+                - (alpha + 0.5) * math.log(1.0 + x2 / (2.0 * beta))
+            )
+            pq = probs[j] * math.exp(log_pdf)
+            new_probs[j + 1] = pq * (1.0 - hazard)
+            cp_unnorm += pq * hazard
+        new_probs[0] = cp_unnorm
+        new_length = length + 1
+
+        evidence = 0.0
+        for j in range(new_length):
+            evidence += new_probs[j]
+        if evidence <= 0.0:
+            raise FloatingPointError("numerical instability in BOCPE update")
+        for j in range(new_length):
+            new_probs[j] = new_probs[j] / evidence
+
+        new_alphas[0] = prior_alpha + 0.5
+        new_betas[0] = prior_beta + 0.5 * x2
+        for j in range(length):
+            new_alphas[j + 1] = alphas[j] + 0.5
+            new_betas[j + 1] = betas[j] + 0.5 * x2
+
+        if max_run_length > 0 and new_length > max_run_length + 1:
+            new_length = max_run_length + 1
+            total = 0.0
+            for j in range(new_length):
+                total += new_probs[j]
+            if total <= 0.0:
+                raise FloatingPointError("numerical instability after truncation")
+            for j in range(new_length):
+                new_probs[j] = new_probs[j] / total
+
+        probs, new_probs = new_probs, probs
+        alphas, new_alphas = new_alphas, alphas
+        betas, new_betas = new_betas, betas
+        length = new_length
+
+        new_map = 0
+        for j in range(1, length):
+            if probs[j] > probs[new_map]:
+                new_map = j
+        cp_prob[i] = probs[0]
+        map_run_length[i] = new_map
+        expected_variance[i] = betas[new_map] / (alphas[new_map] - 1.0)
+
+    return cp_prob, map_run_length, expected_variance, probs, alphas, betas, length
+
+
+_KERNELS: dict[str, Callable] = {
+    "cusum": cusum_kernel,
+    "page_hinkley": page_hinkley_kernel,
+    "bocpe": bocpe_kernel,
+}
+_COMPILED: dict[str, Callable] = {}
+
+
+def jit_available() -> bool:
+    if os.environ.get("IVTOOL_JIT", "1") == "0":
+        return False
+    return importlib.util.find_spec("numba") is not None
+
+
+def get_kernel(name: str) -> Callable:
+    """Returns the compiled kernel, or the plain Python one when Numba is unavailable."""
+    if not jit_available():
+        return _KERNELS[name]
+    if name not in _COMPILED:
+        import numba
+
+        _COMPILED[name] = numba.njit(cache=True, nogil=True)(_KERNELS[name])
+    return _COMPILED[name]
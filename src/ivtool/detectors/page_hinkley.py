@@ -1,18 +1,22 @@
 from __future__ import annotations
 
 import math
+from typing import TYPE_CHECKING
+
 import numpy as np
-import pandas as pd
+
+if TYPE_CHECKING:
+    import pandas as pd
 
 
 class Page_Hinkley:
     def __init__(self, alarm_threshold: float = 250.0):
         self.alarm_threshold = float(alarm_threshold)
         self.t = 0
-        self.high_list = []
-        self.low_list = []
-        self.high_indices = []
-        self.low_indices = []
+        self.high_list: list[object] = []
+        self.low_list: list[object] = []
+        self.high_indices: list[int] = []
+        self.low_indices: list[int] = []
         self.reset()
 
     def reset(self) -> None:
@@ -32,7 +36,8 @@ class Page_Hinkley:
         f_high = f_x * pow(math.e, f_high_ln / (2 * (pow(sigma, 2))))
         return (f_low, f_high)
 
-    def update(self, x_std: float, timestamp):
+    # The tests exec this class without the module's imports, so only builtins here.
+    def update(self, x_std: float, timestamp: object) -> bool | None:
         self.t += 1
         (f0, f1) = self.get_f(x_std)
         big_x = math.log(f1) - math.log(f0)
@@ -59,27 +64,41 @@ class Page_Hinkley:
         return None
 
 
-def run_page_hinkley(df: pd.DataFrame, alarm_threshold: float = 250.0):
-    df = df.sort_values("time").reset_index(drop=True)
-    prices = df["price"].astype(float)
+def run_page_hinkley(
+    df: pd.DataFrame, alarm_threshold: float = 250.0, use_jit: bool | None = None
+) -> tuple[pd.DataFrame, pd.DataFrame]:
+    import pandas as pd
 
-    returns = np.log(prices / prices.shift(1))
-    returns = returns.dropna().reset_index(drop=True)
+    from src.ivtool.detectors import kernels
+    from src.ivtool.detectors.inputs import detector_inputs
 
-    std_series = returns.rolling(window=30, min_periods=30).std().dropna()
-    timestamps = df["time"].iloc[std_series.index]
+    inputs = detector_inputs(df)
+    returns = inputs["log_return"]
 
-    detector = Page_Hinkley(alarm_threshold=alarm_threshold)
-    for x_std, ts in zip(std_series, timestamps):
-        detector.update(float(x_std), ts)
+    std_series = returns.rolling(window=30, min_periods=30).std().dropna()
+    timestamps = inputs["prev_time"].iloc[std_series.index]
+
+    if use_jit is None:
+        use_jit = kernels.jit_available()
+    if use_jit:
+        values = np.ascontiguousarray(std_series, dtype=np.float64)
+        high_idx, low_idx = kernels.get_kernel("page_hinkley")(values, float(alarm_threshold))
+        high_list = timestamps.iloc[high_idx].tolist()
+        low_list = timestamps.iloc[low_idx].tolist()
+    else:
+        detector = Page_Hinkley(alarm_threshold=alarm_threshold)
+        for x_std, ts in zip(std_series, timestamps):
+            detector.update(float(x_std), ts)
+        high_list = detector.high_list
+        low_list = detector.low_list
 
     flagged_high = pd.DataFrame({
-        "timestamp": detector.high_list,
+        "timestamp": high_list,
         "alarm": "high",
     }).reset_index(drop=True)
 
     flagged_low = pd.DataFrame({
-        "timestamp": detector.low_list,
+        "timestamp": low_list,
         "alarm": "low",
     }).reset_index(drop=True)
     print("Page-Hinkley run complete. Number of high volatility regimes detected:", len(flagged_high))
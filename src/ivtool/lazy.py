@@ -0,0 +1,43 @@
+"""
+Deferred imports for heavy optional dependencies.
+
+Short-lived workers only need the detector cores (NumPy), so modules that also
+serve the batch pipeline bind pandas, database drivers and plotting through
+``lazy_module`` and pay for them on first attribute access instead of at import.
+Type checkers see the real module through a ``TYPE_CHECKING`` import:
+
+    if TYPE_CHECKING:
+        import pandas as pd
+    else:
+        pd = lazy_module("pandas")
+"""
+from __future__ import annotations
+
+import importlib
+import types
+from typing import Any
+
+
+class LazyModule(types.ModuleType):
+    """Module proxy that imports the real module the first time it is used."""
+
+    def __init__(self, name: str) -> None:
+        super().__init__(name)
+        self.__dict__["_lazy_module"] = None
+
+    def _load(self) -> types.ModuleType:
+        module = self.__dict__["_lazy_module"]
+        if module is None:
+            module = importlib.import_module(self.__name__)
+            self.__dict__["_lazy_module"] = module
+        return module
+
+    def __getattr__(self, attr: str) -> Any:
+        return getattr(self._load(), attr)
+
+    def __dir__(self) -> list[str]:
+        return dir(self._load())
+
+
+def lazy_module(name: str) -> Any:
+    return LazyModule(name)
@@ -0,0 +1,422 @@
+"""
+Asynchronous alarm delivery, decoupled from detection.
+
+Detectors publish ``Alarm`` records to an ``AlarmBus`` without waiting:
+``publish`` from code running on the bus's event loop, ``publish_threadsafe``
+from a detection thread. The bus keeps
+
+- a bounded queue: when it is full the oldest queued alarm is dropped (or the
+  new one, with ``overflow="drop_new"``), so a slow sink never stalls detection;
+- coalescing per ``(symbol, detector)``: the first alarm of a key opens a
+  ``coalesce_ns`` window (event time) and is queued at once; repeats inside
+  the window are folded into it while it is still queued (``repeats``,
+  ``last_timestamp``) and otherwise only counted;
+- one dispatcher task that takes up to ``batch_size`` alarms, or whatever
+  arrived within ``flush_interval_s``, and hands the batch to every sink
+  concurrently.
+
+Sinks are ``FileAlarmSink`` (JSON lines), ``WebhookAlarmSink`` (one JSON POST
+per batch) and ``DatabaseAlarmSink`` (a ``storage.ConnectionPool`` insert);
+blocking I/O runs in the default executor. ``AlarmBus.metrics()`` reports
+queue depth, drops, coalesced repeats, deliveries and sink errors.
+
+Usage:
+    python -m src.ivtool.pipeline.alarm_bus --sessions 5 --out alarms.jsonl
+"""
+from __future__ import annotations
+
+import argparse
+import asyncio
+import json
+import time
+import urllib.request
+from abc import ABC, abstractmethod
+from collections.abc import Awaitable, Callable, Sequence
+from dataclasses import asdict, dataclass, field
+from typing import TYPE_CHECKING, Any, Self
+
+from src.ivtool.lazy import lazy_module
+from src.ivtool.pipeline.consensus import MINUTE_NS
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from src.ivtool.pipeline.resample import ScaleAlarm
+    from src.ivtool.storage import ConnectionPool
+else:
+    pd = lazy_module("pandas")
+
+OVERFLOW = ("drop_oldest", "drop_new")
+DEFAULT_MAXSIZE = 1024
+DEFAULT_COALESCE_NS = 5 * MINUTE_NS
+
+
+@dataclass
+class Alarm:
+    symbol: str
+    detector: str
+    timestamp: int
+    kind: str = "alarm"
+    repeats: int = 0
+    last_timestamp: int | None = None
+
+    def __post_init__(self) -> None:
+        if self.last_timestamp is None:
+            self.last_timestamp = self.timestamp
+
+    @property
+    def key(self) -> tuple[str, str]:
+        return self.symbol, self.detector
+
+    @classmethod
+    def from_scale_alarm(cls, symbol: str, alarm: ScaleAlarm) -> Alarm:
+        return cls(symbol, f"{alarm.detector}_{alarm.minutes}m", alarm.timestamp, alarm.kind)
+
+    def to_dict(self) -> dict[str, Any]:
+        record = asdict(self)
+        record["time"] = pd.Timestamp(self.timestamp, tz="UTC").isoformat()
+        return record
+
+
+@dataclass
+class BusMetrics:
+    published: int = 0
+    enqueued: int = 0
+    coalesced: int = 0
+    dropped: int = 0
+    delivered: int = 0
+    batches: int = 0
+    queue_depth: int = 0
+    max_queue_depth: int = 0
+    sink_errors: dict[str, int] = field(default_factory=dict)
+
+    def to_dict(self) -> dict[str, Any]:
+        return asdict(self)
+
+
+class AlarmSink(ABC):
+    """Receives batches of alarms from the bus."""
+
+    name = "sink"
+
+    @abstractmethod
+    async def deliver(self, batch: list[Alarm]) -> None:
+        """Hands one batch to the destination; exceptions are counted in ``BusMetrics.sink_errors``."""
+
+    async def close(self) -> None:
+        pass
+
+
+class FileAlarmSink(AlarmSink):
+    """Appends each alarm as one JSON line to ``path``."""
+
+    name = "file"
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+
+    def _write(self, lines: str) -> None:
+        with open(self.path, "a") as handle:
+            handle.write(lines)
+
+    async def deliver(self, batch: list[Alarm]) -> None:
+        lines = "".join(json.dumps(alarm.to_dict()) + "\n" for alarm in batch)
+        await asyncio.get_running_loop().run_in_executor(None, self._write, lines)
+
+
+class WebhookAlarmSink(AlarmSink):
+    """
+    POSTs each batch as ``{"alarms": [...]}`` JSON to ``url``. ``post`` replaces
+    the HTTP call (``async post(url, payload)``), e.g. for a stand-in endpoint.
+    """
+
+    name = "webhook"
+
+    def __init__(
+        self,
+        url: str,
+        timeout: float = 5.0,
+        post: Callable[[str, dict[str, Any]], Awaitable[None]] | None = None,
+    ) -> None:
+        self.url = url
+        self.timeout = timeout
+        self._post = post
+
+    def _send(self, body: bytes) -> None:
+        request = urllib.request.Request(self.url, data=body, headers={"Content-Type": "application/json"}, method="POST")
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            response.read()
+
+    async def deliver(self, batch: list[Alarm]) -> None:
+        payload = {"alarms": [alarm.to_dict() for alarm in batch]}
+        if self._post is not None:
+            await self._post(self.url, payload)
+            return
+        await asyncio.get_running_loop().run_in_executor(None, self._send, json.dumps(payload).encode())
+
+
+class DatabaseAlarmSink(AlarmSink):
+    """
+    Inserts batches into ``table`` through a ``storage.ConnectionPool`` (one
+    transaction per batch). Times are ``TIMESTAMPTZ`` on Postgres, as in the
+    price table, and ISO text on SQLite.
+    """
+
+    name = "database"
+
+    def __init__(self, pool: ConnectionPool, table: str = "ivm_alarms", dialect: str = "postgres") -> None:
+        self.pool = pool
+        self.table = table
+        self.dialect = dialect
+        self._mark = "%s" if dialect == "postgres" else "?"
+        self._ready = False
+
+    def _ensure_table(self) -> None:
+        # Its own transaction, so a failed insert cannot roll the table back after it was marked ready.
+        time_type = "TIMESTAMPTZ" if self.dialect == "postgres" else "TEXT"
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{self.table}" ("time" {time_type} NOT NULL, "symbol" TEXT NOT NULL, '
+                    f'"detector" TEXT NOT NULL, "kind" TEXT NOT NULL, "repeats" INTEGER NOT NULL, '
+                    f'"last_time" {time_type} NOT NULL)'
+                )
+            finally:
+                cur.close()
+        self._ready = True
+
+    def _insert(self, rows: list[tuple]) -> None:
+        if not self._ready:
+            self._ensure_table()
+        marks = ", ".join([self._mark] * 6)
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.executemany(
+                    f'INSERT INTO "{self.table}" ("time", "symbol", "detector", "kind", "repeats", "last_time") VALUES ({marks})',
+                    rows,
+                )
+            finally:
+                cur.close()
+
+    def _time(self, timestamp_ns: int) -> Any:
+        timestamp = pd.Timestamp(timestamp_ns, tz="UTC")
+        return timestamp.to_pydatetime() if self.dialect == "postgres" else timestamp.isoformat()
+
+    async def deliver(self, batch: list[Alarm]) -> None:
+        rows = [
+            (
+                self._time(alarm.timestamp),
+                alarm.symbol,
+                alarm.detector,
+                alarm.kind,
+                alarm.repeats,
+                self._time(alarm.last_timestamp or alarm.timestamp),
+            )
+            for alarm in batch
+        ]
+        await asyncio.get_running_loop().run_in_executor(None, self._insert, rows)
+
+
+class AlarmBus:
+    """
+    Bounded, coalescing alarm queue with a batching dispatcher. Use as
+    ``async with AlarmBus(sinks) as bus:``; leaving the block delivers what is
+    still queued.
+    """
+
+    def __init__(
+        self,
+        sinks: Sequence[AlarmSink],
+        maxsize: int = DEFAULT_MAXSIZE,
+        coalesce_ns: int = DEFAULT_COALESCE_NS,
+        batch_size: int = 100,
+        flush_interval_s: float = 0.5,
+        overflow: str = "drop_oldest",
+    ) -> None:
+        if maxsize < 1 or batch_size < 1:
+            raise ValueError("maxsize and batch_size must be >= 1")
+        if overflow not in OVERFLOW:
+            raise ValueError(f"overflow must be one of {OVERFLOW}, got {overflow!r}")
+        self.sinks = list(sinks)
+        self.maxsize = maxsize
+        self.coalesce_ns = int(coalesce_ns)
+        self.batch_size = batch_size
+        self.flush_interval_s = flush_interval_s
+        self.overflow = overflow
+        self._metrics = BusMetrics()
+        self._queue: asyncio.Queue | None = None
+        self._loop: asyncio.AbstractEventLoop | None = None
+        self._dispatcher: asyncio.Task | None = None
+        # Window start and the alarm still queued for it, per (symbol, detector).
+        self._windows: dict[tuple[str, str], tuple[int, Alarm | None]] = {}
+
+    async def __aenter__(self) -> Self:
+        await self.start()
+        return self
+
+    async def __aexit__(self, *exc: object) -> None:
+        await self.close()
+
+    async def start(self) -> None:
+        self._loop = asyncio.get_running_loop()
+        self._queue = asyncio.Queue(self.maxsize)
+        self._dispatcher = asyncio.create_task(self._dispatch())
+
+    def publish(self, alarm: Alarm) -> bool:
+        """Queues ``alarm`` without blocking; False if it was coalesced or dropped. Call on the bus's loop."""
+        self._metrics.published += 1
+        if self._coalesced(alarm):
+            return False
+        queue = self._started_queue()
+        if queue.full():
+            self._metrics.dropped += 1
+            if self.overflow == "drop_new":
+                return False
+            oldest = queue.get_nowait()
+            queue.task_done()
+            self._dequeued(oldest)
+        queue.put_nowait(alarm)
+        self._enqueued(alarm)
+        return True
+
+    def publish_threadsafe(self, alarm: Alarm) -> None:
+        """``publish`` from another thread, e.g. a detection loop running in an executor."""
+        if self._loop is None:
+            raise RuntimeError("AlarmBus is not started")
+        self._loop.call_soon_threadsafe(self.publish, alarm)
+
+    async def put(self, alarm: Alarm) -> bool:
+        """``publish`` that waits for queue space instead of dropping; False if it was coalesced."""
+        self._metrics.published += 1
+        if self._coalesced(alarm):
+            return False
+        await self._started_queue().put(alarm)
+        # Nothing ran on the loop since the alarm was queued, so the dispatcher has not taken it yet.
+        self._enqueued(alarm)
+        return True
+
+    def _coalesced(self, alarm: Alarm) -> bool:
+        window = self._windows.get(alarm.key)
+        if window is None or alarm.timestamp >= window[0] + self.coalesce_ns:
+            return False
+        self._metrics.coalesced += 1
+        queued = window[1]
+        if queued is not None:
+            queued.repeats += 1
+            queued.last_timestamp = max(queued.last_timestamp or queued.timestamp, alarm.timestamp)
+        return True
+
+    def _enqueued(self, alarm: Alarm) -> None:
+        self._windows[alarm.key] = (alarm.timestamp, alarm)
+        metrics = self._metrics
+        metrics.enqueued += 1
+        metrics.max_queue_depth = max(metrics.max_queue_depth, self._started_queue().qsize())
+
+    def _started_queue(self) -> asyncio.Queue:
+        if self._queue is None:
+            raise RuntimeError("AlarmBus is not started; use 'async with AlarmBus(...)' or await start()")
+        return self._queue
+
+    def _dequeued(self, alarm: Alarm) -> None:
+        # Later repeats in the window are only counted once the alarm has left the queue.
+        window = self._windows.get(alarm.key)
+        if window is not None and window[1] is alarm:
+            self._windows[alarm.key] = (window[0], None)
+
+    async def _next_batch(self) -> list[Alarm]:
+        queue = self._started_queue()
+        batch = [await queue.get()]
+        deadline = time.monotonic() + self.flush_interval_s
+        while len(batch) < self.batch_size:
+            if queue.empty():
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(queue.get(), remaining))
+                except TimeoutError:
+                    break
+            else:
+                batch.append(queue.get_nowait())
+        for alarm in batch:
+            self._dequeued(alarm)
+        return batch
+
+    async def _dispatch(self) -> None:
+        queue = self._started_queue()
+        while True:
+            batch = await self._next_batch()
+            results = await asyncio.gather(*(sink.deliver(batch) for sink in self.sinks), return_exceptions=True)
+            for sink, result in zip(self.sinks, results):
+                if isinstance(result, Exception):
+                    self._metrics.sink_errors[sink.name] = self._metrics.sink_errors.get(sink.name, 0) + 1
+            self._metrics.delivered += len(batch)
+            self._metrics.batches += 1
+            for _ in batch:
+                queue.task_done()
+
+    def metrics(self) -> BusMetrics:
+        self._metrics.queue_depth = self._queue.qsize() if self._queue is not None else 0
+        return self._metrics
+
+    async def drain(self) -> None:
+        """Waits until every queued alarm has been handed to the sinks."""
+        await self._started_queue().join()
+
+    async def close(self) -> None:
+        await self.drain()
+        if self._dispatcher is not None:
+            self._dispatcher.cancel()
+            try:
+                await self._dispatcher
+            except asyncio.CancelledError:
+                pass
+        for sink in self.sinks:
+            await sink.close()
+
+
+async def _replay_to_bus(df: pd.DataFrame, bus: AlarmBus, symbol: str, scales: Sequence[int]) -> None:
+    from src.ivtool.pipeline.replay import replay
+    from src.ivtool.pipeline.resample import ScaleAlarm
+
+    times = df["time"].to_numpy(dtype="datetime64[ns]").astype("int64")
+    chunks = [(times, df["price"].to_numpy(dtype=float))]
+
+    def detect() -> None:
+        for event in replay(chunks, scales=scales):
+            if isinstance(event, ScaleAlarm):
+                bus.publish_threadsafe(Alarm.from_scale_alarm(symbol, event))
+
+    # Detection runs in a worker thread; delivery stays on the event loop.
+    await asyncio.get_running_loop().run_in_executor(None, detect)
+
+
+def main(argv: Sequence[str] | None = None) -> BusMetrics:
+    parser = argparse.ArgumentParser(description="Replay synthetic prices and deliver alarms through the alarm bus")
+    parser.add_argument("--sessions", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1, 5])
+    parser.add_argument("--out", default="alarms.jsonl")
+    parser.add_argument("--coalesce-minutes", type=float, default=DEFAULT_COALESCE_NS / MINUTE_NS)
+    parser.add_argument("--maxsize", type=int, default=DEFAULT_MAXSIZE)
+    args = parser.parse_args(argv)
+
+    from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+    df = regime_switching_prices(args.sessions, seed=args.seed)
+
+    async def run() -> BusMetrics:
+        bus = AlarmBus([FileAlarmSink(args.out)], maxsize=args.maxsize, coalesce_ns=int(args.coalesce_minutes * MINUTE_NS))
+        async with bus:
+            await _replay_to_bus(df, bus, "SPY", args.scales)
+        return bus.metrics()
+
+    metrics = asyncio.run(run())
+    print(json.dumps(metrics.to_dict(), indent=2))
+    return metrics
+
+
+if __name__ == "__main__":
+    main()
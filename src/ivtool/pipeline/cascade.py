@@ -0,0 +1,236 @@
+"""
+Cascaded detection: a cheap gate decides where BOCPE runs.
+
+CUSUM or Page-Hinkley runs over every tick. Each gate alarm opens a window of
+``pre`` ticks before and ``post`` ticks after it, overlapping windows are
+merged, and BOCPE only processes the ticks inside a window. Two ways of
+starting BOCPE at a window:
+
+- ``"reset"``: a fresh prior per window, optionally warmed up on the
+  ``warmup`` ticks before the window (alarms in the lead-in are dropped).
+- ``"checkpoint"``: each window restores the ``VolatilityBOCPE.checkpoint()``
+  taken at the end of the previous one, so the run-length belief survives
+  the skipped stretch. The last checkpoint is returned, and passing it as
+  ``resume`` carries the posterior into the next batch of returns.
+
+``cascade_report`` compares a set of gates against a full BOCPE run: recall of
+the full run's high-regime alarms within ``tolerance`` ticks, the fraction of
+ticks BOCPE evaluated and the wall time of both. The defaults are set for
+1-minute returns like ``synthetic.regime_switching_prices``: on 20 sessions
+the CUSUM gate evaluates about 35% of the ticks and recovers all of the full
+run's alarms within 30 ticks.
+
+The cascade is not wired into ``main_factory.detect_events``: calibration
+there shares one full posterior trajectory across the BOCPE candidates,
+which a gated run does not produce.
+
+Usage:
+    python -m src.ivtool.pipeline.cascade --sessions 20 --out cascade_report.csv
+"""
+from __future__ import annotations
+
+import argparse
+import time
+from collections.abc import Mapping, Sequence
+from dataclasses import dataclass
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src.ivtool.detectors.bocpe import BOCPECheckpoint, VolatilityBOCPE
+from src.ivtool.pipeline.consensus import merge_intervals
+from src.ivtool.pipeline.evaluation import DetectorSpec, detector_alarms
+from src.ivtool.pipeline.main_factory import DEFAULT_BOCPE_PARAMS
+
+MODES = ("reset", "checkpoint")
+DEFAULT_GATES: tuple[DetectorSpec, ...] = (
+    DetectorSpec("cusum", {"k": 0.00005, "h": 0.006}),
+    DetectorSpec("page_hinkley", {"alarm_threshold": 100.0}),
+)
+# The prior's expected variance sits at the calm level of 1-minute returns
+# (about 0.0003^2) and the high regime starts at 0.0007^2. With the default
+# prior (0.01) a fresh run never wins on returns this small and the only
+# change points come from hitting ``max_run_length``.
+BOCPE_PRIOR = {"prior_alpha": 2.0, "prior_beta": 1e-7, "vol_threshold": 5e-7}
+BOCPE_PARAMS = {**DEFAULT_BOCPE_PARAMS, **BOCPE_PRIOR}
+
+
+@dataclass
+class CascadeResult:
+    alarms: np.ndarray
+    high_regime: np.ndarray
+    evaluated: np.ndarray
+    windows: np.ndarray
+    gate_alarms: np.ndarray
+    checkpoint: BOCPECheckpoint | None = None
+
+    @property
+    def ticks_evaluated(self) -> int:
+        return int(self.evaluated.sum())
+
+    @property
+    def high_alarms(self) -> np.ndarray:
+        """Indices of BOCPE change points that land in the high-volatility regime."""
+        return np.flatnonzero(self.alarms & self.high_regime)
+
+
+def gate_windows(gate_alarms: np.ndarray, n: int, pre: int, post: int) -> np.ndarray:
+    """Merged half-open ``[start, stop)`` windows around the gate alarms, as an (m, 2) array."""
+    if pre < 0 or post < 0:
+        raise ValueError("pre and post must be non-negative")
+    gate_alarms = np.sort(np.asarray(gate_alarms, dtype=np.int64))
+    starts = np.clip(gate_alarms - pre, 0, n)
+    stops = np.clip(gate_alarms + post + 1, 0, n)
+    # Half-open bounds make touching windows merge as well as overlapping ones.
+    starts, stops = merge_intervals(starts, stops)
+    return np.column_stack([starts, stops]).reshape(-1, 2)
+
+
+def run_cascade(
+    returns: np.ndarray,
+    bocpe_params: Mapping[str, Any] | None = None,
+    gate: DetectorSpec = DEFAULT_GATES[0],
+    pre: int = 120,
+    post: int = 120,
+    mode: str = "checkpoint",
+    warmup: int = 0,
+    use_jit: bool | None = None,
+    resume: BOCPECheckpoint | None = None,
+) -> CascadeResult:
+    """
+    Runs ``gate`` over all of ``returns`` and BOCPE only inside the gated
+    windows. In ``"checkpoint"`` mode the first window starts from ``resume``
+    (the ``checkpoint`` of an earlier result) when it is given.
+    """
+    if mode not in MODES:
+        raise ValueError(f"mode must be one of {MODES}, got {mode!r}")
+    if warmup < 0:
+        raise ValueError("warmup must be non-negative")
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    n = returns.size
+    bocpe_params = dict(BOCPE_PARAMS if bocpe_params is None else bocpe_params)
+
+    gate_alarms = detector_alarms(gate, returns)
+    windows = gate_windows(gate_alarms, n, pre, post)
+    alarms = np.zeros(n, dtype=bool)
+    high = np.zeros(n, dtype=bool)
+    evaluated = np.zeros(n, dtype=bool)
+
+    saved = resume if mode == "checkpoint" else None
+    previous_stop = 0
+    for start, stop in windows:
+        detector = VolatilityBOCPE(**bocpe_params)
+        if saved is not None:
+            detector.restore(saved)
+        lead_in = max(previous_stop, start - warmup)
+        window_alarms, window_high = detector.run_array(returns[lead_in:stop], use_jit=use_jit)
+        skip = start - lead_in
+        alarms[start:stop] = window_alarms[skip:]
+        high[start:stop] = window_high[skip:]
+        evaluated[lead_in:stop] = True
+        previous_stop = stop
+        if mode == "checkpoint":
+            saved = detector.checkpoint()
+
+    return CascadeResult(
+        alarms=alarms,
+        high_regime=high,
+        evaluated=evaluated,
+        windows=windows,
+        gate_alarms=gate_alarms,
+        checkpoint=saved,
+    )
+
+
+def alarm_recall(reference: np.ndarray, candidate: np.ndarray, tolerance: int) -> float:
+    """Fraction of ``reference`` alarm indices with a ``candidate`` alarm within ``tolerance`` ticks."""
+    reference = np.asarray(reference, dtype=np.int64)
+    candidate = np.sort(np.asarray(candidate, dtype=np.int64))
+    if reference.size == 0:
+        return 1.0
+    if candidate.size == 0:
+        return 0.0
+    right = np.searchsorted(candidate, reference, side="left").clip(0, candidate.size - 1)
+    left = (right - 1).clip(0, candidate.size - 1)
+    nearest = np.minimum(np.abs(candidate[right] - reference), np.abs(candidate[left] - reference))
+    return float(np.mean(nearest <= tolerance))
+
+
+def cascade_report(
+    returns: np.ndarray,
+    bocpe_params: Mapping[str, Any] | None = None,
+    gates: Sequence[DetectorSpec] = DEFAULT_GATES,
+    pre: int = 120,
+    post: int = 120,
+    modes: Sequence[str] = MODES,
+    warmup: int = 0,
+    tolerance: int = 30,
+    use_jit: bool | None = None,
+) -> pd.DataFrame:
+    """Recall/compute trade-off of each gate and start mode against one full BOCPE run."""
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    bocpe_params = dict(BOCPE_PARAMS if bocpe_params is None else bocpe_params)
+
+    # Compile the kernels outside the timed runs.
+    VolatilityBOCPE(**bocpe_params).run_array(returns[:2], use_jit=use_jit)
+    for gate in gates:
+        detector_alarms(gate, returns[:64])
+
+    start = time.perf_counter()
+    full_alarms, full_high = VolatilityBOCPE(**bocpe_params).run_array(returns, use_jit=use_jit)
+    full_seconds = time.perf_counter() - start
+    reference = np.flatnonzero(full_alarms & full_high)
+
+    rows = []
+    for gate in gates:
+        for mode in modes:
+            start = time.perf_counter()
+            result = run_cascade(returns, bocpe_params, gate, pre, post, mode, warmup, use_jit)
+            seconds = time.perf_counter() - start
+            rows.append({
+                "gate": gate.label,
+                "mode": mode,
+                "gate_alarms": int(result.gate_alarms.size),
+                "windows": len(result.windows),
+                "full_alarms": int(reference.size),
+                "cascade_alarms": int(result.high_alarms.size),
+                "recall": alarm_recall(reference, result.high_alarms, tolerance),
+                "ticks_fraction": result.ticks_evaluated / returns.size if returns.size else 0.0,
+                "full_seconds": full_seconds,
+                "cascade_seconds": seconds,
+                "speedup": full_seconds / seconds if seconds else float("inf"),
+            })
+    return pd.DataFrame(rows)
+
+
+def main(argv: Sequence[str] | None = None) -> pd.DataFrame:
+    from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+    parser = argparse.ArgumentParser(description="Recall/compute trade-off of gated BOCPE")
+    parser.add_argument("--sessions", type=int, default=20)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--pre", type=int, default=120)
+    parser.add_argument("--post", type=int, default=120)
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--tolerance", type=int, default=30)
+    parser.add_argument("--out", default="cascade_report.csv")
+    args = parser.parse_args(argv)
+
+    prices = regime_switching_prices(args.sessions, seed=args.seed)
+    returns = np.log(prices["price"]).diff().dropna().to_numpy()
+    report = cascade_report(
+        returns,
+        BOCPE_PARAMS,
+        pre=args.pre,
+        post=args.post,
+        warmup=args.warmup,
+        tolerance=args.tolerance,
+    )
+    report.to_csv(args.out, index=False)
+    print(report.to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    main()
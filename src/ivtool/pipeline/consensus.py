@@ -0,0 +1,298 @@
+"""
+k-of-n consensus over detector alarms.
+
+Each detector contributes sorted int64 (nanosecond) timestamps, either point
+alarms (CUSUM) or closed ``[start, end]`` intervals (Page-Hinkley / BOCPE
+high-volatility regimes). Points are widened by a tolerance window, each
+detector's intervals are merged into disjoint runs, and a sweep line over the
+interval endpoints finds where at least ``k`` detectors agree. Inputs are
+already sorted per detector, so the merge is a sort of concatenated sorted
+runs, which NumPy's stable sort handles in linear time.
+
+``ConsensusEngine`` does the same incrementally for alarms that stream in.
+``day_flag_matrix`` summarises agreement per trading day instead.
+"""
+from __future__ import annotations
+
+from collections.abc import Iterable, Mapping
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+MINUTE_NS = 60 * 10**9
+
+
+def to_ns(timestamps: Iterable) -> np.ndarray:
+    """UTC nanosecond int64 array from any timestamp-like sequence."""
+    series = timestamps if isinstance(timestamps, pd.Series) else pd.Series(list(timestamps), dtype=object)
+    return pd.to_datetime(series, utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def points_to_intervals(points: np.ndarray, tolerance_ns: int = 0) -> tuple[np.ndarray, np.ndarray]:
+    points = np.asarray(points, dtype=np.int64)
+    return points - tolerance_ns, points + tolerance_ns
+
+
+def runs_to_intervals(
+    timestamps: np.ndarray, step_ns: int = MINUTE_NS, tolerance_ns: int = 0
+) -> tuple[np.ndarray, np.ndarray]:
+    """Collapses sorted bar timestamps into intervals of consecutive bars ``step_ns`` apart."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    if timestamps.size == 0:
+        return timestamps.copy(), timestamps.copy()
+    breaks = np.flatnonzero(np.diff(timestamps) > step_ns)
+    starts = timestamps[np.concatenate([[0], breaks + 1])]
+    ends = timestamps[np.concatenate([breaks, [timestamps.size - 1]])]
+    return starts - tolerance_ns, ends + tolerance_ns
+
+
+def merge_intervals(starts: np.ndarray, ends: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Union of closed intervals sorted by start, as disjoint intervals."""
+    starts = np.asarray(starts, dtype=np.int64)
+    ends = np.asarray(ends, dtype=np.int64)
+    if starts.size == 0:
+        return starts.copy(), ends.copy()
+    running_end = np.maximum.accumulate(ends)
+    new_run = np.concatenate([[True], starts[1:] > running_end[:-1]])
+    run_ids = np.cumsum(new_run) - 1
+    merged_starts = starts[new_run]
+    merged_ends = np.full(merged_starts.size, np.iinfo(np.int64).min)
+    np.maximum.at(merged_ends, run_ids, ends)
+    return merged_starts, merged_ends
+
+
+def k_of_n(intervals: Mapping[str, tuple[np.ndarray, np.ndarray]], k: int) -> pd.DataFrame:
+    """
+    Closed intervals where at least ``k`` of the detectors are active.
+    ``intervals`` maps detector name to (starts, ends) sorted by start.
+    Returns ``start``, ``end`` (int64 ns) and ``detectors``, the largest number
+    of detectors active at once inside the interval.
+    """
+    if k < 1:
+        raise ValueError("k must be >= 1")
+    starts_list, ends_list = [], []
+    for starts, ends in intervals.values():
+        merged_starts, merged_ends = merge_intervals(starts, ends)
+        starts_list.append(merged_starts)
+        ends_list.append(merged_ends)
+    if not starts_list or sum(s.size for s in starts_list) == 0:
+        return pd.DataFrame({"start": np.empty(0, np.int64), "end": np.empty(0, np.int64), "detectors": np.empty(0, np.int64)})
+
+    all_starts = np.concatenate(starts_list)
+    all_ends = np.concatenate(ends_list)
+    times = np.concatenate([all_starts, all_ends])
+    is_end = np.concatenate([np.zeros(all_starts.size, np.int8), np.ones(all_ends.size, np.int8)])
+    # Starts sort before ends at the same instant so touching closed intervals overlap.
+    order = np.lexsort((is_end, times))
+    times = times[order]
+    active = np.cumsum(np.where(is_end[order] == 1, -1, 1))
+
+    above = active >= k
+    previous = np.concatenate([[False], above[:-1]])
+    enter = np.flatnonzero(above & ~previous)
+    leave = np.flatnonzero(~above & previous)
+    # Between an exit and the next entry the count is below k, so the maximum
+    # from one entry to the next is the maximum inside that consensus interval.
+    detectors = np.maximum.reduceat(active, enter) if enter.size else np.empty(0, np.int64)
+    return pd.DataFrame({"start": times[enter], "end": times[leave], "detectors": detectors})
+
+
+def expand_to_minutes(consensus: pd.DataFrame, step_ns: int = MINUTE_NS) -> np.ndarray:
+    """Bar timestamps on the ``step_ns`` grid covered by the consensus intervals."""
+    if consensus.empty:
+        return np.empty(0, dtype=np.int64)
+    first = -(-consensus["start"].to_numpy(np.int64) // step_ns) * step_ns
+    last = consensus["end"].to_numpy(np.int64) // step_ns * step_ns
+    counts = np.maximum((last - first) // step_ns + 1, 0)
+    offsets = np.arange(counts.sum()) - np.repeat(np.cumsum(counts) - counts, counts)
+    return np.unique(np.repeat(first, counts) + offsets * step_ns)
+
+
+class ConsensusEngine:
+    """
+    Incremental k-of-n consensus. Each detector's alarms must arrive in time
+    order; ``add`` accepts a point (``end=None``) or an interval. Consensus
+    intervals are returned by ``poll`` once no detector can still change
+    them, i.e. once they end before every detector's latest alarm or
+    ``advance`` watermark.
+    """
+
+    def __init__(self, detectors: Iterable[str], k: int = 2, tolerance_ns: int = 0) -> None:
+        self.detectors = list(detectors)
+        if not 1 <= k <= len(self.detectors):
+            raise ValueError("k must be between 1 and the number of detectors")
+        self.k = k
+        self.tolerance_ns = int(tolerance_ns)
+        self._starts: dict[str, list[int]] = {name: [] for name in self.detectors}
+        self._ends: dict[str, list[int]] = {name: [] for name in self.detectors}
+        self._watermark: dict[str, int | None] = {name: None for name in self.detectors}
+        self._emitted_until = np.iinfo(np.int64).min
+
+    def add(self, detector: str, start: int, end: int | None = None) -> None:
+        end = start if end is None else end
+        start, end = int(start) - self.tolerance_ns, int(end) + self.tolerance_ns
+        watermark = self._watermark[detector]
+        if watermark is not None and start < watermark:
+            raise ValueError(f"alarms for {detector!r} must arrive in time order")
+        self._watermark[detector] = start
+        starts, ends = self._starts[detector], self._ends[detector]
+        if ends and start <= ends[-1]:
+            ends[-1] = max(ends[-1], end)
+        else:
+            starts.append(start)
+            ends.append(end)
+
+    def advance(self, detector: str, timestamp: int) -> None:
+        """Marks that ``detector`` has processed the stream up to ``timestamp`` without alarming."""
+        mark = int(timestamp) - self.tolerance_ns
+        watermark = self._watermark[detector]
+        if watermark is None or mark > watermark:
+            self._watermark[detector] = mark
+
+    def _consensus(self) -> pd.DataFrame:
+        return k_of_n(
+            {name: (np.array(self._starts[name], np.int64), np.array(self._ends[name], np.int64)) for name in self.detectors},
+            self.k,
+        )
+
+    def _horizon(self) -> int | None:
+        if any(mark is None for mark in self._watermark.values()):
+            return None
+        return min(mark for mark in self._watermark.values())  # type: ignore[type-var]
+
+    def poll(self) -> pd.DataFrame:
+        """Returns consensus intervals that are now final, and drops state they no longer need."""
+        horizon = self._horizon()
+        if horizon is None:
+            return self._consensus().iloc[0:0]
+        return self._emit(horizon)
+
+    def close(self) -> pd.DataFrame:
+        """Flushes every remaining consensus interval (end of stream)."""
+        return self._emit(np.iinfo(np.int64).max)
+
+    def _emit(self, horizon: int) -> pd.DataFrame:
+        consensus = self._consensus()
+        final = consensus[(consensus["end"] < horizon) & (consensus["start"] > self._emitted_until)]
+        pending = consensus[consensus["end"] >= horizon]
+        cutoff = horizon if pending.empty else min(horizon, int(pending["start"].min()))
+        if not final.empty:
+            self._emitted_until = int(final["end"].max())
+        for name in self.detectors:
+            starts, ends = self._starts[name], self._ends[name]
+            keep = next((i for i, end in enumerate(ends) if end >= cutoff), len(ends))
+            del starts[:keep]
+            del ends[:keep]
+        return final.reset_index(drop=True)
+
+
+DAY_NS = 24 * 60 * MINUTE_NS
+
+
+@dataclass
+class DayFlagMatrix:
+    """
+    Detectors x trading days view of alarm timestamps.
+    ``flags[i, j]`` is whether ``detectors[i]`` flagged ``days[j]`` (UTC),
+    ``alarm_counts[i, j]`` the number of its alarms that day, and
+    ``first_alarm`` the earliest of them in int64 ns (``NO_ALARM`` where
+    there is none).
+    """
+
+    detectors: list[str]
+    days: np.ndarray
+    flags: np.ndarray
+    alarm_counts: np.ndarray
+    first_alarm: np.ndarray
+
+    NO_ALARM = np.iinfo(np.int64).max
+
+    @property
+    def models_flagging(self) -> np.ndarray:
+        return self.flags.sum(axis=0)
+
+    @property
+    def disagreement(self) -> np.ndarray:
+        """Days flagged by some but not all detectors."""
+        flagging = self.models_flagging
+        return (flagging > 0) & (flagging < len(self.detectors))
+
+    def pairwise_agreement(self) -> pd.DataFrame:
+        flags = self.flags.astype(np.int64)
+        both = flags @ flags.T
+        per_detector = flags.sum(axis=1)
+        either = per_detector[:, None] + per_detector[None, :] - both
+        n_days = max(len(self.days), 1)
+        rows = []
+        for i, j in zip(*np.triu_indices(len(self.detectors), k=1)):
+            rows.append({
+                "detector_a": self.detectors[i],
+                "detector_b": self.detectors[j],
+                "both_flag": int(both[i, j]),
+                "either_flag": int(either[i, j]),
+                "jaccard": both[i, j] / either[i, j] if either[i, j] else np.nan,
+                "agreement_rate": (n_days - (either[i, j] - both[i, j])) / n_days,
+            })
+        return pd.DataFrame(rows)
+
+    def to_frame(self) -> pd.DataFrame:
+        frame = pd.DataFrame({"date": pd.to_datetime(self.days, utc=True).strftime("%Y-%m-%d")})
+        flags = self.flags
+        for i, name in enumerate(self.detectors):
+            frame[f"{name}_flag"] = flags[i]
+        frame["models_flagging"] = self.models_flagging
+        for i, name in enumerate(self.detectors):
+            frame[f"{name}_alarms"] = self.alarm_counts[i]
+        for i, name in enumerate(self.detectors):
+            first = self.first_alarm[i]
+            frame[f"{name}_first_alarm"] = pd.to_datetime(
+                np.where(first == self.NO_ALARM, np.datetime64("NaT"), first.astype("datetime64[ns]")), utc=True
+            )
+        return frame
+
+
+def day_flag_matrix(
+    timestamps_by_detector: Mapping[str, Iterable],
+    alarms_by_detector: Mapping[str, Iterable] | None = None,
+) -> DayFlagMatrix:
+    """
+    Builds the detectors x days matrix in one pass. A detector flags the days
+    its ``timestamps_by_detector`` fall on; alarm counts and first-alarm times
+    come from ``alarms_by_detector`` when given (e.g. regime minutes flag a day
+    while the change points that opened them are counted), else from the same
+    timestamps.
+    """
+    detectors = list(timestamps_by_detector)
+    flagged = [to_ns(timestamps_by_detector[name]) for name in detectors]
+    alarms = flagged if alarms_by_detector is None else [to_ns(alarms_by_detector[name]) for name in detectors]
+    all_ns = np.concatenate(flagged + alarms) if detectors else np.empty(0, np.int64)
+    days = np.unique(all_ns // DAY_NS)
+    flag_counts, _ = _per_day(flagged, days)
+    counts, first = _per_day(alarms, days)
+    return DayFlagMatrix(
+        detectors=detectors,
+        days=(days * DAY_NS).astype("datetime64[ns]"),
+        flags=flag_counts > 0,
+        alarm_counts=counts,
+        first_alarm=first,
+    )
+
+
+def _per_day(stamps: list[np.ndarray], days: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Per detector and day: the number of timestamps and the earliest of them."""
+    all_ns = np.concatenate(stamps) if stamps else np.empty(0, np.int64)
+    detector_ids = np.repeat(np.arange(len(stamps)), [len(s) for s in stamps])
+    day_ids = np.searchsorted(days, all_ns // DAY_NS)
+    counts = np.zeros((len(stamps), len(days)), dtype=np.int64)
+    first = np.full((len(stamps), len(days)), DayFlagMatrix.NO_ALARM, dtype=np.int64)
+    np.add.at(counts, (detector_ids, day_ids), 1)
+    np.minimum.at(first, (detector_ids, day_ids), all_ns)
+    return counts, first
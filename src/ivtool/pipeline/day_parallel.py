@@ -0,0 +1,309 @@
+"""
+Day-parallel offline detection.
+
+The overnight gap makes each trading session close to an independent
+segment, so the offline run can split the series by session (New York
+calendar date), run every session's CUSUM / Page-Hinkley / BOCPE in worker
+processes and stitch the alarms back together in time order. Returns and the
+Page-Hinkley rolling volatility are computed once over the whole series, so
+every session sees exactly the inputs of the serial run; only detector state
+is split. Two ways of starting each session:
+
+- ``"reset"``: every session starts from a fresh detector.
+- ``"warmup"``: the detector is first fed the last ``warmup`` ticks of the
+  previous session, and alarms raised in that lead-in are dropped, so the
+  state at the open approximates the serial run's.
+
+The outputs have the shape of the serial entry points (``main_cusum_run``,
+``run_page_hinkley``, ``main_bocpe_run``); ``divergence_report`` compares the
+two alarm by alarm.
+
+Usage:
+    python -m src.ivtool.pipeline.day_parallel --sessions 60 --boundary warmup --warmup 60
+"""
+from __future__ import annotations
+
+import argparse
+import math
+import os
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+from src.ivtool.pipeline.evaluation import PAGE_HINKLEY_WINDOW, DetectorSpec
+
+SESSION_TZ = "America/New_York"
+BOUNDARIES = ("reset", "warmup")
+DAY_PARALLEL_ENV = "IVTOOL_DAY_PARALLEL"
+
+
+def session_codes(timestamps: Any) -> tuple[np.ndarray, pd.DatetimeIndex]:
+    """Session index of every (sorted) timestamp and the session dates, by New York calendar date."""
+    local = pd.DatetimeIndex(pd.to_datetime(timestamps, utc=True)).tz_convert(SESSION_TZ)
+    codes, sessions = pd.factorize(local.normalize())
+    return codes.astype(np.int64), pd.DatetimeIndex(sessions)
+
+
+def session_segments(codes: np.ndarray, n_sessions: int, boundary: str = "reset", warmup: int = 0) -> np.ndarray:
+    """(n_sessions, 3) array of ``lead_in, start, stop`` positions per session."""
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"boundary must be one of {BOUNDARIES}, got {boundary!r}")
+    if warmup < 0:
+        raise ValueError("warmup must be non-negative")
+    sessions = np.arange(n_sessions)
+    starts = np.searchsorted(codes, sessions, side="left")
+    stops = np.searchsorted(codes, sessions, side="right")
+    lead_ins = starts if boundary == "reset" else np.maximum(starts - warmup, 0)
+    return np.column_stack([lead_ins, starts, stops])
+
+
+def _segment_alarms(spec: DetectorSpec, values: np.ndarray, use_jit: bool) -> dict[str, np.ndarray]:
+    # Alarm positions within ``values`` for one detector run from a fresh state.
+    from src.ivtool.detectors import kernels
+
+    if spec.detector == "cusum":
+        from src.ivtool.detectors.cusum import run_cusum
+
+        params = {"mu": 0.0, **spec.params}
+        flags = run_cusum(pd.Series(values), params["k"], params["h"], params["mu"], use_jit=use_jit)
+        return {"alarm": np.flatnonzero(flags.to_numpy())}
+    if spec.detector == "page_hinkley":
+        threshold = float(spec.params.get("alarm_threshold", 250.0))
+        if use_jit:
+            high, low = kernels.get_kernel("page_hinkley")(values, threshold)
+            return {"high": np.asarray(high, dtype=np.int64), "low": np.asarray(low, dtype=np.int64)}
+        from src.ivtool.detectors.page_hinkley import Page_Hinkley
+
+        detector = Page_Hinkley(alarm_threshold=threshold)
+        for i, x_std in enumerate(values):
+            detector.update(float(x_std), i)
+        return {
+            "high": np.asarray(detector.high_indices, dtype=np.int64),
+            "low": np.asarray(detector.low_indices, dtype=np.int64),
+        }
+    if spec.detector == "bocpe":
+        from src.ivtool.detectors.bocpe import VolatilityBOCPE
+
+        alarms, high = VolatilityBOCPE(**spec.params).run_array(values, use_jit=use_jit)
+        positions = np.flatnonzero(alarms)
+        return {"alarm": positions, "high": high[positions]}
+    raise ValueError(f"unknown detector {spec.detector!r}")
+
+
+def _run_sessions(
+    specs: Sequence[DetectorSpec],
+    values: np.ndarray,
+    segments: np.ndarray,
+    base: int,
+    use_jit: bool | None,
+) -> list[dict[str, np.ndarray]]:
+    """
+    Runs every spec over each ``lead_in, start, stop`` segment of ``values``
+    (positions relative to ``values``) and returns global alarm positions,
+    offset by ``base``, with lead-in alarms dropped.
+    """
+    from src.ivtool.detectors import kernels
+
+    if use_jit is None:
+        use_jit = kernels.jit_available()
+    results = []
+    for spec in specs:
+        pieces: dict[str, list[np.ndarray]] = {}
+        for lead_in, start, stop in segments:
+            if stop <= start:
+                continue
+            found = _segment_alarms(spec, values[lead_in:stop], use_jit)
+            if spec.detector == "page_hinkley":
+                for kind in ("high", "low"):
+                    positions = found[kind] + lead_in
+                    pieces.setdefault(kind, []).append(positions[positions >= start] + base)
+                continue
+            positions = found["alarm"] + lead_in
+            kept = positions >= start
+            pieces.setdefault("alarm", []).append(positions[kept] + base)
+            if "high" in found:
+                # BOCPE: whether each kept alarm lands in the high-volatility regime.
+                pieces.setdefault("high", []).append(found["high"][kept])
+        results.append({kind: np.concatenate(parts) for kind, parts in pieces.items()})
+    return results
+
+
+def _inputs(df: pd.DataFrame) -> dict[str, tuple[np.ndarray, pd.Series]]:
+    """Values and timestamps fed to each detector, exactly as the serial entry points build them."""
+    from src.ivtool.detectors.inputs import detector_inputs
+
+    inputs = detector_inputs(df)
+    returns = inputs["log_return"]
+    std_series = returns.rolling(window=PAGE_HINKLEY_WINDOW, min_periods=PAGE_HINKLEY_WINDOW).std().dropna()
+    return {
+        "returns": (returns.to_numpy(dtype=np.float64), inputs["time"]),
+        "std": (std_series.to_numpy(dtype=np.float64), inputs["prev_time"].iloc[std_series.index].reset_index(drop=True)),
+    }
+
+
+def _empty_result(spec: DetectorSpec) -> dict[str, np.ndarray]:
+    empty = np.empty(0, dtype=np.int64)
+    if spec.detector == "page_hinkley":
+        return {"high": empty, "low": empty}
+    if spec.detector == "bocpe":
+        return {"alarm": empty, "high": np.empty(0, dtype=bool)}
+    return {"alarm": empty}
+
+
+def _output_frames(spec: DetectorSpec, found: dict[str, np.ndarray], timestamps: pd.Series) -> Any:
+    if spec.detector == "cusum":
+        return pd.DataFrame({"timestamp": timestamps.iloc[found["alarm"]], "alarm": True}).reset_index(drop=True)
+    if spec.detector == "page_hinkley":
+        flagged_high = pd.DataFrame({"timestamp": timestamps.iloc[found["high"]].tolist(), "alarm": "high"})
+        flagged_low = pd.DataFrame({"timestamp": timestamps.iloc[found["low"]].tolist(), "alarm": "low"})
+        return flagged_high.reset_index(drop=True), flagged_low.reset_index(drop=True)
+    regimes = np.where(found["high"], "High Volatility", "Low Volatility")
+    return pd.DataFrame({
+        "timestamp": timestamps.iloc[found["alarm"]],
+        "alarm": True,
+        "new_regime": regimes,
+    }).reset_index(drop=True)
+
+
+def run_day_parallel(
+    df: pd.DataFrame,
+    specs: Sequence[DetectorSpec],
+    boundary: str = "reset",
+    warmup: int = 0,
+    workers: int | None = None,
+    sessions_per_task: int | None = None,
+    use_jit: bool | None = None,
+) -> list[Any]:
+    """
+    Runs every spec session by session and returns one output per spec, in the
+    shape of the serial entry point: a flagged frame for CUSUM and BOCPE, a
+    ``(flagged_high, flagged_low)`` pair for Page-Hinkley.
+    ``workers=1`` runs in-process; ``None`` uses one worker per CPU.
+    """
+    inputs = _inputs(df)
+    workers = workers or os.cpu_count() or 1
+
+    jobs = []
+    for key, (values, timestamps) in inputs.items():
+        group = [i for i, spec in enumerate(specs) if (spec.detector == "page_hinkley") == (key == "std")]
+        if not group or values.size == 0:
+            continue
+        codes, sessions = session_codes(timestamps)
+        segments = session_segments(codes, len(sessions), boundary, warmup)
+        per_task = sessions_per_task or max(1, math.ceil(len(sessions) / (4 * workers)))
+        for first in range(0, len(segments), per_task):
+            chunk = segments[first:first + per_task]
+            base = int(chunk[0, 0])
+            stop = int(chunk[-1, 2])
+            jobs.append((key, group, ([specs[i] for i in group], values[base:stop], chunk - base, base, use_jit)))
+
+    if workers == 1 or len(jobs) <= 1:
+        results = [_run_sessions(*args) for _, _, args in jobs]
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            results = list(pool.map(_run_sessions, *zip(*(args for _, _, args in jobs))))
+
+    # Jobs were queued in session order, so concatenating keeps alarms sorted.
+    stitched: dict[int, dict[str, list[np.ndarray]]] = {}
+    for (_, group, _), result in zip(jobs, results):
+        for index, found in zip(group, result):
+            for kind, positions in found.items():
+                stitched.setdefault(index, {}).setdefault(kind, []).append(positions)
+
+    outputs = []
+    for index, spec in enumerate(specs):
+        found = {kind: np.concatenate(parts) for kind, parts in stitched.get(index, {}).items()}
+        found = {**_empty_result(spec), **found}
+        timestamps = inputs["std" if spec.detector == "page_hinkley" else "returns"][1]
+        outputs.append(_output_frames(spec, found, timestamps))
+    print(f"Day-parallel run complete: {len(specs)} detector configurations, boundary={boundary}.")
+    return outputs
+
+
+def run_serial(df: pd.DataFrame, specs: Sequence[DetectorSpec]) -> list[Any]:
+    """The serial entry points, for comparison with ``run_day_parallel``."""
+    from src.ivtool.detectors.bocpe import main_bocpe_run
+    from src.ivtool.detectors.cusum import main_cusum_run
+    from src.ivtool.detectors.page_hinkley import run_page_hinkley
+
+    runners = {"cusum": main_cusum_run, "page_hinkley": run_page_hinkley, "bocpe": main_bocpe_run}
+    return [runners[spec.detector](df, **spec.params) for spec in specs]
+
+
+def _alarm_keys(spec: DetectorSpec, output: Any) -> dict[str, pd.Series]:
+    if spec.detector == "page_hinkley":
+        flagged_high, flagged_low = output
+        return {"high": flagged_high["timestamp"], "low": flagged_low["timestamp"]}
+    if spec.detector == "bocpe":
+        return {
+            kind: output.loc[output["new_regime"] == regime, "timestamp"]
+            for kind, regime in (("high", "High Volatility"), ("low", "Low Volatility"))
+        }
+    return {"alarm": output["timestamp"]}
+
+
+def divergence_report(specs: Sequence[DetectorSpec], serial: Sequence[Any], parallel: Sequence[Any]) -> pd.DataFrame:
+    """Alarm-by-alarm comparison of serial and day-parallel outputs, one row per spec and alarm kind."""
+    rows = []
+    for spec, serial_output, parallel_output in zip(specs, serial, parallel):
+        serial_keys = _alarm_keys(spec, serial_output)
+        parallel_keys = _alarm_keys(spec, parallel_output)
+        for kind, serial_ts in serial_keys.items():
+            serial_ns = pd.DatetimeIndex(pd.to_datetime(serial_ts, utc=True))
+            parallel_ns = pd.DatetimeIndex(pd.to_datetime(parallel_keys[kind], utc=True))
+            only_serial = serial_ns.difference(parallel_ns)
+            only_parallel = parallel_ns.difference(serial_ns)
+            diverging = only_serial.append(only_parallel)
+            diverging_days = diverging.tz_convert(SESSION_TZ).normalize().unique() if len(diverging) else []
+            rows.append({
+                "label": spec.label,
+                "kind": kind,
+                "serial": len(serial_ns),
+                "parallel": len(parallel_ns),
+                "only_serial": len(only_serial),
+                "only_parallel": len(only_parallel),
+                "diverging_days": len(diverging_days),
+                "first_divergence": diverging.min() if len(diverging) else pd.NaT,
+            })
+    return pd.DataFrame(rows)
+
+
+def mode_from_env() -> tuple[str, int] | None:
+    """``IVTOOL_DAY_PARALLEL`` as ``(boundary, warmup)``: ``reset`` or ``warmup[:<ticks>]``; unset means serial."""
+    spec = os.getenv(DAY_PARALLEL_ENV, "").strip().lower()
+    if not spec:
+        return None
+    boundary, _, argument = spec.partition(":")
+    if boundary not in BOUNDARIES:
+        raise ValueError(f"unknown {DAY_PARALLEL_ENV} {spec!r}; expected reset or warmup[:<ticks>]")
+    warmup = int(argument) if argument else (PAGE_HINKLEY_WINDOW * 2 if boundary == "warmup" else 0)
+    return boundary, warmup
+
+
+def main(argv: Sequence[str] | None = None) -> pd.DataFrame:
+    from src.ivtool.pipeline.main_factory import CALIBRATION_GRID
+    from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+    parser = argparse.ArgumentParser(description="Day-parallel detection and its divergence from the serial run")
+    parser.add_argument("--sessions", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--boundary", choices=BOUNDARIES, default="reset")
+    parser.add_argument("--warmup", type=int, default=0)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--out", default="day_parallel_divergence.csv")
+    args = parser.parse_args(argv)
+
+    df = regime_switching_prices(args.sessions, seed=args.seed)
+    specs = [DetectorSpec(detector, params) for detector, grid in CALIBRATION_GRID.items() for params in grid]
+    parallel = run_day_parallel(df, specs, args.boundary, args.warmup, args.workers)
+    report = divergence_report(specs, run_serial(df, specs), parallel)
+    report.to_csv(args.out, index=False)
+    print(report.to_string(index=False))
+    return report
+
+
+if __name__ == "__main__":
+    main()
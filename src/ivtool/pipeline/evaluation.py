@@ -0,0 +1,279 @@
+"""
+Monte Carlo evaluation of detection delay and false-alarm rate.
+
+Each trial draws a returns series (synthetic Gaussian noise, or a random
+segment of historical returns), runs every detector configuration on it
+unchanged to count false alarms, then again with the volatility scaled by
+``shift_factor`` from ``change_point`` on to measure detection delay.
+Trials are spread over worker processes and seeded from one
+``SeedSequence``, so results do not depend on the number of workers.
+
+Usage:
+    python -m src.ivtool.pipeline.evaluation --trials 2000 --workers 8 --out evaluation.csv
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import math
+import os
+import time
+from collections.abc import Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass, field
+
+import numpy as np
+import pandas as pd
+
+from src.ivtool.detectors import kernels
+from src.ivtool.pipeline.synthetic import BARS_PER_SESSION
+
+PAGE_HINKLEY_WINDOW = 30
+
+
+@dataclass(frozen=True)
+class DetectorSpec:
+    detector: str
+    params: dict = field(default_factory=dict)
+
+    @property
+    def label(self) -> str:
+        return f"{self.detector}{json.dumps(self.params, sort_keys=True)}"
+
+
+@dataclass(frozen=True)
+class ShiftScenario:
+    n_bars: int = 5 * BARS_PER_SESSION
+    change_point: int = 3 * BARS_PER_SESSION
+    base_vol: float = 0.0003
+    shift_factor: float = 3.0
+
+    def __post_init__(self) -> None:
+        if not 0 < self.change_point < self.n_bars:
+            raise ValueError("change_point must fall inside the series")
+        if self.base_vol <= 0.0 or self.shift_factor <= 0.0:
+            raise ValueError("base_vol and shift_factor must be positive")
+
+
+@dataclass
+class EvaluationResult:
+    trials: pd.DataFrame
+    summary: pd.DataFrame
+
+
+def _rolling_std(returns: np.ndarray, window: int) -> np.ndarray:
+    if returns.size < window:
+        return np.empty(0)
+    windows = np.lib.stride_tricks.sliding_window_view(returns, window)
+    return windows.std(axis=1, ddof=1)
+
+
+def _reference_alarms(spec: DetectorSpec, values: np.ndarray) -> np.ndarray:
+    # Pure-Python path through the detector classes, used when Numba is missing.
+    from src.ivtool.detectors.bocpe import VolatilityBOCPE
+    from src.ivtool.detectors.cusum import CUSUM
+    from src.ivtool.detectors.page_hinkley import Page_Hinkley
+
+    if spec.detector == "cusum":
+        cusum = CUSUM(**spec.params)
+        return np.flatnonzero([cusum.update(float(x)) for x in values])
+    if spec.detector == "page_hinkley":
+        page_hinkley = Page_Hinkley(**spec.params)
+        for i, x_std in enumerate(values):
+            page_hinkley.update(float(x_std), i)
+        return np.asarray(page_hinkley.high_indices, dtype=np.int64)
+    bocpe = VolatilityBOCPE(**spec.params)
+    flags = []
+    for x in values:
+        triggered, regime = bocpe.update(float(x))
+        flags.append(triggered and regime == "High Volatility")
+    return np.flatnonzero(flags)
+
+
+def detector_alarms(spec: DetectorSpec, returns: np.ndarray) -> np.ndarray:
+    """
+    Indices into ``returns`` at which ``spec`` raises a volatility alarm:
+    any CUSUM alarm, Page-Hinkley high-regime alarms and BOCPE change points
+    that land in the high-volatility regime.
+    """
+    returns = np.ascontiguousarray(returns, dtype=np.float64)
+    offset = 0
+    if spec.detector == "page_hinkley":
+        values = _rolling_std(returns, PAGE_HINKLEY_WINDOW)
+        offset = PAGE_HINKLEY_WINDOW - 1
+    elif spec.detector in ("cusum", "bocpe"):
+        values = returns
+    else:
+        raise ValueError(f"unknown detector {spec.detector!r}")
+
+    if not kernels.jit_available():
+        return _reference_alarms(spec, values) + offset
+
+    if spec.detector == "cusum":
+        params = {"mu": 0.0, **spec.params}
+        alarms = kernels.get_kernel("cusum")(values, float(params["k"]), float(params["h"]), float(params["mu"]))
+        return np.flatnonzero(alarms)
+    if spec.detector == "page_hinkley":
+        threshold = float(spec.params.get("alarm_threshold", 250.0))
+        high, _ = kernels.get_kernel("page_hinkley")(values, threshold)
+        return high + offset
+
+    from src.ivtool.detectors.bocpe import VolatilityBOCPE
+
+    alarms, high = VolatilityBOCPE(**spec.params).run_array(values, use_jit=True)
+    return np.flatnonzero(alarms & high)
+
+
+def _draw_returns(rng: np.random.Generator, scenario: ShiftScenario, base_returns: np.ndarray | None) -> np.ndarray:
+    if base_returns is None:
+        return rng.standard_normal(scenario.n_bars) * scenario.base_vol
+    start = int(rng.integers(0, base_returns.size - scenario.n_bars + 1))
+    return np.array(base_returns[start:start + scenario.n_bars], dtype=np.float64)
+
+
+def run_trial(
+    specs: Sequence[DetectorSpec],
+    scenario: ShiftScenario,
+    seed: np.random.SeedSequence | int,
+    base_returns: np.ndarray | None = None,
+) -> list[dict]:
+    rng = np.random.default_rng(seed)
+    null = _draw_returns(rng, scenario, base_returns)
+    shifted = null.copy()
+    shifted[scenario.change_point:] *= scenario.shift_factor
+
+    records = []
+    for spec in specs:
+        start = time.perf_counter()
+        null_alarms = detector_alarms(spec, null)
+        shifted_alarms = detector_alarms(spec, shifted)
+        seconds = time.perf_counter() - start
+
+        after = shifted_alarms[shifted_alarms >= scenario.change_point]
+        records.append({
+            "detector": spec.detector,
+            "label": spec.label,
+            "null_alarms": int(null_alarms.size),
+            "first_null_alarm": int(null_alarms[0]) if null_alarms.size else math.nan,
+            "pre_change_alarms": int(shifted_alarms.size - after.size),
+            "delay": float(after[0] - scenario.change_point) if after.size else math.nan,
+            "bars": scenario.n_bars,
+            "seconds": seconds,
+        })
+    return records
+
+
+def _run_batch(
+    specs: Sequence[DetectorSpec],
+    scenario: ShiftScenario,
+    seeds: Sequence[np.random.SeedSequence],
+    first_trial: int,
+    base_returns: np.ndarray | None,
+) -> list[dict]:
+    records = []
+    for offset, seed in enumerate(seeds):
+        for record in run_trial(specs, scenario, seed, base_returns):
+            record["trial"] = first_trial + offset
+            records.append(record)
+    return records
+
+
+def summarize(trials: pd.DataFrame) -> pd.DataFrame:
+    """ARL0, false alarms per session, detection rate, delay distribution and cost per configuration."""
+    rows = []
+    for (detector, label), group in trials.groupby(["detector", "label"], sort=False):
+        null_bars = float(group["bars"].sum())
+        null_alarms = float(group["null_alarms"].sum())
+        delays = group["delay"].dropna()
+        rows.append({
+            "detector": detector,
+            "label": label,
+            "trials": len(group),
+            "arl0": null_bars / null_alarms if null_alarms else math.inf,
+            "false_alarms_per_session": null_alarms / (null_bars / BARS_PER_SESSION),
+            "detection_rate": len(delays) / len(group),
+            "delay_mean": delays.mean() if len(delays) else math.nan,
+            "delay_median": delays.median() if len(delays) else math.nan,
+            "delay_p90": delays.quantile(0.9) if len(delays) else math.nan,
+            # Every trial runs the detector over the null and the shifted series.
+            "us_per_tick": 1e6 * group["seconds"].sum() / (2.0 * null_bars),
+        })
+    return pd.DataFrame(rows)
+
+
+def evaluate(
+    specs: Sequence[DetectorSpec],
+    scenario: ShiftScenario | None = None,
+    n_trials: int = 1000,
+    seed: int = 0,
+    workers: int | None = None,
+    base_returns: np.ndarray | None = None,
+    batch_size: int = 25,
+) -> EvaluationResult:
+    """
+    Runs ``n_trials`` Monte Carlo trials of every spec in ``specs`` under
+    ``scenario`` (the default ``ShiftScenario()`` when omitted).
+    ``workers=1`` runs in-process; ``None`` uses one worker per CPU.
+    ``base_returns`` switches from Gaussian noise to segments of historical returns.
+    """
+    if n_trials < 1:
+        raise ValueError("n_trials must be >= 1")
+    if scenario is None:
+        scenario = ShiftScenario()
+    if base_returns is not None:
+        base_returns = np.asarray(base_returns, dtype=np.float64)
+        if base_returns.size < scenario.n_bars:
+            raise ValueError("base_returns is shorter than scenario.n_bars")
+
+    seeds = np.random.SeedSequence(seed).spawn(n_trials)
+    batches = [
+        (list(specs), scenario, seeds[start:start + batch_size], start, base_returns)
+        for start in range(0, n_trials, batch_size)
+    ]
+    workers = workers or os.cpu_count() or 1
+    records: list[dict] = []
+    if workers == 1:
+        for batch in batches:
+            records.extend(_run_batch(*batch))
+    else:
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for batch_records in pool.map(_run_batch, *zip(*batches)):
+                records.extend(batch_records)
+
+    trials = pd.DataFrame(records)
+    return EvaluationResult(trials=trials, summary=summarize(trials))
+
+
+def calibration_grid_specs() -> list[DetectorSpec]:
+    """Every parameter set in ``main_factory.CALIBRATION_GRID``."""
+    from src.ivtool.pipeline.main_factory import CALIBRATION_GRID
+
+    return [DetectorSpec(detector, params) for detector, grid in CALIBRATION_GRID.items() for params in grid]
+
+
+def main(argv: Sequence[str] | None = None) -> pd.DataFrame:
+    parser = argparse.ArgumentParser(description="Monte Carlo detection-delay / false-alarm evaluation")
+    parser.add_argument("--trials", type=int, default=1000)
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--shift-factor", type=float, default=ShiftScenario.shift_factor)
+    parser.add_argument("--base-vol", type=float, default=ShiftScenario.base_vol)
+    parser.add_argument("--sessions", type=int, default=5, help="trial length in sessions")
+    parser.add_argument("--out", default="detector_evaluation.csv")
+    args = parser.parse_args(argv)
+
+    n_bars = args.sessions * BARS_PER_SESSION
+    scenario = ShiftScenario(
+        n_bars=n_bars,
+        change_point=n_bars // 2,
+        base_vol=args.base_vol,
+        shift_factor=args.shift_factor,
+    )
+    result = evaluate(calibration_grid_specs(), scenario, n_trials=args.trials, seed=args.seed, workers=args.workers)
+    result.summary.to_csv(args.out, index=False)
+    print(result.summary.to_string(index=False))
+    return result.summary
+
+
+if __name__ == "__main__":
+    main()
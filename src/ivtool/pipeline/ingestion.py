@@ -0,0 +1,207 @@
+"""
+Watermark-driven incremental ingestion of 1-minute bars.
+
+Each run reads the newest stored ``time`` per symbol (the watermark) and
+requests only the regular sessions after it, one Databento request per
+session, up to ``until``. A job that skipped a week catches up on the whole
+week; a job with nothing new makes no request. Bars already stored in the
+fetched range are dropped before the insert, so overlapping backfills cost a
+range query instead of a batch of conflicting inserts. Reads and writes go
+through ``storage.PriceStore``. Every run returns an ``IngestionRun`` with
+rows fetched and inserted, rows/s and latencies.
+
+Usage (``data/retrieve_and_store.py`` wires in the Databento client and
+``DATABASE_URL2``):
+    python data/retrieve_and_store.py --symbols SPY --backfill-days 7
+"""
+from __future__ import annotations
+
+import json
+import logging
+import time
+from collections.abc import Callable, Sequence
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING, Any
+
+from src.ivtool.lazy import lazy_module
+from src.ivtool.storage import PriceStore
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+logger = logging.getLogger(__name__)
+
+SESSION_TZ = "America/New_York"
+SESSION_OPEN = "09:30"
+SESSION_CLOSE = "16:00"
+DATASET = "XNAS.ITCH"
+SCHEMA = "ohlcv-1m"
+
+
+@dataclass
+class IngestionRun:
+    symbol: str
+    watermark: str | None
+    sessions: int
+    rows_fetched: int = 0
+    rows_new: int = 0
+    rows_inserted: int = 0
+    fetch_s: float = 0.0
+    insert_s: float = 0.0
+    wall_s: float = 0.0
+    new_watermark: str | None = None
+
+    @property
+    def rows_per_s(self) -> float:
+        return self.rows_inserted / self.wall_s if self.wall_s > 0 else 0.0
+
+    @property
+    def fetch_latency_s(self) -> float:
+        """Mean wall time of one session request."""
+        return self.fetch_s / self.sessions if self.sessions else 0.0
+
+    def to_dict(self) -> dict[str, Any]:
+        return {**asdict(self), "rows_per_s": self.rows_per_s, "fetch_latency_s": self.fetch_latency_s}
+
+
+def _clock_time(clock: str) -> tuple[int, int]:
+    hours, minutes = clock.split(":")
+    return int(hours), int(minutes)
+
+
+def _utc(value: pd.Timestamp | str) -> pd.Timestamp:
+    """Reads a timestamp or ISO string as UTC: naive values are taken as UTC, offsets are converted."""
+    stamp = pd.Timestamp(value)
+    return stamp.tz_localize("UTC") if stamp.tzinfo is None else stamp.tz_convert("UTC")
+
+
+def session_ranges(
+    after: pd.Timestamp | None,
+    until: pd.Timestamp,
+    tz: str = SESSION_TZ,
+    session_open: str = SESSION_OPEN,
+    session_close: str = SESSION_CLOSE,
+) -> list[tuple[pd.Timestamp, pd.Timestamp]]:
+    """
+    Half-open UTC ``[start, end)`` ranges of the weekday sessions with bars
+    after ``after`` that close by ``until``. The closing bar is included
+    (``end`` is one minute past ``session_close``); a session the watermark
+    falls inside starts one minute after it.
+    """
+    until = pd.Timestamp(until).tz_convert(tz)
+    first_day = (pd.Timestamp(after).tz_convert(tz) if after is not None else until).normalize()
+    open_h, open_m = _clock_time(session_open)
+    close_h, close_m = _clock_time(session_close)
+
+    ranges = []
+    for day in pd.date_range(first_day, until.normalize(), freq="B"):
+        start = day + pd.Timedelta(hours=open_h, minutes=open_m)
+        end = day + pd.Timedelta(hours=close_h, minutes=close_m + 1)
+        if end > until:
+            break
+        if after is not None:
+            start = max(start, after + pd.Timedelta(minutes=1))
+        if start < end:
+            ranges.append((start.tz_convert("UTC"), end.tz_convert("UTC")))
+    return ranges
+
+
+def clean_bars(raw: pd.DataFrame, tz: str = SESSION_TZ) -> pd.DataFrame:
+    """``time`` (UTC), ``symbol``, ``price`` of the regular-session closes in a Databento ``ohlcv-1m`` frame."""
+    df = raw.reset_index()
+    df["time"] = pd.to_datetime(df["ts_event"], utc=True)
+    local = df.set_index(df["time"].dt.tz_convert(tz))
+    df = local.between_time(SESSION_OPEN, SESSION_CLOSE, inclusive="both").reset_index(drop=True)
+    df = df.rename(columns={"close": "price"})[["time", "symbol", "price"]]
+    return df.sort_values("time").reset_index(drop=True)
+
+
+def fetch_session(client: Any, symbol: str, start: pd.Timestamp, end: pd.Timestamp, dataset: str = DATASET) -> pd.DataFrame:
+    data = client.timeseries.get_range(
+        dataset=dataset,
+        symbols=[symbol],
+        schema=SCHEMA,
+        start=start.isoformat(),
+        end=end.isoformat(),
+    )
+    return clean_bars(data.to_df())
+
+
+def ingest_symbol(
+    client: Any,
+    store: PriceStore,
+    symbol: str,
+    until: pd.Timestamp,
+    backfill_start: pd.Timestamp | None = None,
+    since: pd.Timestamp | None = None,
+    clock: Callable[[], float] = time.perf_counter,
+) -> IngestionRun:
+    """
+    Fetches the sessions after ``symbol``'s watermark (or from
+    ``backfill_start`` on an empty table) and inserts the bars not yet stored.
+    ``since`` re-fetches from an earlier time regardless of the watermark, to
+    repair holes in the stored history.
+    """
+    started = clock()
+    watermark = store.watermark(symbol)
+    after = since if since is not None else watermark if watermark is not None else backfill_start
+    ranges = session_ranges(after, until)
+    run = IngestionRun(symbol, None if watermark is None else watermark.isoformat(), len(ranges))
+
+    frames = []
+    for start, end in ranges:
+        fetch_started = clock()
+        bars = fetch_session(client, symbol, start, end)
+        run.fetch_s += clock() - fetch_started
+        run.rows_fetched += len(bars)
+        if bars.empty:
+            continue
+        existing = store.existing_times(symbol, start, end)
+        frames.append(bars[~bars["time"].isin(existing)])
+
+    new = pd.concat(frames, ignore_index=True) if frames else pd.DataFrame(columns=["time", "symbol", "price"])
+    run.rows_new = len(new)
+    insert_started = clock()
+    run.rows_inserted = store.insert(new)
+    run.insert_s = clock() - insert_started
+    run.wall_s = clock() - started
+    latest = new["time"].max() if len(new) else None
+    if watermark is not None and (latest is None or watermark > latest):
+        latest = watermark
+    run.new_watermark = None if latest is None else pd.Timestamp(latest).isoformat()
+
+    logger.info(
+        "%s: %d sessions after %s, %d rows fetched, %d new, %d inserted in %.2fs (%.0f rows/s, %.2fs per request)",
+        symbol, run.sessions, run.watermark, run.rows_fetched, run.rows_new, run.rows_inserted,
+        run.wall_s, run.rows_per_s, run.fetch_latency_s,
+    )
+    return run
+
+
+def ingest(
+    client: Any,
+    store: PriceStore,
+    symbols: Sequence[str] = ("SPY",),
+    until: pd.Timestamp | str | None = None,
+    backfill_days: int = 7,
+    since: pd.Timestamp | str | None = None,
+    clock: Callable[[], float] = time.perf_counter,
+) -> list[IngestionRun]:
+    """
+    One ingestion run over ``symbols``. ``until`` defaults to today's midnight
+    UTC, so only complete sessions are requested; a symbol with no stored
+    bars is backfilled ``backfill_days`` back. ``until`` and ``since`` may be
+    ISO strings; naive times are UTC and offsets are converted.
+    """
+    end = pd.Timestamp.now(tz="UTC").normalize() if until is None else _utc(until)
+    refetch_from = None if since is None else _utc(since)
+    backfill_start = end.normalize() - pd.Timedelta(days=backfill_days)
+    return [ingest_symbol(client, store, symbol, end, backfill_start, refetch_from, clock) for symbol in symbols]
+
+
+def append_runs(runs: Sequence[IngestionRun], path: str) -> None:
+    """Appends one JSON line per run, the ingestion history the rows/s and latency trends are read from."""
+    with open(path, "a") as handle:
+        handle.writelines(json.dumps(run.to_dict()) + "\n" for run in runs)
@@ -0,0 +1,210 @@
+"""
+Lightweight per-stage timing for pipeline runs.
+
+Stages are wrapped in ``span`` context managers that record wall time, CPU
+time, row counts and the process peak RSS. ``RunTimer.report()`` gives the
+whole run as a JSON-serialisable dict. Spans are only recorded between
+``start_run`` and ``end_run``; outside a run they cost nothing and keep
+nothing, so long-lived callers of timed functions do not accumulate them.
+
+Profiling is switched on with the ``IVTOOL_PROFILE`` environment variable:
+``cprofile`` dumps a pstats file next to the timing report, ``tracemalloc``
+adds the top allocation sites to the report.
+"""
+from __future__ import annotations
+
+import cProfile
+import functools
+import json
+import os
+import sys
+import time
+import tracemalloc
+import uuid
+from collections.abc import Callable, Iterator
+from contextlib import AbstractContextManager, contextmanager, nullcontext
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import Any, TypeVar
+
+try:
+    import resource
+except ImportError:  # Windows
+    resource = None  # type: ignore[assignment]
+
+F = TypeVar("F", bound=Callable[..., Any])
+
+PROFILE_ENV = "IVTOOL_PROFILE"
+REPORT_ENV = "IVTOOL_TIMING_REPORT"
+
+
+def peak_rss_mb() -> float | None:
+    if resource is None:
+        return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # ru_maxrss is bytes on macOS and kilobytes elsewhere.
+    return peak / 2**20 if sys.platform == "darwin" else peak / 2**10
+
+
+@dataclass
+class Span:
+    name: str
+    parent: str | None = None
+    depth: int = 0
+    wall_s: float = 0.0
+    cpu_s: float = 0.0
+    rows: int | None = None
+    peak_rss_mb: float | None = None
+    attrs: dict[str, Any] = field(default_factory=dict)
+
+
+class RunTimer:
+    """Collects the spans of one pipeline run."""
+
+    def __init__(self, run_id: str | None = None) -> None:
+        self.run_id = run_id or uuid.uuid4().hex[:12]
+        self.started = datetime.now(UTC)
+        self.spans: list[Span] = []
+        self.extra: dict[str, Any] = {}
+        self._stack: list[Span] = []
+        self._wall_start = time.perf_counter()
+        self._cpu_start = time.process_time()
+
+    @contextmanager
+    def span(self, name: str, rows: int | None = None, **attrs: Any) -> Iterator[Span]:
+        parent = self._stack[-1].name if self._stack else None
+        record = Span(name=name, parent=parent, depth=len(self._stack), rows=rows, attrs=dict(attrs))
+        self.spans.append(record)
+        self._stack.append(record)
+        wall_start = time.perf_counter()
+        cpu_start = time.process_time()
+        try:
+            yield record
+        finally:
+            record.wall_s = time.perf_counter() - wall_start
+            record.cpu_s = time.process_time() - cpu_start
+            record.peak_rss_mb = peak_rss_mb()
+            self._stack.pop()
+
+    def closed_spans(self) -> list[Span]:
+        """Spans that have finished; open ones still show zero wall and CPU time."""
+        still_open = {id(record) for record in self._stack}
+        return [record for record in self.spans if id(record) not in still_open]
+
+    def totals(self, spans: list[Span] | None = None) -> dict[str, dict[str, float]]:
+        """Wall/CPU time and call count aggregated by span name."""
+        totals: dict[str, dict[str, float]] = {}
+        for record in self.spans if spans is None else spans:
+            entry = totals.setdefault(record.name, {"calls": 0, "wall_s": 0.0, "cpu_s": 0.0})
+            entry["calls"] += 1
+            entry["wall_s"] += record.wall_s
+            entry["cpu_s"] += record.cpu_s
+        return totals
+
+    def report(self, include_open: bool = True) -> dict[str, Any]:
+        """
+        The run so far. ``include_open=False`` leaves out spans that have not
+        finished yet, for reports written from inside them.
+        """
+        spans = self.spans if include_open else self.closed_spans()
+        return {
+            "run_id": self.run_id,
+            "started": self.started.isoformat(),
+            "wall_s": time.perf_counter() - self._wall_start,
+            "cpu_s": time.process_time() - self._cpu_start,
+            "peak_rss_mb": peak_rss_mb(),
+            "spans": [asdict(record) for record in spans],
+            "totals": self.totals(spans),
+            **self.extra,
+        }
+
+    def write_json(self, path: str | os.PathLike[str]) -> Path:
+        path = Path(path)
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_text(json.dumps(self.report(), indent=2, default=str))
+        return path
+
+
+_current: RunTimer | None = None
+
+
+def current_timer() -> RunTimer | None:
+    """The timer of the active run, or None outside a run."""
+    return _current
+
+
+def start_run(run_id: str | None = None) -> RunTimer:
+    """Starts a fresh timer that module-level ``span`` calls record into."""
+    global _current
+    _current = RunTimer(run_id)
+    return _current
+
+
+def end_run() -> RunTimer | None:
+    """Stops recording; ``span`` is a no-op again until the next ``start_run``."""
+    global _current
+    timer, _current = _current, None
+    return timer
+
+
+def span(name: str, rows: int | None = None, **attrs: Any) -> AbstractContextManager[Span]:
+    if _current is None:
+        # The record is handed to the block but never stored.
+        return nullcontext(Span(name=name, rows=rows, attrs=dict(attrs)))
+    return _current.span(name, rows=rows, **attrs)
+
+
+def timed(name: str, rows: Callable[[Any], int] | None = None) -> Callable[[F], F]:
+    """
+    Decorator form of ``span``. ``rows`` maps the return value to a row count;
+    by default ``len`` of the result is used when it has one.
+    """
+
+    def decorator(func: F) -> F:
+        @functools.wraps(func)
+        def wrapper(*args: Any, **kwargs: Any) -> Any:
+            with span(name) as record:
+                result = func(*args, **kwargs)
+                if rows is not None:
+                    record.rows = rows(result)
+                elif hasattr(result, "__len__"):
+                    record.rows = len(result)
+                return result
+
+        return wrapper  # type: ignore[return-value]
+
+    return decorator
+
+
+@contextmanager
+def profiling(timer: RunTimer, report_path: str | os.PathLike[str]) -> Iterator[None]:
+    """Runs the block under cProfile or tracemalloc when ``IVTOOL_PROFILE`` asks for it."""
+    mode = os.environ.get(PROFILE_ENV, "").strip().lower()
+    if mode == "cprofile":
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            yield
+        finally:
+            profiler.disable()
+            stats_path = Path(report_path).with_suffix(".pstats")
+            profiler.dump_stats(stats_path)
+            timer.extra["cprofile"] = str(stats_path)
+    elif mode == "tracemalloc":
+        tracemalloc.start()
+        try:
+            yield
+        finally:
+            snapshot = tracemalloc.take_snapshot()
+            _, peak = tracemalloc.get_traced_memory()
+            tracemalloc.stop()
+            timer.extra["tracemalloc"] = {
+                "peak_mb": peak / 2**20,
+                "top": [
+                    {"site": str(stat.traceback), "size_mb": stat.size / 2**20, "count": stat.count}
+                    for stat in snapshot.statistics("lineno")[:25]
+                ],
+            }
+    else:
+        yield
@@ -1,15 +1,21 @@
+from __future__ import annotations
+
 import os
 from dataclasses import dataclass
 from itertools import product
+from typing import TYPE_CHECKING, Any
 
 import numpy as np
-import pandas as pd
-import psycopg2
-from dotenv import load_dotenv
 
-from src.ivtool.detectors.bocpe import main_bocpe_run
-from src.ivtool.detectors.cusum import main_cusum_run
-from src.ivtool.detectors.page_hinkley import run_page_hinkley
+from src.ivtool.lazy import lazy_module
+from src.ivtool.pipeline import consensus, instrumentation, quality, sinks
+from src.ivtool.pipeline.instrumentation import span, timed
+
+# Loaded on first use so importing the pipeline stays cheap for streaming workers.
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
 
 
 @dataclass(frozen=True)
@@ -45,17 +51,12 @@ CALIBRATION_GRID = {
 }
 
 
-def get_data():
-    load_dotenv()
+@timed("load.get_data")
+def get_data(symbol: str | None = None, start: Any = None, end: Any = None) -> pd.DataFrame:
+    from src.ivtool import storage
+
     print("Loading data from database...")
-    database_url = os.getenv("DATABASE_URL2")
-    table_name = "SPY_DATA_V2"
-
-    if database_url is None:
-        raise ValueError("DATABASE_URL2 not found in environment variables")
-    query = f'SELECT * FROM "{table_name}" ORDER BY time ASC;'
-    with psycopg2.connect(database_url) as conn:
-        df = pd.read_sql(query, conn)
+    df = storage.store_from_env().read_range(symbol, start, end)
     print("Data loaded successfully.")
     return df
 
@@ -73,7 +74,7 @@ def _timestamps_to_day_flags(series: pd.Series) -> set[pd.Timestamp]:
     return set(timestamps.dt.normalize().tolist())
 
 
-def _high_regime_minutes(high_timestamps: list[pd.Timestamp], low_timestamps: list[pd.Timestamp], final_timestamp) -> pd.DataFrame:
+def _high_regime_minutes(high_timestamps: list[pd.Timestamp], low_timestamps: list[pd.Timestamp], final_timestamp: pd.Timestamp) -> pd.DataFrame:
     all_flagged: list[dict[str, pd.Timestamp | str]] = []
     market_open = pd.Timestamp("13:30").time()
     market_close = pd.Timestamp("21:00").time()
@@ -92,6 +93,7 @@ def _high_regime_minutes(high_timestamps: list[pd.Timestamp], low_timestamps: li
     return pd.DataFrame(all_flagged).drop_duplicates("timestamp").sort_values("timestamp").reset_index(drop=True)
 
 
+@timed("regimes.page_hinkley")
 def page_hinkley_high_risk_regimes(flagged_high_ph: pd.DataFrame, flagged_low_ph: pd.DataFrame) -> pd.DataFrame:
     high_timestamps = sorted(_timestamps_to_utc(flagged_high_ph.get("timestamp", pd.Series(dtype=object))).tolist())
     low_timestamps = sorted(_timestamps_to_utc(flagged_low_ph.get("timestamp", pd.Series(dtype=object))).tolist())
@@ -107,6 +109,7 @@ def page_hinkley_high_risk_regimes(flagged_high_ph: pd.DataFrame, flagged_low_ph
 
 
 
+@timed("regimes.bocpe")
 def bocpe_high_risk_regimes(flagged_bocpe: pd.DataFrame) -> pd.DataFrame:
     high_mask = flagged_bocpe.get("new_regime", pd.Series(dtype=object)) == "High Volatility"
     low_mask = flagged_bocpe.get("new_regime", pd.Series(dtype=object)) == "Low Volatility"
@@ -125,8 +128,11 @@ def bocpe_high_risk_regimes(flagged_bocpe: pd.DataFrame) -> pd.DataFrame:
 
 
 
-def _evaluate_cusum_candidate(df: pd.DataFrame, params: dict) -> CalibrationChoice:
-    flagged_cusum = main_cusum_run(df, **params)
+@timed("calibration.cusum_candidate", rows=lambda choice: choice.minute_count)
+def _evaluate_cusum_candidate(df: pd.DataFrame, params: dict, output: pd.DataFrame | None = None) -> CalibrationChoice:
+    from src.ivtool.detectors.cusum import main_cusum_run
+
+    flagged_cusum = output if output is not None else main_cusum_run(df, **params)
     day_flags = _timestamps_to_day_flags(flagged_cusum["timestamp"])
     return CalibrationChoice(
         name="cusum",
@@ -138,8 +144,11 @@ def _evaluate_cusum_candidate(df: pd.DataFrame, params: dict) -> CalibrationChoi
 
 
 
-def _evaluate_bocpe_candidate(df: pd.DataFrame, params: dict) -> CalibrationChoice:
-    flagged_bocpe = main_bocpe_run(df, **params)
+@timed("calibration.bocpe_candidate", rows=lambda choice: choice.minute_count)
+def _evaluate_bocpe_candidate(df: pd.DataFrame, params: dict, output: pd.DataFrame | None = None) -> CalibrationChoice:
+    from src.ivtool.detectors.bocpe import main_bocpe_run
+
+    flagged_bocpe = output if output is not None else main_bocpe_run(df, **params)
     bocpe_result = bocpe_high_risk_regimes(flagged_bocpe)
     day_flags = _timestamps_to_day_flags(bocpe_result["timestamp"])
     return CalibrationChoice(
@@ -152,8 +161,13 @@ def _evaluate_bocpe_candidate(df: pd.DataFrame, params: dict) -> CalibrationChoi
 
 
 
-def _evaluate_page_hinkley_candidate(df: pd.DataFrame, params: dict) -> CalibrationChoice:
-    flagged_high_ph, flagged_low_ph = run_page_hinkley(df, **params)
+@timed("calibration.page_hinkley_candidate", rows=lambda choice: choice.minute_count)
+def _evaluate_page_hinkley_candidate(
+    df: pd.DataFrame, params: dict, output: tuple[pd.DataFrame, pd.DataFrame] | None = None
+) -> CalibrationChoice:
+    from src.ivtool.detectors.page_hinkley import run_page_hinkley
+
+    flagged_high_ph, flagged_low_ph = output if output is not None else run_page_hinkley(df, **params)
     page_hinkley_result = page_hinkley_high_risk_regimes(flagged_high_ph, flagged_low_ph)
     day_flags = _timestamps_to_day_flags(page_hinkley_result["timestamp"])
     return CalibrationChoice(
@@ -191,23 +205,83 @@ def _calibration_score(day_flag_sets: list[set[pd.Timestamp]], minute_counts: li
 
 
 
-def calibrate_detectors(df: pd.DataFrame) -> dict[str, CalibrationChoice]:
+@timed("calibration.bocpe_trajectories")
+def _shared_bocpe_outputs(df: pd.DataFrame, grid: list[dict]) -> list[pd.DataFrame]:
+    """
+    BOCPE candidates differing only in ``threshold`` / ``vol_threshold`` share one
+    posterior trajectory; the recursion runs once per (hazard, max_run_length).
+    """
+    from src.ivtool.detectors.bocpe import bocpe_trajectory, flag_bocpe
+
+    trajectories = {}
+    outputs = []
+    for params in grid:
+        recursion = {key: value for key, value in params.items() if key not in ("threshold", "vol_threshold")}
+        key = tuple(sorted(recursion.items()))
+        if key not in trajectories:
+            trajectories[key] = bocpe_trajectory(df, **recursion)
+        timestamps, trajectory = trajectories[key]
+        rule = {key: params[key] for key in ("threshold", "vol_threshold") if key in params}
+        outputs.append(flag_bocpe(timestamps, trajectory, **rule))
+    print(f"BOCPE calibration: {len(trajectories)} posterior trajectories for {len(grid)} candidates.")
+    return outputs
+
+
+def _candidate_outputs(df: pd.DataFrame, reset_sessions: bool = False) -> dict[str, list]:
+    """
+    Precomputed detector output per calibration candidate (``None`` runs the
+    candidate on its own). With ``IVTOOL_DAY_PARALLEL`` set, or
+    ``reset_sessions`` (the ``reset`` data-quality policy), every candidate is
+    run session by session; otherwise BOCPE candidates share trajectories.
+    """
+    from src.ivtool.pipeline import day_parallel
+    from src.ivtool.pipeline.evaluation import DetectorSpec
+
+    mode = ("reset", 0) if reset_sessions else day_parallel.mode_from_env()
+    if mode is None:
+        outputs: dict[str, list] = {name: [None] * len(grid) for name, grid in CALIBRATION_GRID.items()}
+        outputs["bocpe"] = _shared_bocpe_outputs(df, CALIBRATION_GRID["bocpe"])
+        return outputs
+    boundary, warmup = mode
+    specs = [DetectorSpec(name, params) for name, grid in CALIBRATION_GRID.items() for params in grid]
+    with span("calibration.day_parallel", rows=len(df), boundary=boundary, warmup=warmup):
+        results = day_parallel.run_day_parallel(df, specs, boundary=boundary, warmup=warmup)
+    grouped: dict[str, list] = {name: [] for name in CALIBRATION_GRID}
+    for spec, output in zip(specs, results):
+        grouped[spec.detector].append(output)
+    return grouped
+
+
+def calibrate_detectors(df: pd.DataFrame, reset_sessions: bool = False) -> dict[str, CalibrationChoice]:
     print("Calibrating detector thresholds so the three models behave comparably...")
-    cusum_choices = [_evaluate_cusum_candidate(df, params) for params in CALIBRATION_GRID["cusum"]]
-    bocpe_choices = [_evaluate_bocpe_candidate(df, params) for params in CALIBRATION_GRID["bocpe"]]
-    page_hinkley_choices = [_evaluate_page_hinkley_candidate(df, params) for params in CALIBRATION_GRID["page_hinkley"]]
+    outputs = _candidate_outputs(df, reset_sessions)
+    cusum_choices = [
+        _evaluate_cusum_candidate(df, params, output)
+        for params, output in zip(CALIBRATION_GRID["cusum"], outputs["cusum"])
+    ]
+    bocpe_choices = [
+        _evaluate_bocpe_candidate(df, params, output)
+        for params, output in zip(CALIBRATION_GRID["bocpe"], outputs["bocpe"])
+    ]
+    page_hinkley_choices = [
+        _evaluate_page_hinkley_candidate(df, params, output)
+        for params, output in zip(CALIBRATION_GRID["page_hinkley"], outputs["page_hinkley"])
+    ]
 
     best_combo: tuple[CalibrationChoice, CalibrationChoice, CalibrationChoice] | None = None
     best_score = float("inf")
 
-    for combo in product(cusum_choices, bocpe_choices, page_hinkley_choices):
-        score = _calibration_score(
-            [choice.day_flags for choice in combo],
-            [choice.minute_count for choice in combo],
-        )
-        if score < best_score:
-            best_score = score
-            best_combo = combo
+    with span("calibration.score") as scoring:
+        scoring.rows = 0
+        for combo in product(cusum_choices, bocpe_choices, page_hinkley_choices):
+            score = _calibration_score(
+                [choice.day_flags for choice in combo],
+                [choice.minute_count for choice in combo],
+            )
+            scoring.rows += 1
+            if score < best_score:
+                best_score = score
+                best_combo = combo
 
     if best_combo is None:
         raise RuntimeError("Unable to calibrate detector thresholds")
@@ -221,8 +295,9 @@ def calibrate_detectors(df: pd.DataFrame) -> dict[str, CalibrationChoice]:
 
 
 
-def detect_events(df: pd.DataFrame):
-    calibrated = calibrate_detectors(df)
+def detect_events(df: pd.DataFrame, reset_sessions: bool = False) -> dict[str, Any]:
+    with span("detect.calibrate_detectors", rows=len(df)):
+        calibrated = calibrate_detectors(df, reset_sessions)
     flagged_cusum = calibrated["cusum"].output
     flagged_bocpe = calibrated["bocpe"].output
     flagged_high_ph, flagged_low_ph = calibrated["page_hinkley"].output
@@ -237,75 +312,167 @@ def detect_events(df: pd.DataFrame):
 
 
 
-def high_risk_regimes(flagged_cusum: pd.DataFrame, bocpe_result: pd.DataFrame, page_hinkley_result: pd.DataFrame) -> pd.DataFrame:
-    combined = pd.concat(
-        [
-            flagged_cusum["timestamp"],
-            bocpe_result["timestamp"],
-            page_hinkley_result["timestamp"],
-        ]
-    )
-    counts = combined.value_counts().reset_index()
-    counts.columns = ["timestamp", "detector_count"]
-    high_risk = counts[counts["detector_count"] >= 2][["timestamp"]].copy()
+def high_risk_intervals(
+    flagged_cusum: pd.DataFrame,
+    bocpe_result: pd.DataFrame,
+    page_hinkley_result: pd.DataFrame,
+    k: int = 2,
+    tolerance: pd.Timedelta | str = "0min",
+) -> pd.DataFrame:
+    """
+    Intervals where at least ``k`` detectors agree. CUSUM point alarms are
+    widened by ``tolerance`` on each side; the Page-Hinkley and BOCPE
+    high-volatility minutes are treated as runs of consecutive bars.
+    """
+    tolerance_ns = int(pd.Timedelta(tolerance).value)
+    cusum_ns = np.sort(consensus.to_ns(flagged_cusum["timestamp"]))
+    bocpe_ns = np.sort(consensus.to_ns(bocpe_result["timestamp"]))
+    page_hinkley_ns = np.sort(consensus.to_ns(page_hinkley_result["timestamp"]))
+    intervals = {
+        "cusum": consensus.points_to_intervals(cusum_ns, tolerance_ns),
+        "bocpe": consensus.runs_to_intervals(bocpe_ns, tolerance_ns=tolerance_ns),
+        "page_hinkley": consensus.runs_to_intervals(page_hinkley_ns, tolerance_ns=tolerance_ns),
+    }
+    return consensus.k_of_n(intervals, k)
+
+
+@timed("regimes.high_risk")
+def high_risk_regimes(
+    flagged_cusum: pd.DataFrame,
+    bocpe_result: pd.DataFrame,
+    page_hinkley_result: pd.DataFrame,
+    k: int = 2,
+    tolerance: pd.Timedelta | str = "0min",
+) -> pd.DataFrame:
+    agreed = high_risk_intervals(flagged_cusum, bocpe_result, page_hinkley_result, k=k, tolerance=tolerance)
+    minutes = consensus.expand_to_minutes(agreed)
+    high_risk = pd.DataFrame({"timestamp": pd.to_datetime(minutes, utc=True)})
     high_risk["regime"] = "high risk"
-    high_risk = high_risk.sort_values("timestamp").reset_index(drop=True)
     print(f"High risk regimes identified: {len(high_risk)} regimes.")
     return high_risk
 
 
 
-def disagreement_days(flagged_cusum: pd.DataFrame, bocpe_result: pd.DataFrame, page_hinkley_result: pd.DataFrame) -> pd.DataFrame:
-    cusum_days = _timestamps_to_day_flags(flagged_cusum["timestamp"])
-    bocpe_days = _timestamps_to_day_flags(bocpe_result["timestamp"])
-    page_hinkley_days = _timestamps_to_day_flags(page_hinkley_result["timestamp"])
-
-    all_days = sorted(cusum_days | bocpe_days | page_hinkley_days)
-    rows = []
-    for day in all_days:
-        cusum_flag = day in cusum_days
-        bocpe_flag = day in bocpe_days
-        page_hinkley_flag = day in page_hinkley_days
-        disagreement = len({cusum_flag, bocpe_flag, page_hinkley_flag}) > 1
-        if disagreement:
-            rows.append(
-                {
-                    "date": day.date().isoformat(),
-                    "cusum_flag": cusum_flag,
-                    "bocpe_flag": bocpe_flag,
-                    "page_hinkley_flag": page_hinkley_flag,
-                    "models_flagging": int(cusum_flag) + int(bocpe_flag) + int(page_hinkley_flag),
-                }
-            )
+@timed("regimes.disagreement_days")
+def disagreement_days(
+    flagged_cusum: pd.DataFrame,
+    bocpe_result: pd.DataFrame,
+    page_hinkley_result: pd.DataFrame,
+    flagged_bocpe: pd.DataFrame,
+    flagged_high_ph: pd.DataFrame,
+) -> pd.DataFrame:
+    """
+    Days flagged by some but not all detectors: CUSUM by its alarms, BOCPE and
+    Page-Hinkley by their high-volatility minutes. The alarm counts and first
+    alarms are BOCPE's change points and Page-Hinkley's high alarms.
+    """
+    return detector_disagreement_days(
+        {
+            "cusum": flagged_cusum["timestamp"],
+            "bocpe": bocpe_result["timestamp"],
+            "page_hinkley": page_hinkley_result["timestamp"],
+        },
+        {
+            "cusum": flagged_cusum["timestamp"],
+            "bocpe": flagged_bocpe["timestamp"],
+            "page_hinkley": flagged_high_ph["timestamp"],
+        },
+    )
+
 
-    result = pd.DataFrame(rows)
+
+@timed("regimes.pair_agreement")
+def model_pair_agreement(flagged_cusum: pd.DataFrame, bocpe_result: pd.DataFrame, page_hinkley_result: pd.DataFrame) -> pd.DataFrame:
+    """Days both, either or neither of each pair of detectors flagged, with their Jaccard index and agreement rate."""
+    return consensus.day_flag_matrix(
+        {
+            "cusum": flagged_cusum["timestamp"],
+            "bocpe": bocpe_result["timestamp"],
+            "page_hinkley": page_hinkley_result["timestamp"],
+        }
+    ).pairwise_agreement()
+
+
+def detector_disagreement_days(
+    timestamps_by_detector: dict[str, pd.Series], alarms_by_detector: dict[str, pd.Series] | None = None
+) -> pd.DataFrame:
+    """
+    Days flagged by some but not all detectors, for any number of detectors,
+    with each detector's flag, alarm count and first alarm time on the day.
+    Alarms are the flagging timestamps unless ``alarms_by_detector`` is given.
+    """
+    matrix = consensus.day_flag_matrix(timestamps_by_detector, alarms_by_detector)
+    result = matrix.to_frame()[matrix.disagreement].reset_index(drop=True)
     print(f"Model disagreement days identified: {len(result)} days.")
     return result
 
 
 
-def main():
-    df = get_data()
-    detection_results = detect_events(df)
-    flagged_cusum = detection_results["flagged_cusum"]
-    flagged_bocpe = detection_results["flagged_bocpe"]
-    flagged_high_ph = detection_results["flagged_high_ph"]
-    flagged_low_ph = detection_results["flagged_low_ph"]
-
-    page_hinkley_result = page_hinkley_high_risk_regimes(flagged_high_ph, flagged_low_ph)
-    bocpe_result = bocpe_high_risk_regimes(flagged_bocpe)
-    high_risk = high_risk_regimes(flagged_cusum, bocpe_result, page_hinkley_result)
-    disagreement = disagreement_days(flagged_cusum, bocpe_result, page_hinkley_result)
-
-    high_risk.to_csv("high_risk_regimes.csv", index=False)
-    disagreement.to_csv("model_flag_disagreements.csv", index=False)
-    pd.DataFrame(
-        [
-            {"model": model, **params}
-            for model, params in detection_results["calibration"].items()
-        ]
-    ).to_csv("detector_calibration.csv", index=False)
-    return high_risk, disagreement
+def main() -> tuple[pd.DataFrame, pd.DataFrame]:
+    timer = instrumentation.start_run()
+    try:
+        report_path = os.getenv(instrumentation.REPORT_ENV, "timing_report.json")
+        with instrumentation.profiling(timer, report_path), span("main"):
+            df = get_data()
+            with span("quality.prepare", rows=len(df)):
+                prepared = quality.prepare_prices(df, policy=quality.policy_from_env())
+            quality.print_summary(prepared.summary)
+            detection_results = detect_events(prepared.frame, reset_sessions=prepared.reset_sessions)
+            flagged_cusum = detection_results["flagged_cusum"]
+            flagged_bocpe = detection_results["flagged_bocpe"]
+            flagged_high_ph = detection_results["flagged_high_ph"]
+            flagged_low_ph = detection_results["flagged_low_ph"]
+
+            page_hinkley_result = page_hinkley_high_risk_regimes(flagged_high_ph, flagged_low_ph)
+            bocpe_result = bocpe_high_risk_regimes(flagged_bocpe)
+            high_risk = high_risk_regimes(flagged_cusum, bocpe_result, page_hinkley_result)
+            disagreement = disagreement_days(
+                flagged_cusum, bocpe_result, page_hinkley_result, flagged_bocpe, flagged_high_ph
+            )
+            pair_agreement = model_pair_agreement(flagged_cusum, bocpe_result, page_hinkley_result)
+
+            from src.ivtool.pipeline import reports
+
+            reports_dir = reports.reports_dir_from_env()
+            if reports_dir:
+                with span("reports.render", rows=len(prepared.frame)):
+                    alarms = {
+                        "cusum": flagged_cusum["timestamp"],
+                        "bocpe": flagged_bocpe["timestamp"],
+                        "page_hinkley": flagged_high_ph["timestamp"],
+                    }
+                    paths = reports.render_reports(prepared.frame, alarms, reports_dir, formats=("png", "html"))
+                print(f"Daily reports written to {reports_dir} ({len(paths)} files).")
+
+            tables = {
+                "high_risk_regimes": high_risk,
+                "model_flag_disagreements": disagreement,
+                "model_pair_agreement": pair_agreement,
+                "data_quality": prepared.summary.to_frame(),
+                "detector_calibration": pd.DataFrame(
+                    [
+                        {"model": model, **params}
+                        for model, params in detection_results["calibration"].items()
+                    ]
+                ),
+            }
+            metadata = sinks.RunMetadata(
+                run_id=timer.run_id,
+                params=detection_results["calibration"],
+                data_fingerprint=sinks.data_fingerprint(df),
+                input_rows=len(df),
+                table_rows={name: len(table) for name, table in tables.items()},
+            )
+            with span("write.results", rows=sum(metadata.table_rows.values())):
+                # "main" and "write.results" are still open here; their times are in the timing report.
+                metadata.timing = {**timer.report(include_open=False), "report_path": str(report_path)}
+                sinks.sink_from_env().write(tables, metadata)
+
+        timer.write_json(report_path)
+        print(f"Timing report written to {report_path}")
+        return high_risk, disagreement
+    finally:
+        instrumentation.end_run()
 
 
 if __name__ == "__main__":
@@ -0,0 +1,209 @@
+"""
+Data-quality stage run once on the loaded prices, before any detector.
+
+``prepare_prices`` sorts and de-duplicates the frame, drops non-positive
+prices and bars outside the regular session, measures gaps against the
+session calendar (each session runs from the open to its last bar, so early
+closes are not gaps) and stale (repeated) closes, and adds a ``log_return``
+column that every detector entry point uses (``detectors.inputs``). The
+policy decides what happens at gaps:
+
+- ``"mask"``: returns that start a session (the overnight jump), span a
+  missing bar or repeat a stale close are set to NaN and skipped.
+- ``"fill"``: missing bars inside a session are filled with the last close
+  (zero return); the overnight return is still masked.
+- ``"reset"``: as ``"mask"``, and detectors restart at every session
+  (``prepared.reset_sessions``), via the day-parallel runner.
+
+All of it is vectorized; ``QualitySummary`` reports what was found.
+"""
+from __future__ import annotations
+
+import os
+from dataclasses import asdict, dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+POLICIES = ("mask", "fill", "reset")
+POLICY_ENV = "IVTOOL_DQ_POLICY"
+MINUTE_NS = 60 * 10**9
+
+
+@dataclass
+class QualitySummary:
+    policy: str
+    rows_in: int
+    rows_out: int = 0
+    duplicates: int = 0
+    invalid_prices: int = 0
+    outside_session: int = 0
+    sessions: int = 0
+    expected_minutes: int = 0
+    missing_minutes: int = 0
+    intraday_gaps: int = 0
+    largest_gap_minutes: int = 0
+    stale_runs: int = 0
+    stale_minutes: int = 0
+    filled_minutes: int = 0
+    masked_returns: int = 0
+
+    def to_frame(self) -> pd.DataFrame:
+        return pd.DataFrame([asdict(self)])
+
+
+@dataclass
+class PreparedPrices:
+    frame: pd.DataFrame
+    summary: QualitySummary
+
+    @property
+    def reset_sessions(self) -> bool:
+        return self.summary.policy == "reset"
+
+
+def _minute_of_day(clock: str) -> int:
+    hours, minutes = clock.split(":")
+    return int(hours) * 60 + int(minutes)
+
+
+def _run_lengths(keys: np.ndarray) -> tuple[np.ndarray, np.ndarray]:
+    """Start position and length of every run of equal consecutive keys."""
+    if keys.size == 0:
+        return np.empty(0, dtype=np.int64), np.empty(0, dtype=np.int64)
+    starts = np.flatnonzero(np.concatenate([[True], keys[1:] != keys[:-1]]))
+    return starts, np.diff(np.concatenate([starts, [keys.size]]))
+
+
+def _fill_sessions(frame: pd.DataFrame, minutes: np.ndarray, sessions: np.ndarray) -> pd.DataFrame:
+    """Reindexes every session to a full 1-minute grid between its first and last bar, carrying the last close."""
+    starts, lengths = _run_lengths(sessions)
+    first = minutes[starts]
+    last = minutes[starts + lengths - 1]
+    span = last - first + 1
+    grid_session = np.repeat(np.arange(starts.size), span)
+    offsets = np.arange(span.sum()) - np.repeat(np.cumsum(span) - span, span)
+    grid = np.repeat(first, span) + offsets
+
+    # Each grid minute takes the row of the latest bar at or before it (same session by construction).
+    rows = np.searchsorted(minutes, grid, side="right") - 1
+    filled = frame.iloc[rows].reset_index(drop=True)
+    filled["time"] = pd.to_datetime(grid * MINUTE_NS, utc=True)
+    filled["filled"] = minutes[rows] != grid
+    filled["session"] = sessions[starts][grid_session]
+    return filled
+
+
+def prepare_prices(
+    df: pd.DataFrame,
+    policy: str = "mask",
+    calendar_tz: str = "America/New_York",
+    session_open: str = "09:30",
+    session_close: str = "16:00",
+    stale_run: int = 15,
+) -> PreparedPrices:
+    """
+    Cleans a ``time``/``price`` frame and adds ``session`` and ``log_return``.
+    The session calendar is weekdays ``session_open``-``session_close`` in
+    ``calendar_tz``; ``stale_run`` identical closes in a row count as stale.
+    """
+    if policy not in POLICIES:
+        raise ValueError(f"policy must be one of {POLICIES}, got {policy!r}")
+    if stale_run < 2:
+        raise ValueError("stale_run must be >= 2")
+    if "symbol" in df and df["symbol"].nunique() > 1:
+        raise ValueError("prepare_prices expects prices for a single symbol")
+
+    summary = QualitySummary(policy=policy, rows_in=len(df))
+    frame = df.copy()
+    frame["time"] = pd.to_datetime(frame["time"], utc=True)
+    frame["price"] = pd.to_numeric(frame["price"], errors="coerce")
+    frame = frame.sort_values("time", kind="stable")
+
+    duplicated = frame.duplicated("time", keep="last").to_numpy()
+    summary.duplicates = int(duplicated.sum())
+    valid = frame["price"].to_numpy() > 0.0  # also rejects NaN
+    summary.invalid_prices = int((~valid & ~duplicated).sum())
+    frame = frame[~duplicated & valid]
+
+    local = pd.DatetimeIndex(frame["time"]).tz_convert(calendar_tz)
+    minute_of_day = local.hour * 60 + local.minute
+    open_minute, close_minute = _minute_of_day(session_open), _minute_of_day(session_close)
+    inside = np.asarray((minute_of_day >= open_minute) & (minute_of_day < close_minute) & (local.weekday < 5))
+    summary.outside_session = int((~inside).sum())
+    frame = frame[inside].reset_index(drop=True)
+    local = local[inside]
+
+    sessions, _ = pd.factorize(local.normalize())
+    sessions = sessions.astype(np.int64)
+    minutes = frame["time"].to_numpy(dtype="datetime64[ns]").astype(np.int64) // MINUTE_NS
+    session_starts, session_lengths = _run_lengths(sessions)
+    summary.sessions = int(session_starts.size)
+    # A session is expected from the open to its last bar, so the unplayed
+    # half of an early close is not counted as missing (nor is a truncated tail).
+    last_bar = np.asarray(minute_of_day)[inside][session_starts + session_lengths - 1]
+    summary.expected_minutes = int((last_bar + 1 - open_minute).sum())
+    summary.missing_minutes = summary.expected_minutes - len(frame)
+
+    steps = np.diff(minutes, prepend=minutes[:1])
+    new_session = np.zeros(len(frame), dtype=bool)
+    new_session[session_starts] = True
+    gap = (steps > 1) & ~new_session
+    summary.intraday_gaps = int(gap.sum())
+    summary.largest_gap_minutes = int(steps[gap].max() - 1) if gap.any() else 0
+
+    prices = frame["price"].to_numpy(dtype=np.float64)
+    # Stale runs: identical closes on consecutive bars of one session.
+    run_keys = np.cumsum(np.concatenate([[True], (prices[1:] != prices[:-1]) | new_session[1:] | gap[1:]]))
+    run_starts, run_lengths = _run_lengths(run_keys)
+    run_ids = run_keys - 1
+    is_stale_run = run_lengths >= stale_run
+    summary.stale_runs = int(is_stale_run.sum())
+    summary.stale_minutes = int((run_lengths[is_stale_run] - 1).sum())
+    # Every bar of a stale run after its first repeats the previous close.
+    stale = is_stale_run[run_ids] & (np.arange(len(frame)) != run_starts[run_ids])
+
+    if policy == "fill":
+        frame["session"] = sessions
+        frame = _fill_sessions(frame, minutes, sessions)
+        summary.filled_minutes = int(frame["filled"].sum())
+        prices = frame["price"].to_numpy(dtype=np.float64)
+        session_ids = frame["session"].to_numpy()
+        new_session = np.zeros(len(frame), dtype=bool)
+        new_session[:1] = True
+        new_session[1:] = session_ids[1:] != session_ids[:-1]
+        mask = new_session
+    else:
+        frame["session"] = sessions
+        mask = new_session | gap | stale
+
+    log_returns = np.empty(len(frame))
+    log_returns[:1] = np.nan
+    log_returns[1:] = np.log(prices[1:] / prices[:-1])
+    log_returns[mask] = np.nan
+    frame["log_return"] = log_returns
+    summary.masked_returns = int(mask.sum())
+    summary.rows_out = len(frame)
+    return PreparedPrices(frame=frame, summary=summary)
+
+
+def policy_from_env() -> str:
+    return os.getenv(POLICY_ENV, "mask").strip().lower()
+
+
+def print_summary(summary: QualitySummary) -> None:
+    print(
+        f"Data quality ({summary.policy}): {summary.rows_in} rows in, {summary.rows_out} out; "
+        f"{summary.duplicates} duplicates, {summary.invalid_prices} invalid prices, "
+        f"{summary.outside_session} outside the session; {summary.sessions} sessions with "
+        f"{summary.missing_minutes} missing minutes in {summary.intraday_gaps} gaps; "
+        f"{summary.stale_runs} stale runs ({summary.stale_minutes} minutes); {summary.masked_returns} returns masked."
+    )
+
@@ -0,0 +1,446 @@
+"""
+In-memory index over detector regimes, and a local query service.
+
+The regime outputs (``page_hinkley_high_risk_regimes``,
+``bocpe_high_risk_regimes``, ``high_risk_regimes``) list flagged minute bars.
+``RegimeIndex`` collapses each source's bars into disjoint half-open
+``[start, stop)`` intervals (a bar covers its minute) kept as two sorted
+int64 arrays. Because the intervals are disjoint, ``stop`` is sorted too, so
+a point lookup is one ``searchsorted`` and a range lookup two, O(log n) plus
+the matches. New alarms are appended at the tail in amortised O(1); an alarm
+older than the tail is merged in with one O(n) pass.
+
+``RegimeService`` serves the index over HTTP on localhost or a Unix socket:
+
+    GET  /regime?t=2024-03-04T15:00Z[&source=high_risk]    (or t=ns:<int>)
+    GET  /overlaps?start=...&end=...[&source=...]
+    POST /alarms   {"source": "cusum", "timestamps": [...]}
+                   {"source": "cusum", "start": ..., "end": ...}
+    GET  /stats
+
+Encoded GET responses are kept in an LRU cache that is cleared on every
+update.
+
+Usage:
+    python -m src.ivtool.pipeline.regime_index --csv high_risk_regimes.csv --port 8765
+    python -m src.ivtool.pipeline.regime_index --csv high_risk_regimes.csv --unix /tmp/ivtool-regimes.sock
+"""
+from __future__ import annotations
+
+import argparse
+import http.client
+import json
+import os
+import socket
+import socketserver
+import threading
+from collections import OrderedDict
+from collections.abc import Iterable, Mapping, Sequence
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+from urllib.parse import parse_qs, urlsplit
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+from src.ivtool.pipeline.consensus import MINUTE_NS, merge_intervals, to_ns
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+DEFAULT_CACHE_SIZE = 4096
+DEFAULT_PORT = 8765
+
+
+def _ns(value: Any) -> int:
+    """
+    UTC nanoseconds from an int (already ns), an ``"ns:<int>"`` string or any
+    timestamp-like value. Bare digit strings are dates (``"20240304"``), not ns.
+    """
+    if isinstance(value, (int, np.integer)):
+        return int(value)
+    if isinstance(value, str) and value.startswith("ns:"):
+        return int(value[3:])
+    timestamp = pd.Timestamp(value)
+    timestamp = timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+    return int(timestamp.value)
+
+
+def _iso(ns: int) -> str:
+    return pd.Timestamp(int(ns), tz="UTC").isoformat()
+
+
+class _Intervals:
+    """
+    Disjoint ``[start, stop)`` intervals of one source in growable buffers.
+    Readers take ``snapshot()``, a consistent ``(starts, stops)`` view; writers
+    swap in a new ``(starts, stops, size)`` tuple, so a view is never torn.
+    """
+
+    def __init__(self) -> None:
+        self._state = (np.empty(16, np.int64), np.empty(16, np.int64), 0)
+
+    def __len__(self) -> int:
+        return self._state[2]
+
+    def snapshot(self) -> tuple[np.ndarray, np.ndarray]:
+        starts, stops, size = self._state
+        return starts[:size], stops[:size]
+
+    def add(self, starts: np.ndarray, stops: np.ndarray) -> None:
+        """Adds intervals sorted by start (callers hold the index lock)."""
+        buffer_starts, buffer_stops, size = self._state
+        if size and starts[0] < buffer_stops[size - 1]:
+            # Reaches into the indexed history: merge everything once.
+            all_starts = np.concatenate([buffer_starts[:size], starts])
+            all_stops = np.concatenate([buffer_stops[:size], stops])
+            order = np.argsort(all_starts, kind="stable")
+            merged_starts, merged_stops = merge_intervals(all_starts[order], all_stops[order])
+            self._state = (merged_starts, merged_stops, merged_starts.size)
+            return
+
+        starts, stops = merge_intervals(starts, stops)
+        if size and starts[0] == buffer_stops[size - 1]:
+            # Touches the last interval: extend it in place.
+            buffer_stops[size - 1] = max(buffer_stops[size - 1], stops[0])
+            starts, stops = starts[1:], stops[1:]
+        needed = size + starts.size
+        if needed > buffer_starts.size:
+            capacity = max(needed, 2 * buffer_starts.size)
+            buffer_starts = np.concatenate([buffer_starts[:size], np.empty(capacity - size, np.int64)])
+            buffer_stops = np.concatenate([buffer_stops[:size], np.empty(capacity - size, np.int64)])
+        buffer_starts[size:needed] = starts
+        buffer_stops[size:needed] = stops
+        self._state = (buffer_starts, buffer_stops, needed)
+
+
+class RegimeIndex:
+    """
+    Regime intervals per source (``high_risk``, ``bocpe``, ``page_hinkley``,
+    ...). ``add_bars`` takes flagged bar timestamps, ``add_interval`` one
+    ``[start, stop)`` interval; both may be called while queries run.
+    """
+
+    def __init__(self, bar_ns: int = MINUTE_NS) -> None:
+        self.bar_ns = int(bar_ns)
+        self._sources: dict[str, _Intervals] = {}
+        self._lock = threading.Lock()
+        self.version = 0
+
+    @property
+    def sources(self) -> list[str]:
+        return list(self._sources)
+
+    def __len__(self) -> int:
+        return sum(len(intervals) for intervals in self._sources.values())
+
+    def intervals(self, source: str) -> tuple[np.ndarray, np.ndarray]:
+        """``(starts, stops)`` int64 ns of ``source``, sorted and disjoint."""
+        return self._sources[source].snapshot()
+
+    def _add(self, source: str, starts: np.ndarray, stops: np.ndarray) -> None:
+        if starts.size == 0:
+            return
+        with self._lock:
+            self._sources.setdefault(source, _Intervals()).add(starts, stops)
+            self.version += 1
+
+    def add_bars(self, source: str, timestamps: Iterable) -> None:
+        """Adds flagged bars; each covers ``[t, t + bar_ns)``, so consecutive bars form one interval."""
+        if isinstance(timestamps, np.ndarray) and timestamps.dtype == np.int64:
+            bars = np.unique(timestamps)
+        else:
+            bars = np.unique(to_ns(timestamps))
+        self._add(source, bars, bars + self.bar_ns)
+
+    def add_interval(self, source: str, start: Any, stop: Any) -> None:
+        start_ns, stop_ns = _ns(start), _ns(stop)
+        if stop_ns <= start_ns:
+            raise ValueError("stop must be after start")
+        self._add(source, np.array([start_ns]), np.array([stop_ns]))
+
+    def add_frame(self, source: str, frame: pd.DataFrame) -> None:
+        """Adds a regime output frame (``timestamp`` column of flagged bars)."""
+        self.add_bars(source, frame["timestamp"])
+
+    def _selected(self, source: str | None) -> list[str]:
+        if source is None:
+            return list(self._sources)
+        if source not in self._sources:
+            raise KeyError(f"unknown regime source {source!r}")
+        return [source]
+
+    def at(self, t: Any, source: str | None = None) -> list[tuple[str, int, int]]:
+        """``(source, start, stop)`` of every regime containing ``t``."""
+        t_ns = _ns(t)
+        hits: list[tuple[str, int, int]] = []
+        for name in self._selected(source):
+            starts, stops = self._sources[name].snapshot()
+            i = int(np.searchsorted(starts, t_ns, side="right")) - 1
+            if i >= 0 and stops[i] > t_ns:
+                hits.append((name, int(starts[i]), int(stops[i])))
+        return hits
+
+    def contains(self, source: str, t: Any) -> bool:
+        return bool(self.at(t, source))
+
+    def overlapping(self, start: Any, end: Any, source: str | None = None) -> list[tuple[str, int, int]]:
+        """``(source, start, stop)`` of every regime that overlaps the closed range ``[start, end]``."""
+        start_ns, end_ns = _ns(start), _ns(end)
+        if end_ns < start_ns:
+            raise ValueError("end must not be before start")
+        hits: list[tuple[str, int, int]] = []
+        for name in self._selected(source):
+            starts, stops = self._sources[name].snapshot()
+            lo = int(np.searchsorted(stops, start_ns, side="right"))
+            hi = int(np.searchsorted(starts, end_ns, side="right"))
+            hits.extend((name, int(s), int(e)) for s, e in zip(starts[lo:hi], stops[lo:hi]))
+        return hits
+
+    def to_frame(self) -> pd.DataFrame:
+        rows = [
+            (name, start, stop)
+            for name, intervals in self._sources.items()
+            for start, stop in zip(*intervals.snapshot())
+        ]
+        frame = pd.DataFrame(rows, columns=["source", "start", "stop"])
+        frame["start"] = pd.to_datetime(frame["start"].astype(np.int64), utc=True)
+        frame["stop"] = pd.to_datetime(frame["stop"].astype(np.int64), utc=True)
+        return frame
+
+
+def index_from_tables(tables: Mapping[str, pd.DataFrame], bar_ns: int = MINUTE_NS) -> RegimeIndex:
+    """Index over regime frames keyed by source name, e.g. ``{"high_risk": high_risk_regimes(...)}``."""
+    index = RegimeIndex(bar_ns)
+    for source, frame in tables.items():
+        index.add_frame(source, frame)
+    return index
+
+
+def index_from_csv(paths: Sequence[str], bar_ns: int = MINUTE_NS) -> RegimeIndex:
+    """Index over regime CSVs, one source per file named after its stem (``high_risk_regimes``)."""
+    return index_from_tables({Path(path).stem: pd.read_csv(path) for path in paths}, bar_ns)
+
+
+class ResponseCache:
+    """LRU of encoded responses, valid for one index ``version``."""
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE) -> None:
+        self.maxsize = maxsize
+        self._entries: OrderedDict[str, bytes] = OrderedDict()
+        self._version = -1
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str, version: int) -> bytes | None:
+        with self._lock:
+            if version != self._version:
+                self._entries.clear()
+                self._version = version
+            body = self._entries.get(key)
+            if body is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return body
+
+    def put(self, key: str, version: int, body: bytes) -> None:
+        with self._lock:
+            if version != self._version or self.maxsize <= 0:
+                return
+            self._entries[key] = body
+            if len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+def _regimes(hits: list[tuple[str, int, int]]) -> list[dict[str, str]]:
+    return [{"source": name, "start": _iso(start), "end": _iso(stop)} for name, start, stop in hits]
+
+
+class _Handler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out as separate writes; Nagle would hold the body back.
+    disable_nagle_algorithm = True
+    server: Any
+
+    def log_message(self, format: str, *args: Any) -> None:
+        pass
+
+    def _send(self, status: int, body: bytes) -> None:
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _error(self, status: int, message: str) -> None:
+        self._send(status, json.dumps({"error": message}).encode())
+
+    def do_GET(self) -> None:
+        service: RegimeService = self.server.service
+        version = service.index.version
+        body = service.cache.get(self.path, version)
+        if body is None:
+            try:
+                payload = service.answer(self.path)
+            except KeyError as exc:
+                return self._error(404, str(exc.args[0]))
+            except (ValueError, TypeError) as exc:
+                return self._error(400, str(exc))
+            body = json.dumps(payload).encode()
+            if self.path != "/stats":
+                service.cache.put(self.path, version, body)
+        self._send(200, body)
+
+    def do_POST(self) -> None:
+        service: RegimeService = self.server.service
+        if urlsplit(self.path).path != "/alarms":
+            return self._error(404, f"unknown path {self.path!r}")
+        try:
+            alarm = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))) or b"{}")
+            service.ingest(alarm)
+        except (ValueError, TypeError, KeyError) as exc:
+            return self._error(400, str(exc))
+        self._send(200, json.dumps({"version": service.index.version, "intervals": len(service.index)}).encode())
+
+
+class _UnixHandler(_Handler):
+    disable_nagle_algorithm = False  # TCP only
+
+
+class _TCPHTTPServer(ThreadingHTTPServer):
+    service: RegimeService
+
+
+class _UnixHTTPServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    daemon_threads = True
+    service: RegimeService
+
+    def get_request(self) -> tuple[socket.socket, tuple[str, int]]:
+        request, _ = super().get_request()
+        # BaseHTTPRequestHandler expects a (host, port) client address.
+        return request, ("local", 0)
+
+
+class RegimeService:
+    """
+    Serves a ``RegimeIndex`` on ``host:port`` or, with ``unix_socket``, on a
+    Unix socket. ``start()`` runs it in a daemon thread; ``serve_forever()``
+    blocks.
+    """
+
+    def __init__(
+        self,
+        index: RegimeIndex,
+        host: str = "127.0.0.1",
+        port: int = DEFAULT_PORT,
+        unix_socket: str | None = None,
+        cache_size: int = DEFAULT_CACHE_SIZE,
+    ) -> None:
+        self.index = index
+        self.cache = ResponseCache(cache_size)
+        self.unix_socket = unix_socket
+        if unix_socket:
+            if os.path.exists(unix_socket):
+                os.unlink(unix_socket)
+            self.server: _UnixHTTPServer | _TCPHTTPServer = _UnixHTTPServer(unix_socket, _UnixHandler)
+        else:
+            self.server = _TCPHTTPServer((host, port), _Handler)
+        self.server.service = self
+        self._thread: threading.Thread | None = None
+
+    @property
+    def address(self) -> Any:
+        return self.server.server_address
+
+    def answer(self, path: str) -> dict[str, Any]:
+        parts = urlsplit(path)
+        query = {key: values[-1] for key, values in parse_qs(parts.query).items()}
+        source = query.get("source")
+        if parts.path == "/regime":
+            if "t" not in query:
+                raise ValueError("missing query parameter 't'")
+            hits = self.index.at(query["t"], source)
+            return {"t": _iso(_ns(query["t"])), "in_regime": bool(hits), "regimes": _regimes(hits)}
+        if parts.path == "/overlaps":
+            if "start" not in query or "end" not in query:
+                raise ValueError("missing query parameter 'start' or 'end'")
+            return {"regimes": _regimes(self.index.overlapping(query["start"], query["end"], source))}
+        if parts.path == "/stats":
+            return {
+                "sources": {name: len(self.index.intervals(name)[0]) for name in self.index.sources},
+                "version": self.index.version,
+                "cache_entries": len(self.cache),
+                "cache_hits": self.cache.hits,
+                "cache_misses": self.cache.misses,
+            }
+        raise KeyError(f"unknown path {parts.path!r}")
+
+    def ingest(self, alarm: Mapping[str, Any]) -> None:
+        """Applies one ``POST /alarms`` body: bar ``timestamps`` or a ``start``/``end`` interval."""
+        source = alarm["source"]
+        if "timestamps" in alarm:
+            self.index.add_bars(source, alarm["timestamps"])
+        else:
+            self.index.add_interval(source, alarm["start"], alarm["end"])
+
+    def start(self) -> RegimeService:
+        self._thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self._thread.start()
+        return self
+
+    def serve_forever(self) -> None:
+        self.server.serve_forever()
+
+    def close(self) -> None:
+        if self._thread is not None:
+            self.server.shutdown()
+            self._thread.join()
+        self.server.server_close()
+        if self.unix_socket and os.path.exists(self.unix_socket):
+            os.unlink(self.unix_socket)
+
+
+class UnixHTTPConnection(http.client.HTTPConnection):
+    """``http.client`` connection to a service listening on a Unix socket."""
+
+    def __init__(self, path: str, timeout: float = 5.0) -> None:
+        super().__init__("localhost", timeout=timeout)
+        self.socket_path = path
+
+    def connect(self) -> None:
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.settimeout(self.timeout)
+        self.sock.connect(self.socket_path)
+
+
+def main(argv: Sequence[str] | None = None) -> None:
+    parser = argparse.ArgumentParser(description="Serve point and range lookups over detector regimes")
+    parser.add_argument("--csv", nargs="+", default=["high_risk_regimes.csv"], help="regime CSVs with a timestamp column")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", default=None, help="serve on this Unix socket instead of TCP")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE)
+    args = parser.parse_args(argv)
+
+    index = index_from_csv(args.csv)
+    service = RegimeService(index, args.host, args.port, unix_socket=args.unix, cache_size=args.cache_size)
+    print(f"Serving {len(index)} regime intervals from {', '.join(index.sources)} on {service.address}")
+    try:
+        service.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        service.close()
+
+
+if __name__ == "__main__":
+    main()
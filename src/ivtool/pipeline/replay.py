@@ -0,0 +1,324 @@
+"""
+Bounded-memory replay of price history through the streaming detectors.
+
+A replay is a generator pipeline:
+
+    source chunks -> ticks (ordered, paced) -> MultiScaleMonitor -> events
+
+Sources yield ``(timestamps_ns, prices)`` chunks and never hold more than one
+chunk: ``csv_chunks`` (pandas ``chunksize``), ``parquet_chunks`` (pyarrow
+``iter_batches``) and ``db_chunks`` (``PriceStore.iter_range``). ``replay``
+yields each ``ScaleAlarm`` as it is raised plus a ``ReplayProgress`` record
+every ``progress_every`` ticks, so memory stays constant with history length.
+``speed=None`` replays as fast as possible; ``speed=60`` plays one market
+hour per wall-clock minute.
+
+Usage:
+    python -m src.ivtool.pipeline.replay --csv prices.csv --scales 1 5 --out replay_alarms.csv
+    python -m src.ivtool.pipeline.replay --csv research/test_prices.csv --sort
+    python -m src.ivtool.pipeline.replay --db --table SPY_DATA_V2 --speed 600
+"""
+from __future__ import annotations
+
+import argparse
+import csv
+import io
+import math
+import os
+import sys
+import time
+from collections.abc import Callable, Iterable, Iterator, Mapping, Sequence
+from dataclasses import dataclass
+from typing import (
+    TYPE_CHECKING,
+    Any,
+)
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+from src.ivtool.pipeline.instrumentation import peak_rss_mb
+from src.ivtool.pipeline.resample import DETECTORS, MultiScaleMonitor, ScaleAlarm
+
+if TYPE_CHECKING:
+    import pandas as pd
+
+    from src.ivtool.storage import PriceStore
+else:
+    pd = lazy_module("pandas")
+
+DEFAULT_CHUNKSIZE = 50_000
+# Ticks between drops of the alarm history the detectors keep, whatever ``progress_every`` is.
+DISCARD_EVERY = 10_000
+TIME_COLUMNS = ("time", "timestamp")
+
+Chunk = tuple[np.ndarray, np.ndarray]
+
+
+@dataclass(frozen=True)
+class ReplayProgress:
+    ticks: int
+    alarms: int
+    last_timestamp: int
+    wall_s: float
+    ticks_per_s: float
+    peak_rss_mb: float | None
+
+
+ReplayEvent = ScaleAlarm | ReplayProgress
+
+
+def _to_ns(values: Any) -> np.ndarray:
+    return pd.to_datetime(values, utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def _chunk_from_frame(frame: pd.DataFrame, time_column: str | None) -> Chunk:
+    frame.columns = [str(column).strip() for column in frame.columns]
+    column = time_column or next((name for name in TIME_COLUMNS if name in frame.columns), None)
+    if column is None:
+        raise ValueError(f"no time column; expected one of {TIME_COLUMNS}")
+    times = frame[column]
+    if times.dtype == object:
+        times = times.str.strip()
+    return _to_ns(times), frame["price"].to_numpy(dtype=np.float64)
+
+
+def csv_chunks(
+    path: str,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    time_column: str | None = None,
+    descending: bool | None = None,
+) -> Iterator[Chunk]:
+    """
+    Chunks of a time-ordered CSV with a ``time`` (or ``timestamp``) and a
+    ``price`` column. Newest-first files, like the exported samples, are read
+    back to front so the chunks come out ascending; ``descending=None``
+    decides from the first chunk.
+    """
+    frames = pd.read_csv(path, chunksize=chunksize, skipinitialspace=True)
+    first = next(iter(frames), None)
+    if first is None:
+        return
+    chunk = _chunk_from_frame(first, time_column)
+    if descending is None:
+        descending = chunk[0].size > 1 and chunk[0][0] > chunk[0][-1]
+    if descending:
+        frames.close()
+        yield from _reversed_csv_chunks(path, chunksize, time_column)
+        return
+    yield chunk
+    for frame in frames:
+        yield _chunk_from_frame(frame, time_column)
+
+
+def _reversed_csv_chunks(path: str, chunksize: int, time_column: str | None) -> Iterator[Chunk]:
+    """Chunks of a newest-first CSV from its last line to its first, each reversed into ascending order."""
+    with open(path, "rb") as handle:
+        header = handle.readline()
+        offsets = []
+        for i, line in enumerate(iter(handle.readline, b"")):
+            if i % chunksize == 0:
+                offsets.append(handle.tell() - len(line))
+        offsets.append(handle.tell())
+        for lo, hi in zip(reversed(offsets[:-1]), reversed(offsets[1:])):
+            handle.seek(lo)
+            frame = pd.read_csv(io.BytesIO(header + handle.read(hi - lo)), skipinitialspace=True)
+            timestamps, prices = _chunk_from_frame(frame, time_column)
+            yield timestamps[::-1], prices[::-1]
+
+
+def sorted_csv_chunks(path: str, chunksize: int = DEFAULT_CHUNKSIZE, time_column: str | None = None) -> Iterator[Chunk]:
+    """
+    Chunks of a CSV that is in no particular order, such as several
+    overlapping exports pasted together: the whole file is loaded, sorted by
+    time and repeated timestamps keep their last row. Only for files that fit
+    in memory.
+    """
+    timestamps, prices = _chunk_from_frame(pd.read_csv(path, skipinitialspace=True), time_column)
+    order = np.argsort(timestamps, kind="stable")
+    timestamps, prices = timestamps[order], prices[order]
+    keep = np.append(timestamps[1:] != timestamps[:-1], True)
+    timestamps, prices = timestamps[keep], prices[keep]
+    for lo in range(0, len(timestamps), chunksize):
+        yield timestamps[lo: lo + chunksize], prices[lo: lo + chunksize]
+
+
+def parquet_chunks(path: str, batch_size: int = DEFAULT_CHUNKSIZE, time_column: str | None = None) -> Iterator[Chunk]:
+    """Record batches of a time-ordered Parquet file, reading only the time and price columns."""
+    try:
+        import pyarrow.parquet as pq
+    except ImportError as exc:
+        raise ImportError("parquet_chunks requires pyarrow (pip install pyarrow)") from exc
+
+    parquet = pq.ParquetFile(path)
+    names = parquet.schema_arrow.names
+    column = time_column or next((name for name in TIME_COLUMNS if name in names), None)
+    if column is None:
+        raise ValueError(f"no time column; expected one of {TIME_COLUMNS}")
+    for batch in parquet.iter_batches(batch_size=batch_size, columns=[column, "price"]):
+        yield _chunk_from_frame(batch.to_pandas(), column)
+
+
+def db_chunks(
+    store: PriceStore | None = None,
+    symbol: str | None = None,
+    chunksize: int = DEFAULT_CHUNKSIZE,
+    start: Any | None = None,
+    end: Any | None = None,
+) -> Iterator[Chunk]:
+    """
+    Streams ``time, price`` rows ordered by time through ``store.iter_range``
+    (a server-side cursor on Postgres), ``chunksize`` rows at a time.
+    """
+    if store is None:
+        from src.ivtool.storage import store_from_env
+
+        store = store_from_env()
+    for frame in store.iter_range(symbol, start, end, chunksize):
+        yield _to_ns(frame["time"]), frame["price"].to_numpy(dtype=np.float64)
+
+
+def ticks(chunks: Iterable[Chunk]) -> Iterator[tuple[int, float]]:
+    """Flattens chunks into ``(timestamp_ns, price)`` ticks, rejecting out-of-order input."""
+    last = None
+    for timestamps, prices in chunks:
+        if timestamps.size == 0:
+            continue
+        if np.any(np.diff(timestamps) < 0) or (last is not None and timestamps[0] < last):
+            raise ValueError("replay sources must be sorted by time ascending; use sorted_csv_chunks (--sort) for unordered CSVs")
+        last = int(timestamps[-1])
+        yield from zip(timestamps.tolist(), prices.tolist())
+
+
+def paced(
+    stream: Iterable[tuple[int, float]],
+    speed: float | None,
+    max_pause_s: float | None = None,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[tuple[int, float]]:
+    """
+    Releases ticks no faster than ``speed`` times market time. Pauses longer
+    than ``max_pause_s`` (overnight, weekends) are cut to ``max_pause_s``.
+    """
+    if not speed:
+        yield from stream
+        return
+    if speed < 0:
+        raise ValueError("speed must be positive")
+    origin_wall = None
+    market_elapsed = 0.0
+    previous = None
+    for timestamp, price in stream:
+        if origin_wall is None or previous is None:
+            origin_wall = clock()
+        else:
+            pause = (timestamp - previous) / 1e9 / speed
+            if max_pause_s is not None:
+                pause = min(pause, max_pause_s)
+            market_elapsed += pause
+            ahead = origin_wall + market_elapsed - clock()
+            if ahead > 0.0:
+                sleep(ahead)
+        previous = timestamp
+        yield timestamp, price
+
+
+def replay(
+    chunks: Iterable[Chunk],
+    scales: Sequence[int] = (1,),
+    detectors: Sequence[str] = DETECTORS,
+    params: Mapping[str, Mapping[str, float]] | None = None,
+    speed: float | None = None,
+    max_pause_s: float | None = None,
+    progress_every: int = 100_000,
+    clock: Callable[[], float] = time.monotonic,
+    sleep: Callable[[float], None] = time.sleep,
+) -> Iterator[ReplayEvent]:
+    """Streams ``chunks`` through a ``MultiScaleMonitor``, yielding alarms and progress as they happen."""
+    monitor = MultiScaleMonitor(scales=scales, detectors=detectors, params=params)
+    started = clock()
+    count = alarms = 0
+    last_timestamp = 0
+
+    def progress() -> ReplayProgress:
+        wall = clock() - started
+        return ReplayProgress(count, alarms, last_timestamp, wall, count / wall if wall > 0 else math.inf, peak_rss_mb())
+
+    for timestamp, price in paced(ticks(chunks), speed, max_pause_s, clock, sleep):
+        for alarm in monitor.update(timestamp, price):
+            alarms += 1
+            yield alarm
+        count += 1
+        last_timestamp = timestamp
+        if count % DISCARD_EVERY == 0:
+            monitor.discard_history()
+        if progress_every and count % progress_every == 0:
+            yield progress()
+    for alarm in monitor.flush():
+        alarms += 1
+        yield alarm
+    yield progress()
+
+
+def main(argv: Sequence[str] | None = None) -> ReplayProgress | None:
+    parser = argparse.ArgumentParser(description="Replay price history through the streaming detectors")
+    source = parser.add_mutually_exclusive_group(required=True)
+    source.add_argument("--csv")
+    parser.add_argument("--sort", action="store_true", help="load the whole CSV and sort it by time first")
+    source.add_argument("--parquet")
+    source.add_argument("--db", action="store_true", help="stream from DATABASE_URL2")
+    parser.add_argument("--table", default="SPY_DATA_V2")
+    parser.add_argument("--symbol", default=None)
+    parser.add_argument("--chunksize", type=int, default=DEFAULT_CHUNKSIZE)
+    parser.add_argument("--scales", type=int, nargs="+", default=[1])
+    parser.add_argument("--detectors", nargs="+", default=list(DETECTORS))
+    parser.add_argument("--speed", type=float, default=None, help="market seconds per wall second; default max speed")
+    parser.add_argument("--max-pause", type=float, default=None, help="cap on paced pauses, in wall seconds")
+    parser.add_argument("--progress-every", type=int, default=100_000)
+    parser.add_argument("--out", default="replay_alarms.csv")
+    args = parser.parse_args(argv)
+    if args.sort and not args.csv:
+        parser.error("--sort only applies to --csv")
+
+    if args.csv and args.sort:
+        chunks = sorted_csv_chunks(args.csv, args.chunksize)
+    elif args.csv:
+        chunks = csv_chunks(args.csv, args.chunksize)
+    elif args.parquet:
+        chunks = parquet_chunks(args.parquet, args.chunksize)
+    else:
+        from src.ivtool.storage import store_from_env
+
+        chunks = db_chunks(store_from_env(args.table), args.symbol, args.chunksize)
+
+    try:
+        return _write_alarms(args, chunks)
+    except Exception:
+        # Don't leave a file behind that looks like a clean replay. An interrupt
+        # (Ctrl-C) keeps the alarms written so far.
+        if os.path.exists(args.out):
+            os.remove(args.out)
+        raise
+
+
+def _write_alarms(args: argparse.Namespace, chunks: Iterable[Chunk]) -> ReplayProgress | None:
+    final = None
+    with open(args.out, "w", newline="") as handle:
+        writer = csv.writer(handle)
+        writer.writerow(["timestamp", "minutes", "detector", "kind"])
+        for event in replay(chunks, args.scales, args.detectors, speed=args.speed, max_pause_s=args.max_pause, progress_every=args.progress_every):
+            if isinstance(event, ScaleAlarm):
+                writer.writerow([pd.Timestamp(event.timestamp, tz="UTC").isoformat(), event.minutes, event.detector, event.kind])
+                continue
+            final = event
+            print(
+                f"{event.ticks} ticks, {event.alarms} alarms, {event.ticks_per_s:,.0f} ticks/s, "
+                f"peak RSS {event.peak_rss_mb or 0:.1f} MB",
+                file=sys.stderr,
+            )
+    return final
+
+
+if __name__ == "__main__":
+    main()
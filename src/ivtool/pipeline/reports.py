@@ -0,0 +1,319 @@
+"""
+Batch rendering of daily volatility reports.
+
+``plot_daily_volatility`` filters the whole frame once per day and blocks on
+``plt.show()``. Here the frame is indexed by session once (``day_slices``),
+each day's price and 30-minute rolling volatility are downsampled with LTTB
+(largest triangle three buckets) to ``max_points``, and the alarms of every
+detector are located in their day with one ``searchsorted``. The small
+per-day jobs are then rendered headless (Agg backend) in a process pool, as
+PNG and/or a self-contained HTML page with the alarm counts.
+
+Alarm markers are drawn at their exact times, so downsampling never hides one.
+
+Usage:
+    python -m src.ivtool.pipeline.reports --sessions 21 --out reports --formats png html
+"""
+from __future__ import annotations
+
+import argparse
+import base64
+import html
+import io
+import math
+import os
+import time
+from collections.abc import Mapping, Sequence
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+from src.ivtool.pipeline.day_parallel import SESSION_TZ, session_codes
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+FORMATS = ("png", "html")
+REPORTS_ENV = "IVTOOL_REPORTS_DIR"
+DEFAULT_MAX_POINTS = 500
+ROLLING_WINDOW = 30
+DETECTOR_STYLES = {
+    "cusum": ("tab:red", "*"),
+    "bocpe": ("tab:purple", "D"),
+    "page_hinkley": ("tab:orange", "^"),
+    "baseline": ("tab:red", "*"),
+}
+
+
+@dataclass(frozen=True)
+class DayJob:
+    day: str
+    times: np.ndarray
+    price: np.ndarray
+    rolling_std: np.ndarray
+    alarms: dict[str, tuple[np.ndarray, np.ndarray]]
+    threshold: float | None
+    points: int
+
+
+def _to_ns(values: Any) -> np.ndarray:
+    return pd.DatetimeIndex(pd.to_datetime(values, utc=True)).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+
+
+def _local(ns: np.ndarray) -> pd.DatetimeIndex:
+    # Wall-clock New York time, which is what the session axis is read in.
+    return pd.DatetimeIndex(ns.astype("datetime64[ns]")).tz_localize("UTC").tz_convert(SESSION_TZ).tz_localize(None)
+
+
+def day_slices(timestamps: Any) -> dict[str, slice]:
+    """Position slice of every session (New York calendar date) in sorted ``timestamps``, computed in one pass."""
+    codes, sessions = session_codes(timestamps)
+    if codes.size and np.any(np.diff(codes) < 0):
+        raise ValueError("timestamps must be sorted")
+    bounds = np.searchsorted(codes, np.arange(len(sessions) + 1))
+    return {
+        str(day.date()): slice(int(start), int(stop))
+        for day, start, stop in zip(sessions, bounds[:-1], bounds[1:])
+    }
+
+
+def lttb(x: np.ndarray, y: np.ndarray, n_out: int) -> np.ndarray:
+    """
+    Indices of the ``n_out`` points Largest-Triangle-Three-Buckets keeps. The
+    first and last points are always kept; each bucket in between keeps the
+    point spanning the largest triangle with the previous pick and the mean
+    of the next bucket, which preserves spikes a stride would drop.
+    """
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = x.size
+    if n_out >= n or n_out < 3:
+        return np.arange(n)
+
+    edges = np.linspace(1, n - 1, n_out - 1).astype(np.int64)
+    picks = np.empty(n_out, dtype=np.int64)
+    picks[0], picks[-1] = 0, n - 1
+    previous = 0
+    for bucket in range(n_out - 2):
+        start, stop = edges[bucket], edges[bucket + 1]
+        next_stop = edges[bucket + 2] if bucket + 2 < edges.size else n
+        next_x = x[stop:next_stop].mean()
+        next_y = y[stop:next_stop].mean()
+        area = np.abs(
+            (x[previous] - next_x) * (y[start:stop] - y[previous])
+            - (x[previous] - x[start:stop]) * (next_y - y[previous])
+        )
+        previous = start + int(np.argmax(area))
+        picks[bucket + 1] = previous
+    return picks
+
+
+def report_jobs(
+    df: pd.DataFrame,
+    alarms: Mapping[str, Any],
+    days: Sequence[str] | None = None,
+    max_points: int = DEFAULT_MAX_POINTS,
+    threshold: float | None = None,
+) -> list[DayJob]:
+    """
+    One downsampled ``DayJob`` per day of a ``time``/``price`` frame, with the
+    ``alarms`` (detector -> alarm timestamps) that fall on that day.
+    ``threshold`` defaults to the 95th percentile of the rolling volatility.
+    """
+    df = df.sort_values("time").reset_index(drop=True)
+    times = _to_ns(df["time"])
+    price = df["price"].to_numpy(dtype=np.float64)
+    rolling_std = pd.Series(price).pct_change().rolling(ROLLING_WINDOW, min_periods=ROLLING_WINDOW).std().to_numpy()
+    if threshold is None and np.isfinite(rolling_std).any():
+        threshold = float(np.nanquantile(rolling_std, 0.95))
+
+    alarm_ns = {name: np.sort(_to_ns(stamps)) for name, stamps in alarms.items()}
+    index = day_slices(df["time"])
+    selected = index if days is None else {str(day): index[str(day)] for day in days if str(day) in index}
+
+    jobs = []
+    for day, rows in selected.items():
+        day_times = times[rows]
+        keep = lttb(day_times, price[rows], max_points)
+        day_alarms = {}
+        for name, stamps in alarm_ns.items():
+            lo = np.searchsorted(stamps, day_times[0], side="left")
+            hi = np.searchsorted(stamps, day_times[-1], side="right")
+            hits = stamps[lo:hi]
+            # Each alarm is marked at the price of its bar (or the last bar before it).
+            at = np.clip(np.searchsorted(day_times, hits, side="right") - 1, 0, day_times.size - 1)
+            day_alarms[name] = (hits, price[rows][at])
+        jobs.append(DayJob(
+            day=day,
+            times=day_times[keep],
+            price=price[rows][keep],
+            rolling_std=rolling_std[rows][keep],
+            alarms=day_alarms,
+            threshold=threshold,
+            points=day_times.size,
+        ))
+    return jobs
+
+
+def _figure_png(job: DayJob, dpi: int) -> bytes:
+    # A bare Figure on an Agg canvas: headless without touching pyplot's global backend.
+    from matplotlib.backends.backend_agg import FigureCanvasAgg
+    from matplotlib.figure import Figure
+
+    x = _local(job.times)
+    fig = Figure(figsize=(14, 7))
+    FigureCanvasAgg(fig)
+    ax1 = fig.subplots()
+    ax2 = ax1.twinx()
+    ax1.plot(x, job.price, color="blue", linewidth=1.0, label="price")
+    for name, (stamps, prices) in job.alarms.items():
+        if stamps.size:
+            color, marker = DETECTOR_STYLES.get(name, ("black", "o"))
+            ax1.scatter(_local(stamps), prices, color=color, marker=marker, s=60, label=f"{name} alarm", zorder=3)
+    ax2.plot(x, job.rolling_std, color="green", linewidth=1.0, label=f"{ROLLING_WINDOW}min Rolling Std")
+    if job.threshold is not None:
+        ax2.axhline(job.threshold, color="red", linestyle="--", label="Alarm Threshold")
+
+    ax1.set_xlabel("Time (New York)")
+    ax1.set_ylabel("Price", color="blue")
+    ax1.tick_params(axis="y", labelcolor="blue")
+    ax2.set_ylabel(f"{ROLLING_WINDOW}min Rolling Std", color="green")
+    ax2.tick_params(axis="y", labelcolor="green")
+    ax1.set_title(f"Intraday Volatility Monitoring for {job.day}")
+    lines_1, labels_1 = ax1.get_legend_handles_labels()
+    lines_2, labels_2 = ax2.get_legend_handles_labels()
+    ax1.legend(lines_1 + lines_2, labels_1 + labels_2, loc="upper left")
+    # Fixed margins: tight_layout would draw every figure twice.
+    fig.subplots_adjust(left=0.06, right=0.93, top=0.94, bottom=0.08)
+
+    buffer = io.BytesIO()
+    fig.savefig(buffer, format="png", dpi=dpi)
+    return buffer.getvalue()
+
+
+def _html(job: DayJob, png: bytes) -> str:
+    rows = "".join(
+        f"<tr><td>{html.escape(name)}</td><td>{stamps.size}</td></tr>" for name, (stamps, _) in job.alarms.items()
+    )
+    image = base64.b64encode(png).decode("ascii")
+    return (
+        f"<!DOCTYPE html><html><head><meta charset=\"utf-8\"><title>{job.day}</title></head><body>"
+        f"<h1>Intraday volatility {job.day}</h1>"
+        f"<p>{job.points} bars, {job.times.size} plotted.</p>"
+        f"<table><tr><th>detector</th><th>alarms</th></tr>{rows}</table>"
+        f"<img src=\"data:image/png;base64,{image}\" alt=\"{job.day}\">"
+        "</body></html>"
+    )
+
+
+def render_day(job: DayJob, out_dir: str, formats: Sequence[str] = ("png",), dpi: int = 100) -> list[str]:
+    """Writes ``<out_dir>/<day>.png`` and/or ``.html`` for one job; returns the paths."""
+    png = _figure_png(job, dpi)
+    paths = []
+    if "png" in formats:
+        path = os.path.join(out_dir, f"{job.day}.png")
+        with open(path, "wb") as handle:
+            handle.write(png)
+        paths.append(path)
+    if "html" in formats:
+        path = os.path.join(out_dir, f"{job.day}.html")
+        with open(path, "w", encoding="utf-8") as handle:
+            handle.write(_html(job, png))
+        paths.append(path)
+    return paths
+
+
+def _render_batch(jobs: list[DayJob], out_dir: str, formats: Sequence[str], dpi: int) -> list[str]:
+    return [path for job in jobs for path in render_day(job, out_dir, formats, dpi)]
+
+
+def render_reports(
+    df: pd.DataFrame,
+    alarms: Mapping[str, Any],
+    out_dir: str = "reports",
+    days: Sequence[str] | None = None,
+    formats: Sequence[str] = ("png",),
+    max_points: int = DEFAULT_MAX_POINTS,
+    threshold: float | None = None,
+    workers: int | None = None,
+    dpi: int = 100,
+) -> list[str]:
+    """
+    Renders one report per day of ``df`` (or per day in ``days``) into
+    ``out_dir``. ``workers=1`` renders in-process; ``None`` uses one worker
+    process per CPU, each taking a contiguous batch of days.
+    """
+    unknown = set(formats) - set(FORMATS)
+    if unknown or not formats:
+        raise ValueError(f"formats must be a non-empty subset of {FORMATS}, got {list(formats)}")
+    Path(out_dir).mkdir(parents=True, exist_ok=True)
+    jobs = report_jobs(df, alarms, days, max_points, threshold)
+    workers = min(workers or os.cpu_count() or 1, max(len(jobs), 1))
+    if workers == 1:
+        return _render_batch(jobs, out_dir, formats, dpi)
+
+    per_batch = math.ceil(len(jobs) / workers)
+    batches = [jobs[i:i + per_batch] for i in range(0, len(jobs), per_batch)]
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        rendered = pool.map(_render_batch, batches, [out_dir] * len(batches), [formats] * len(batches), [dpi] * len(batches))
+        return [path for paths in rendered for path in paths]
+
+
+def detector_alarms(df: pd.DataFrame, params: Mapping[str, Mapping[str, Any]] | None = None) -> dict[str, pd.Series]:
+    """Alarm timestamps of CUSUM, BOCPE and Page-Hinkley (high side) on ``df`` for the report overlays."""
+    from src.ivtool.detectors.bocpe import main_bocpe_run
+    from src.ivtool.detectors.cusum import main_cusum_run
+    from src.ivtool.detectors.page_hinkley import run_page_hinkley
+    from src.ivtool.pipeline.main_factory import (
+        DEFAULT_BOCPE_PARAMS,
+        DEFAULT_CUSUM_PARAMS,
+        DEFAULT_PAGE_HINKLEY_PARAMS,
+    )
+
+    params = params or {}
+    high, _ = run_page_hinkley(df, **params.get("page_hinkley", DEFAULT_PAGE_HINKLEY_PARAMS))
+    return {
+        "cusum": main_cusum_run(df, **params.get("cusum", DEFAULT_CUSUM_PARAMS))["timestamp"],
+        "bocpe": main_bocpe_run(df, **params.get("bocpe", DEFAULT_BOCPE_PARAMS))["timestamp"],
+        "page_hinkley": high["timestamp"],
+    }
+
+
+def reports_dir_from_env() -> str | None:
+    """``IVTOOL_REPORTS_DIR``: where ``main_factory.main()`` writes daily reports; unset skips them."""
+    return os.getenv(REPORTS_ENV, "").strip() or None
+
+
+def main(argv: Sequence[str] | None = None) -> list[str]:
+    parser = argparse.ArgumentParser(description="Render daily volatility reports with detector alarms")
+    parser.add_argument("--csv", default=None, help="time/price CSV; default synthetic sessions")
+    parser.add_argument("--sessions", type=int, default=21)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--out", default="reports")
+    parser.add_argument("--formats", nargs="+", default=["png"], choices=FORMATS)
+    parser.add_argument("--max-points", type=int, default=DEFAULT_MAX_POINTS)
+    parser.add_argument("--workers", type=int, default=None)
+    args = parser.parse_args(argv)
+
+    if args.csv:
+        df = pd.read_csv(args.csv)
+        df["time"] = pd.to_datetime(df["time"], utc=True)
+    else:
+        from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+        df = regime_switching_prices(args.sessions, seed=args.seed)
+    alarms = detector_alarms(df)
+    start = time.perf_counter()
+    paths = render_reports(df, alarms, args.out, formats=args.formats, max_points=args.max_points, workers=args.workers)
+    print(f"Rendered {len(paths)} files for {len(day_slices(df['time']))} days in {time.perf_counter() - start:.2f}s")
+    return paths
+
+
+if __name__ == "__main__":
+    main()
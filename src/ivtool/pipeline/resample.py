@@ -0,0 +1,431 @@
+"""
+Multi-timescale detection on bars aggregated from the 1-minute stream.
+
+``BarAggregator`` folds 1-minute prices into ``m``-minute bars (close, log
+return, realized variance) incrementally, so every timescale is fed from the
+same pass over the data. ``MultiScaleMonitor`` runs CUSUM, Page-Hinkley and
+BOCPE per timescale on those bars and can keep fine-scale detectors idle
+until a coarse one fires. ``run_multiscale`` is the offline equivalent for
+backtests, escalation included, aggregating with NumPy and using the
+compiled kernels.
+
+Detector inputs per scale:
+
+- CUSUM and BOCPE see the bar log return; ``scale_params`` rescales their
+  thresholds, which are calibrated for 1-minute returns.
+- Page-Hinkley sees the trailing 30-minute realized volatility per minute,
+  sqrt(sum RV / minutes), the quantity its log-normal model is fitted to.
+"""
+from __future__ import annotations
+
+import math
+from collections import deque
+from collections.abc import Iterable, Mapping, Sequence
+from dataclasses import dataclass
+from typing import TYPE_CHECKING
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+MINUTE_NS = 60 * 10**9
+PAGE_HINKLEY_MINUTES = 30
+DETECTORS = ("cusum", "page_hinkley", "bocpe")
+
+
+@dataclass(frozen=True)
+class Bar:
+    start: int
+    minutes: int
+    close: float
+    log_return: float
+    realized_variance: float
+    count: int
+
+
+@dataclass(frozen=True)
+class ScaleAlarm:
+    timestamp: int
+    minutes: int
+    detector: str
+    kind: str
+
+
+class BarAggregator:
+    """Aggregates 1-minute (timestamp ns, price) ticks into ``minutes``-minute bars."""
+
+    def __init__(self, minutes: int) -> None:
+        if minutes < 1:
+            raise ValueError("minutes must be >= 1")
+        self.minutes = minutes
+        self._width = minutes * MINUTE_NS
+        self._bucket: int | None = None
+        self._close = math.nan
+        self._log_return = 0.0
+        self._realized_variance = 0.0
+        self._count = 0
+
+    def update(self, timestamp: int, price: float, log_return: float) -> Bar | None:
+        """Adds one tick; returns the previous bar once a tick lands in a new bucket."""
+        bucket = int(timestamp) // self._width
+        completed = None
+        if self._bucket is not None and bucket != self._bucket:
+            completed = self.flush()
+        if self._bucket is None:
+            self._bucket = bucket
+        self._close = float(price)
+        if not math.isnan(log_return):
+            self._log_return += log_return
+            self._realized_variance += log_return * log_return
+            self._count += 1
+        return completed
+
+    def flush(self) -> Bar | None:
+        if self._bucket is None:
+            return None
+        bar = Bar(
+            start=self._bucket * self._width,
+            minutes=self.minutes,
+            close=self._close,
+            log_return=self._log_return,
+            realized_variance=self._realized_variance,
+            count=self._count,
+        )
+        self._bucket = None
+        self._log_return = 0.0
+        self._realized_variance = 0.0
+        self._count = 0
+        return bar
+
+
+def aggregate_bars(timestamps: np.ndarray, prices: np.ndarray, minutes: int) -> pd.DataFrame:
+    """Vectorized equivalent of feeding every tick through ``BarAggregator``."""
+    timestamps = np.asarray(timestamps, dtype=np.int64)
+    prices = np.asarray(prices, dtype=np.float64)
+    if timestamps.size == 0:
+        return pd.DataFrame({
+            "start": np.empty(0, dtype=np.int64),
+            "close": np.empty(0),
+            "log_return": np.empty(0),
+            "realized_variance": np.empty(0),
+            "count": np.empty(0, dtype=np.int64),
+        })
+    log_returns = np.concatenate([[np.nan], np.diff(np.log(prices))])
+    buckets = timestamps // (minutes * MINUTE_NS)
+    starts = np.flatnonzero(np.concatenate([[True], buckets[1:] != buckets[:-1]]))
+    ends = np.concatenate([starts[1:], [len(buckets)]]) - 1
+
+    valid = ~np.isnan(log_returns)
+    filled = np.where(valid, log_returns, 0.0)
+    return pd.DataFrame({
+        "start": buckets[starts] * minutes * MINUTE_NS,
+        "close": prices[ends],
+        "log_return": np.add.reduceat(filled, starts),
+        "realized_variance": np.add.reduceat(filled * filled, starts),
+        "count": np.add.reduceat(valid.astype(np.int64), starts),
+    })
+
+
+def scale_params(detector: str, params: Mapping[str, float], minutes: int) -> dict:
+    """Rescales 1-minute detector parameters to ``minutes``-minute bars."""
+    scaled = dict(params)
+    if minutes == 1:
+        return scaled
+    if detector == "cusum":
+        # Bar returns have sqrt(m) times the standard deviation of 1-minute returns.
+        for key in ("k", "h"):
+            if key in scaled:
+                scaled[key] = scaled[key] * math.sqrt(minutes)
+    elif detector == "bocpe":
+        if "vol_threshold" in scaled:
+            scaled["vol_threshold"] = scaled["vol_threshold"] * minutes
+        if "hazard" in scaled:
+            scaled["hazard"] = min(scaled["hazard"] * minutes, 0.5)
+        if scaled.get("max_run_length"):
+            scaled["max_run_length"] = max(1, int(scaled["max_run_length"]) // minutes)
+    return scaled
+
+
+def page_hinkley_window(minutes: int) -> int:
+    """Number of ``minutes``-minute bars spanning the Page-Hinkley volatility window."""
+    return max(1, math.ceil(PAGE_HINKLEY_MINUTES / minutes))
+
+
+def _default_params() -> dict[str, dict]:
+    from src.ivtool.pipeline.main_factory import (
+        DEFAULT_BOCPE_PARAMS,
+        DEFAULT_CUSUM_PARAMS,
+        DEFAULT_PAGE_HINKLEY_PARAMS,
+    )
+
+    return {
+        "cusum": dict(DEFAULT_CUSUM_PARAMS),
+        "page_hinkley": dict(DEFAULT_PAGE_HINKLEY_PARAMS),
+        "bocpe": dict(DEFAULT_BOCPE_PARAMS),
+    }
+
+
+class _ScaleDetectors:
+    """The detectors of one timescale, fed one completed bar at a time."""
+
+    def __init__(self, minutes: int, detectors: Sequence[str], params: Mapping[str, Mapping[str, float]]) -> None:
+        from src.ivtool.detectors.bocpe import VolatilityBOCPE
+        from src.ivtool.detectors.cusum import CUSUM
+        from src.ivtool.detectors.page_hinkley import Page_Hinkley
+
+        self.minutes = minutes
+        self.cusum = CUSUM(**scale_params("cusum", params["cusum"], minutes)) if "cusum" in detectors else None
+        self.page_hinkley = (
+            Page_Hinkley(**params["page_hinkley"]) if "page_hinkley" in detectors else None
+        )
+        self.bocpe = VolatilityBOCPE(**scale_params("bocpe", params["bocpe"], minutes)) if "bocpe" in detectors else None
+        self._window: deque[tuple[float, int]] = deque(maxlen=page_hinkley_window(minutes))
+
+    def reset(self) -> None:
+        for detector in (self.cusum, self.page_hinkley, self.bocpe):
+            if detector is not None:
+                detector.reset()
+        self._window.clear()
+
+    def discard_history(self) -> None:
+        # Page_Hinkley keeps every alarm it raised; streaming callers already received them.
+        if self.page_hinkley is not None:
+            for history in (
+                self.page_hinkley.high_list,
+                self.page_hinkley.low_list,
+                self.page_hinkley.high_indices,
+                self.page_hinkley.low_indices,
+            ):
+                history.clear()
+
+    def update(self, bar: Bar) -> list[ScaleAlarm]:
+        alarms: list[ScaleAlarm] = []
+        if bar.count == 0:
+            return alarms
+        if self.cusum is not None and self.cusum.update(bar.log_return):
+            alarms.append(ScaleAlarm(bar.start, self.minutes, "cusum", "alarm"))
+        if self.page_hinkley is not None:
+            self._window.append((bar.realized_variance, bar.count))
+            minutes_seen = sum(count for _, count in self._window)
+            if minutes_seen >= PAGE_HINKLEY_MINUTES:
+                variance = sum(rv for rv, _ in self._window) / minutes_seen
+                if variance > 0.0:
+                    signal = self.page_hinkley.update(math.sqrt(variance), bar.start)
+                    if signal is not None:
+                        alarms.append(ScaleAlarm(bar.start, self.minutes, "page_hinkley", "high" if signal else "low"))
+        if self.bocpe is not None:
+            triggered, regime = self.bocpe.update(bar.log_return)
+            if triggered:
+                kind = "high" if regime == "High Volatility" else "low"
+                alarms.append(ScaleAlarm(bar.start, self.minutes, "bocpe", kind))
+        return alarms
+
+
+class MultiScaleMonitor:
+    """
+    Streams 1-minute prices through bar aggregators and per-scale detectors.
+
+    With ``escalate_to`` set, the detectors on that (fine) scale only run for
+    ``escalation_minutes`` after any coarser scale raises an alarm, and are
+    reset when they go idle again.
+    """
+
+    def __init__(
+        self,
+        scales: Sequence[int] = (5, 15, 30),
+        detectors: Sequence[str] = DETECTORS,
+        params: Mapping[str, Mapping[str, float]] | None = None,
+        escalate_to: int | None = None,
+        escalation_minutes: int = 30,
+    ) -> None:
+        params = {**_default_params(), **(params or {})}
+        self.scales = sorted(set(scales) | ({escalate_to} if escalate_to else set()))
+        self.escalate_to = escalate_to
+        self.escalation_ns = escalation_minutes * MINUTE_NS
+        self._aggregators = {minutes: BarAggregator(minutes) for minutes in self.scales}
+        self._detectors = {minutes: _ScaleDetectors(minutes, detectors, params) for minutes in self.scales}
+        self._armed_until: int | None = None
+        self._last_price = math.nan
+        self.bars_evaluated = {minutes: 0 for minutes in self.scales}
+
+    def update(self, timestamp: int, price: float) -> list[ScaleAlarm]:
+        log_return = math.nan if math.isnan(self._last_price) else math.log(price / self._last_price)
+        self._last_price = float(price)
+        alarms: list[ScaleAlarm] = []
+        # Coarse scales first so an alarm there can arm the fine scale for this tick.
+        for minutes in sorted(self.scales, reverse=True):
+            bar = self._aggregators[minutes].update(timestamp, price, log_return)
+            if bar is not None:
+                alarms.extend(self._on_bar(bar))
+        return alarms
+
+    def flush(self) -> list[ScaleAlarm]:
+        alarms: list[ScaleAlarm] = []
+        for minutes in sorted(self.scales, reverse=True):
+            bar = self._aggregators[minutes].flush()
+            if bar is not None:
+                alarms.extend(self._on_bar(bar))
+        return alarms
+
+    def discard_history(self) -> None:
+        """Drops alarm history the detectors keep, so long streams run in constant memory."""
+        for detectors in self._detectors.values():
+            detectors.discard_history()
+
+    def _on_bar(self, bar: Bar) -> list[ScaleAlarm]:
+        if bar.minutes == self.escalate_to and (self._armed_until is None or bar.start > self._armed_until):
+            if self._armed_until is not None:
+                self._detectors[bar.minutes].reset()
+                self._armed_until = None
+            return []
+        self.bars_evaluated[bar.minutes] += 1
+        alarms = self._detectors[bar.minutes].update(bar)
+        if self.escalate_to is not None and bar.minutes != self.escalate_to and alarms:
+            self._armed_until = bar.start + bar.minutes * MINUTE_NS + self.escalation_ns
+        return alarms
+
+    def run(self, timestamps: Iterable[int], prices: Iterable[float]) -> pd.DataFrame:
+        alarms: list[ScaleAlarm] = []
+        for timestamp, price in zip(timestamps, prices):
+            alarms.extend(self.update(int(timestamp), float(price)))
+        alarms.extend(self.flush())
+        return _alarms_frame(alarms)
+
+
+def _alarms_frame(alarms: Sequence[ScaleAlarm]) -> pd.DataFrame:
+    frame = pd.DataFrame(
+        [(a.timestamp, a.minutes, a.detector, a.kind) for a in alarms],
+        columns=["timestamp", "minutes", "detector", "kind"],
+    )
+    frame["timestamp"] = pd.to_datetime(frame["timestamp"].astype(np.int64), utc=True)
+    return frame.sort_values(["timestamp", "minutes", "detector"], kind="stable").reset_index(drop=True)
+
+
+def _scale_alarms(
+    bars: pd.DataFrame,
+    minutes: int,
+    detectors: Sequence[str],
+    params: Mapping[str, Mapping[str, float]],
+) -> list[ScaleAlarm]:
+    """Alarms of one scale's detectors run from a fresh state over ``bars`` (all with ``count > 0``)."""
+    from src.ivtool.detectors import kernels
+    from src.ivtool.detectors.bocpe import VolatilityBOCPE
+
+    alarms: list[ScaleAlarm] = []
+    starts = bars["start"].to_numpy()
+    returns = np.ascontiguousarray(bars["log_return"].to_numpy())
+
+    if "cusum" in detectors:
+        cusum_params = {"mu": 0.0, **scale_params("cusum", params["cusum"], minutes)}
+        flags = kernels.get_kernel("cusum")(returns, cusum_params["k"], cusum_params["h"], cusum_params["mu"])
+        alarms.extend(ScaleAlarm(int(starts[i]), minutes, "cusum", "alarm") for i in np.flatnonzero(flags))
+
+    window = page_hinkley_window(minutes)
+    # Too few bars for one window: no Page-Hinkley input at this scale.
+    if "page_hinkley" in detectors and len(bars) >= window:
+        rv = np.lib.stride_tricks.sliding_window_view(bars["realized_variance"].to_numpy(), window).sum(axis=1)
+        counts = np.lib.stride_tricks.sliding_window_view(bars["count"].to_numpy(), window).sum(axis=1)
+        first = window - 1
+        usable = (counts >= PAGE_HINKLEY_MINUTES) & (rv > 0.0)
+        positions = np.flatnonzero(usable) + first
+        vol = np.ascontiguousarray(np.sqrt(rv[usable] / counts[usable]))
+        high, low = kernels.get_kernel("page_hinkley")(vol, float(params["page_hinkley"].get("alarm_threshold", 250.0)))
+        alarms.extend(ScaleAlarm(int(starts[positions[i]]), minutes, "page_hinkley", "high") for i in high)
+        alarms.extend(ScaleAlarm(int(starts[positions[i]]), minutes, "page_hinkley", "low") for i in low)
+
+    if "bocpe" in detectors:
+        bocpe = VolatilityBOCPE(**scale_params("bocpe", params["bocpe"], minutes))
+        flags, high_regime = bocpe.run_array(returns)
+        alarms.extend(
+            ScaleAlarm(int(starts[i]), minutes, "bocpe", "high" if high_regime[i] else "low")
+            for i in np.flatnonzero(flags)
+        )
+    return alarms
+
+
+def _escalated_segments(
+    completed: np.ndarray,
+    starts: np.ndarray,
+    minutes: int,
+    arms: Sequence[tuple[int, int, int]],
+) -> list[np.ndarray]:
+    """
+    Runs of consecutive ``minutes``-minute bars that ``MultiScaleMonitor``
+    evaluates with ``escalate_to=minutes``. ``completed`` is the tick at which
+    each bar is emitted and ``arms`` the (tick, scale, armed until) of every
+    alarm on another scale; on a shared tick coarser scales go first.
+    """
+    arms = sorted(arms, key=lambda arm: (arm[0], -arm[1]))
+    segments: list[np.ndarray] = []
+    current: list[int] = []
+    armed_until: int | None = None
+    next_arm = 0
+    for i, (tick, start) in enumerate(zip(completed, starts)):
+        while next_arm < len(arms) and (arms[next_arm][0], -arms[next_arm][1]) < (tick, -minutes):
+            armed_until = arms[next_arm][2]
+            next_arm += 1
+        if armed_until is None or start > armed_until:
+            # The monitor resets the fine detectors here, so the next run starts fresh.
+            if current:
+                segments.append(np.array(current))
+                current = []
+            armed_until = None
+            continue
+        current.append(i)
+    if current:
+        segments.append(np.array(current))
+    return segments
+
+
+def run_multiscale(
+    df: pd.DataFrame,
+    scales: Sequence[int] = (1, 5, 15, 30),
+    detectors: Sequence[str] = DETECTORS,
+    params: Mapping[str, Mapping[str, float]] | None = None,
+    escalate_to: int | None = None,
+    escalation_minutes: int = 30,
+) -> pd.DataFrame:
+    """
+    Offline multi-timescale run over a ``time``/``price`` frame. Prices are
+    read once and aggregated per scale with NumPy; each scale's detectors
+    then run on the compiled kernels when available. ``escalate_to`` and
+    ``escalation_minutes`` gate a fine scale on the other scales' alarms as
+    ``MultiScaleMonitor`` does, so backtests reproduce the live alarms.
+    """
+    params = {**_default_params(), **(params or {})}
+    scales = sorted(set(scales) | ({escalate_to} if escalate_to else set()))
+    df = df.sort_values("time")
+    timestamps = pd.to_datetime(df["time"], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    prices = df["price"].to_numpy(dtype=np.float64)
+
+    alarms: list[ScaleAlarm] = []
+    arms: list[tuple[int, int, int]] = []
+    escalated: pd.DataFrame | None = None
+    for minutes in scales:
+        bars = aggregate_bars(timestamps, prices, minutes)
+        # A bar is emitted by the first tick of the next one, the last by the final flush.
+        bars["completed"] = np.append(np.searchsorted(timestamps, bars["start"].to_numpy()[1:]), len(timestamps))
+        bars = bars[bars["count"] > 0].reset_index(drop=True)
+        if minutes == escalate_to:
+            escalated = bars
+            continue
+        found = _scale_alarms(bars, minutes, detectors, params)
+        alarms.extend(found)
+        if escalate_to is not None and found:
+            completed = dict(zip(bars["start"].tolist(), bars["completed"].tolist()))
+            end_ns = minutes * MINUTE_NS + escalation_minutes * MINUTE_NS
+            arms.extend((completed[alarm.timestamp], minutes, alarm.timestamp + end_ns) for alarm in found)
+
+    if escalate_to is not None and escalated is not None:
+        segments = _escalated_segments(
+            escalated["completed"].to_numpy(), escalated["start"].to_numpy(), escalate_to, arms
+        )
+        for rows in segments:
+            alarms.extend(_scale_alarms(escalated.iloc[rows].reset_index(drop=True), escalate_to, detectors, params))
+
+    return _alarms_frame(alarms)
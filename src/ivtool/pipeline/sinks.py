@@ -0,0 +1,231 @@
+"""
+Pluggable destinations for the tables a pipeline run produces.
+
+``main()`` hands every result table plus a ``RunMetadata`` record (calibrated
+parameters, input fingerprint, timing report) to one sink:
+
+- ``CsvSink``: the original CSV files in the working directory.
+- ``ParquetSink``: append-only Parquet, one file per run under
+  ``<root>/<table>/run_date=YYYY-MM-DD/``, so dashboards read only new partitions.
+- ``PostgresCopySink``: results tables loaded with bulk ``COPY``.
+
+The sink is chosen with ``IVTOOL_RESULTS_SINK``: ``csv`` (default),
+``parquet[:<root>]`` or ``postgres``.
+"""
+from __future__ import annotations
+
+import hashlib
+import io
+import json
+import os
+from abc import ABC, abstractmethod
+from collections.abc import Callable, Mapping
+from dataclasses import asdict, dataclass, field
+from datetime import UTC, datetime
+from pathlib import Path
+from typing import TYPE_CHECKING, Any
+
+import numpy as np
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+SINK_ENV = "IVTOOL_RESULTS_SINK"
+DEFAULT_PARQUET_ROOT = "results"
+
+
+@dataclass
+class RunMetadata:
+    run_id: str
+    params: dict[str, dict[str, Any]]
+    data_fingerprint: str
+    input_rows: int
+    created: str = field(default_factory=lambda: datetime.now(UTC).isoformat())
+    timing: dict[str, Any] = field(default_factory=dict)
+    table_rows: dict[str, int] = field(default_factory=dict)
+
+    @property
+    def run_date(self) -> str:
+        return self.created[:10]
+
+
+def data_fingerprint(df: pd.DataFrame) -> str:
+    """Stable hash of the ``time`` and ``price`` columns of the input prices."""
+    digest = hashlib.sha256()
+    digest.update(str(len(df)).encode())
+    if "time" in df:
+        times = pd.to_datetime(df["time"], utc=True).to_numpy(dtype="datetime64[ns]").astype(np.int64)
+        digest.update(np.ascontiguousarray(times).tobytes())
+    if "price" in df:
+        digest.update(np.ascontiguousarray(df["price"].to_numpy(dtype=np.float64)).tobytes())
+    return digest.hexdigest()[:16]
+
+
+class ResultsSink(ABC):
+    """Writes one run's result tables and metadata."""
+
+    @abstractmethod
+    def write(self, tables: Mapping[str, pd.DataFrame], metadata: RunMetadata) -> None:
+        """Writes ``tables`` and ``metadata`` in one go."""
+
+
+class CsvSink(ResultsSink):
+    def __init__(self, directory: str | os.PathLike[str] = ".") -> None:
+        self.directory = Path(directory)
+
+    def write(self, tables: Mapping[str, pd.DataFrame], metadata: RunMetadata) -> None:
+        self.directory.mkdir(parents=True, exist_ok=True)
+        for name, table in tables.items():
+            table.to_csv(self.directory / f"{name}.csv", index=False)
+        (self.directory / "run_metadata.json").write_text(json.dumps(asdict(metadata), indent=2, default=str))
+
+
+class ParquetSink(ResultsSink):
+    def __init__(self, root: str | os.PathLike[str] = DEFAULT_PARQUET_ROOT) -> None:
+        self.root = Path(root)
+
+    def write(self, tables: Mapping[str, pd.DataFrame], metadata: RunMetadata) -> None:
+        try:
+            import pyarrow as pa
+            import pyarrow.parquet as pq
+        except ImportError as exc:
+            raise ImportError("ParquetSink requires pyarrow (pip install pyarrow)") from exc
+
+        partition = f"run_date={metadata.run_date}"
+        for name, table in tables.items():
+            directory = self.root / name / partition
+            directory.mkdir(parents=True, exist_ok=True)
+            arrow_table = pa.Table.from_pandas(table.assign(run_id=metadata.run_id), preserve_index=False)
+            # Constant/repeated string columns (e.g. ``regime``) are dictionary encoded.
+            pq.write_table(arrow_table, directory / f"part-{metadata.run_id}.parquet", compression="zstd")
+
+        runs = self.root / "runs" / partition
+        runs.mkdir(parents=True, exist_ok=True)
+        (runs / f"run-{metadata.run_id}.json").write_text(json.dumps(asdict(metadata), indent=2, default=str))
+
+    @staticmethod
+    def read(root: str | os.PathLike[str], table: str, since: str | None = None) -> pd.DataFrame:
+        """Reads a table, optionally only partitions with ``run_date >= since``."""
+        directory = Path(root) / table
+        parts = sorted(directory.glob("run_date=*/*.parquet"))
+        if since is not None:
+            parts = [part for part in parts if part.parent.name.split("=", 1)[1] >= since]
+        if not parts:
+            return pd.DataFrame()
+        return pd.concat([pd.read_parquet(part) for part in parts], ignore_index=True)
+
+
+def _sql_type(dtype: Any) -> str:
+    if pd.api.types.is_bool_dtype(dtype):
+        return "BOOLEAN"
+    if pd.api.types.is_integer_dtype(dtype):
+        return "BIGINT"
+    if pd.api.types.is_float_dtype(dtype):
+        return "DOUBLE PRECISION"
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return "TIMESTAMPTZ"
+    return "TEXT"
+
+
+# information_schema ``data_type`` of each column type ``_sql_type`` creates.
+_PG_TYPES = {
+    "boolean": "BOOLEAN",
+    "bigint": "BIGINT",
+    "double precision": "DOUBLE PRECISION",
+    "timestamp with time zone": "TIMESTAMPTZ",
+    "text": "TEXT",
+}
+
+
+class PostgresCopySink(ResultsSink):
+    """
+    Appends each table to ``ivm_<table>`` with ``COPY ... FROM STDIN`` and the
+    run metadata to ``ivm_runs``. ``connect`` returns a DB-API connection
+    whose cursors provide ``copy_expert`` (psycopg2).
+
+    Column types come from the first non-empty frame written to a table (empty
+    frames are skipped). Columns a later frame adds are added to the table,
+    columns it drops are left NULL, and a column whose type changed raises
+    ``ValueError`` and rolls the whole run back.
+    """
+
+    def __init__(self, connect: Callable[[], Any] | None = None, prefix: str = "ivm_") -> None:
+        if connect is None:
+            from src.ivtool.storage import connect_from_env
+
+            connect = connect_from_env
+        self.connect = connect
+        self.prefix = prefix
+
+    def _existing_columns(self, cur: Any, name: str) -> dict[str, str]:
+        cur.execute(
+            "SELECT column_name, data_type FROM information_schema.columns "
+            "WHERE table_schema = current_schema() AND table_name = %s",
+            (f"{self.prefix}{name}",),
+        )
+        return {column: _PG_TYPES.get(data_type, data_type.upper()) for column, data_type in cur.fetchall()}
+
+    def _schema_sql(self, name: str, table: pd.DataFrame, existing: Mapping[str, str]) -> list[str]:
+        """DDL that lets ``table`` be copied into ``ivm_<name>``: CREATE TABLE, or ADD COLUMN for new columns."""
+        wanted = {str(column): _sql_type(dtype) for column, dtype in table.dtypes.items()}
+        if not existing:
+            columns = ", ".join(f'"{column}" {sql_type}' for column, sql_type in wanted.items())
+            return [f'CREATE TABLE IF NOT EXISTS "{self.prefix}{name}" ("run_id" TEXT NOT NULL, {columns})']
+        changed = [
+            f"{column} ({existing[column]} in the table, {sql_type} in the frame)"
+            for column, sql_type in wanted.items()
+            if column in existing and existing[column] not in (sql_type, "TEXT") and table[column].notna().any()
+        ]
+        if changed:
+            raise ValueError(f'cannot copy into "{self.prefix}{name}", column types changed: {", ".join(changed)}')
+        return [
+            f'ALTER TABLE "{self.prefix}{name}" ADD COLUMN "{column}" {sql_type}'
+            for column, sql_type in wanted.items()
+            if column not in existing
+        ]
+
+    def write(self, tables: Mapping[str, pd.DataFrame], metadata: RunMetadata) -> None:
+        conn = self.connect()
+        try:
+            with conn.cursor() as cur:
+                cur.execute(
+                    f'CREATE TABLE IF NOT EXISTS "{self.prefix}runs" '
+                    '("run_id" TEXT PRIMARY KEY, "created" TIMESTAMPTZ, "metadata" JSONB)'
+                )
+                cur.execute(
+                    f'INSERT INTO "{self.prefix}runs" ("run_id", "created", "metadata") VALUES (%s, %s, %s)',
+                    (metadata.run_id, metadata.created, json.dumps(asdict(metadata), default=str)),
+                )
+                for name, table in tables.items():
+                    if table.empty:
+                        continue
+                    for statement in self._schema_sql(name, table, self._existing_columns(cur, name)):
+                        cur.execute(statement)
+                    buffer = io.StringIO()
+                    table.assign(run_id=metadata.run_id)[["run_id", *table.columns]].to_csv(buffer, index=False, header=False)
+                    buffer.seek(0)
+                    columns = ", ".join(f'"{column}"' for column in ["run_id", *table.columns])
+                    cur.copy_expert(f'COPY "{self.prefix}{name}" ({columns}) FROM STDIN WITH (FORMAT csv)', buffer)
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def sink_from_env() -> ResultsSink:
+    spec = os.getenv(SINK_ENV, "csv").strip()
+    kind, _, argument = spec.partition(":")
+    kind = kind.lower()
+    if kind == "csv":
+        return CsvSink(argument or ".")
+    if kind == "parquet":
+        return ParquetSink(argument or DEFAULT_PARQUET_ROOT)
+    if kind == "postgres":
+        return PostgresCopySink()
+    raise ValueError(f"unknown results sink {spec!r}; expected csv, parquet[:<root>] or postgres")
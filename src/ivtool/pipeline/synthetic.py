@@ -0,0 +1,100 @@
+"""
+Deterministic regime-switching 1-minute price series.
+
+Used by the benchmarks and the evaluation harness so detector throughput and
+accuracy can be measured offline, without Databento or Postgres. Volatility
+alternates between a low and a high regime with geometric durations; the
+``regime`` column holds the ground truth (1 = high volatility).
+"""
+from __future__ import annotations
+
+from typing import Any
+
+import numpy as np
+import pandas as pd
+
+BARS_PER_SESSION = 390
+SESSION_OPEN_UTC = pd.Timedelta(hours=13, minutes=30)
+
+# Number of trading sessions in each named benchmark scale.
+SCALES = {
+    "day": 1,
+    "month": 21,
+    "year": 252,
+    "decade": 2520,
+}
+
+
+def session_minutes(n_sessions: int, start: str = "2015-01-02") -> pd.DatetimeIndex:
+    """1-minute bar timestamps for ``n_sessions`` consecutive weekdays, 13:30-19:59 UTC."""
+    days = pd.bdate_range(start, periods=n_sessions, tz="UTC") + SESSION_OPEN_UTC
+    offsets = pd.to_timedelta(np.arange(BARS_PER_SESSION), unit="min")
+    stamps = days.values[:, None] + offsets.values[None, :]
+    return pd.DatetimeIndex(stamps.ravel(), tz="UTC")
+
+
+def regime_switching_returns(
+    n: int,
+    low_vol: float = 0.0003,
+    high_vol: float = 0.0012,
+    mean_low_duration: float = 600.0,
+    mean_high_duration: float = 120.0,
+    seed: int = 0,
+    ensure_switches: bool = False,
+) -> tuple[np.ndarray, np.ndarray]:
+    """
+    Returns (log_returns, regime) arrays of length ``n``; the series starts in the low regime.
+    With ``ensure_switches`` the first low and high regimes are clipped to a third of the
+    series each, so even a single session switches up and back down.
+    """
+    rng = np.random.default_rng(seed)
+    # Draw alternating low/high durations until they cover n bars.
+    durations: list[np.ndarray] = []
+    covered = 0
+    while covered < n:
+        batch = max(2, 2 * int(n / (mean_low_duration + mean_high_duration)) + 2)
+        low = rng.geometric(1.0 / mean_low_duration, size=batch)
+        high = rng.geometric(1.0 / mean_high_duration, size=batch)
+        pairs = np.column_stack([low, high]).ravel()
+        durations.append(pairs)
+        covered += int(pairs.sum())
+    lengths = np.concatenate(durations)
+    if ensure_switches:
+        lengths[:2] = np.minimum(lengths[:2], max(1, n // 3))
+    labels = np.arange(lengths.size) % 2
+    regime = np.repeat(labels, lengths)[:n].astype(np.int8)
+
+    scale = np.where(regime == 1, high_vol, low_vol)
+    returns = rng.standard_normal(n) * scale
+    return returns, regime
+
+
+def regime_switching_prices(
+    n_sessions: int = 1,
+    seed: int = 0,
+    start_price: float = 500.0,
+    symbol: str = "SPY",
+    **kwargs: Any,
+) -> pd.DataFrame:
+    """
+    Price frame in the shape of ``get_data``: ``time``, ``symbol``, ``price``,
+    plus the ground-truth ``regime`` of each bar.
+    Extra keyword arguments are passed to ``regime_switching_returns``.
+    """
+    times = session_minutes(n_sessions)
+    returns, regime = regime_switching_returns(len(times), seed=seed, **kwargs)
+    returns[0] = 0.0
+    prices = start_price * np.exp(np.cumsum(returns))
+    return pd.DataFrame({
+        "time": times,
+        "symbol": symbol,
+        "price": prices,
+        "regime": regime,
+    })
+
+
+def scale_prices(scale: str, seed: int = 0) -> pd.DataFrame:
+    """Synthetic prices for one of the named ``SCALES``, with at least one high-volatility regime."""
+    if scale not in SCALES:
+        raise ValueError(f"unknown scale {scale!r}; expected one of {sorted(SCALES)}")
+    return regime_switching_prices(SCALES[scale], seed=seed, ensure_switches=True)
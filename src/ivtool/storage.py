@@ -0,0 +1,329 @@
+"""
+Shared access to the ``time``/``symbol``/``price`` table.
+
+Every reader and writer of the price table (``main_factory.get_data``,
+ingestion, the export script, ``replay.db_chunks``) goes through a
+``PriceStore``:
+
+- connections come from a ``ConnectionPool`` and are reused across calls;
+- range reads are one parameterized statement on ``(symbol, start, end)``,
+  ``PREPARE``d once per Postgres connection, with open bounds passed as
+  ``-infinity``/``infinity`` so the plan never changes shape;
+- ``ensure_schema`` creates the table and a ``(symbol, time)`` b-tree index
+  (or a BRIN index on ``time`` for append-only history).
+
+``DATABASE_URL2`` selects the backend: a Postgres DSN, or ``sqlite:///path``
+for the in-process stand-in used by tests and local runs.
+"""
+from __future__ import annotations
+
+import os
+import queue
+import re
+import sqlite3
+import threading
+from collections.abc import Callable, Iterator, Sequence
+from contextlib import contextmanager
+from typing import TYPE_CHECKING, Any
+
+from src.ivtool.lazy import lazy_module
+
+if TYPE_CHECKING:
+    import pandas as pd
+else:
+    pd = lazy_module("pandas")
+
+DATABASE_URL_ENV = "DATABASE_URL2"
+DEFAULT_TABLE = "SPY_DATA_V2"
+DIALECTS = ("postgres", "sqlite")
+INDEXES = ("btree", "brin")
+SQLITE_TIME_FORMAT = "%Y-%m-%d %H:%M:%S+00:00"
+COLUMNS = ("time", "symbol", "price")
+
+
+class ConnectionPool:
+    """
+    At most ``maxsize`` DB-API connections made by ``connect``, opened on
+    demand and reused. ``connection()`` commits on success, rolls back on
+    error and drops connections that were closed underneath it.
+    """
+
+    def __init__(self, connect: Callable[[], Any], maxsize: int = 4) -> None:
+        if maxsize < 1:
+            raise ValueError("maxsize must be >= 1")
+        self._connect = connect
+        self.maxsize = maxsize
+        self._idle: queue.LifoQueue = queue.LifoQueue()
+        self._slots = threading.BoundedSemaphore(maxsize)
+        self._lock = threading.Lock()
+        self._open: list[Any] = []
+        self._prepared: dict[int, set[str]] = {}
+        self.created = 0
+
+    @contextmanager
+    def connection(self) -> Iterator[Any]:
+        self._slots.acquire()
+        try:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                conn = self._connect()
+                with self._lock:
+                    self._open.append(conn)
+                    self.created += 1
+            try:
+                yield conn
+                conn.commit()
+            except BaseException:
+                if not getattr(conn, "closed", False):
+                    conn.rollback()
+                raise
+            finally:
+                if getattr(conn, "closed", False):
+                    with self._lock:
+                        self._open.remove(conn)
+                        self._prepared.pop(id(conn), None)
+                else:
+                    self._idle.put(conn)
+        finally:
+            self._slots.release()
+
+    def close(self) -> None:
+        with self._lock:
+            for conn in self._open:
+                conn.close()
+            self._open.clear()
+            self._prepared.clear()
+        self._idle = queue.LifoQueue()
+
+    def prepared(self, conn: Any) -> set[str]:
+        """Names of the statements ``PREPARE``d on ``conn``, which live as long as the connection."""
+        with self._lock:
+            return self._prepared.setdefault(id(conn), set())
+
+
+def _utc(value: Any) -> pd.Timestamp:
+    timestamp = pd.Timestamp(value)
+    return timestamp.tz_localize("UTC") if timestamp.tzinfo is None else timestamp.tz_convert("UTC")
+
+
+class PriceStore:
+    """Reads, appends and indexes one price table through a ``ConnectionPool``."""
+
+    def __init__(self, pool: ConnectionPool, table: str = DEFAULT_TABLE, dialect: str = "postgres") -> None:
+        if dialect not in DIALECTS:
+            raise ValueError(f"dialect must be one of {DIALECTS}, got {dialect!r}")
+        self.pool = pool
+        self.table = table
+        self.dialect = dialect
+        self._mark = "%s" if dialect == "postgres" else "?"
+        self._statement = re.sub(r"\W", "_", f"ivtool_{table}_range").lower()
+
+    # SQL
+
+    def _select(self, marks: Sequence[str]) -> str:
+        """Range query with placeholders ``[symbol,] start, end``."""
+        *symbol_mark, start_mark, end_mark = marks
+        symbol = f'"symbol" = {symbol_mark[0]} AND ' if symbol_mark else ""
+        return (
+            f'SELECT "time", "symbol", "price" FROM "{self.table}" '
+            f'WHERE {symbol}"time" >= {start_mark} AND "time" < {end_mark} ORDER BY "time" ASC'
+        )
+
+    def _bounds(self, start: Any, end: Any) -> tuple[Any, Any]:
+        if self.dialect == "postgres":
+            return (
+                "-infinity" if start is None else _utc(start).to_pydatetime(),
+                "infinity" if end is None else _utc(end).to_pydatetime(),
+            )
+        # ISO text sorts chronologically; any stored time lies between these.
+        return (
+            "0000" if start is None else _utc(start).strftime(SQLITE_TIME_FORMAT),
+            "9999" if end is None else _utc(end).strftime(SQLITE_TIME_FORMAT),
+        )
+
+    def _params(self, symbol: str | None, start: Any, end: Any) -> tuple:
+        bounds = self._bounds(start, end)
+        return (symbol, *bounds) if symbol is not None else bounds
+
+    def _range_query(self, conn: Any, params: tuple) -> str:
+        if self.dialect == "sqlite":
+            return self._select(["?"] * len(params))
+
+        name = f"{self._statement}_{len(params)}"
+        prepared = self.pool.prepared(conn)
+        if name not in prepared:
+            types = ["text", "timestamptz", "timestamptz"][-len(params):]
+            body = self._select([f"${i}" for i in range(1, len(params) + 1)])
+            cur = conn.cursor()
+            try:
+                cur.execute(f"PREPARE {name} ({', '.join(types)}) AS {body}")
+            finally:
+                cur.close()
+            prepared.add(name)
+        return f"EXECUTE {name} ({', '.join(['%s'] * len(params))})"
+
+    @staticmethod
+    def _frame(rows: list) -> pd.DataFrame:
+        frame = pd.DataFrame(rows, columns=list(COLUMNS))
+        frame["time"] = pd.to_datetime(frame["time"], utc=True)
+        frame["price"] = frame["price"].astype(float)
+        return frame
+
+    # Schema
+
+    def ensure_schema(self, index: str = "btree") -> None:
+        """Creates the table if missing and a ``(symbol, time)`` b-tree or a ``time`` BRIN index."""
+        if index not in INDEXES:
+            raise ValueError(f"index must be one of {INDEXES}, got {index!r}")
+        if index == "brin" and self.dialect != "postgres":
+            raise ValueError("BRIN indexes need Postgres")
+        time_type, price_type = ("TIMESTAMPTZ", "DOUBLE PRECISION") if self.dialect == "postgres" else ("TEXT", "REAL")
+        statements = [
+            (
+                f'CREATE TABLE IF NOT EXISTS "{self.table}" ("time" {time_type} NOT NULL, '
+                f'"symbol" TEXT NOT NULL, "price" {price_type} NOT NULL, UNIQUE ("time", "symbol"))'
+            ),
+            f'CREATE INDEX IF NOT EXISTS "{self.table}_symbol_time_idx" ON "{self.table}" ("symbol", "time")'
+            if index == "btree"
+            else f'CREATE INDEX IF NOT EXISTS "{self.table}_time_brin" ON "{self.table}" USING brin ("time")',
+        ]
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                for statement in statements:
+                    cur.execute(statement)
+            finally:
+                cur.close()
+
+    # Reads
+
+    def read_range(self, symbol: str | None = None, start: Any = None, end: Any = None) -> pd.DataFrame:
+        """Rows with ``start <= time < end`` (open when ``None``), for one symbol or all, ordered by time."""
+        params = self._params(symbol, start, end)
+        with self.pool.connection() as conn:
+            sql = self._range_query(conn, params)
+            cur = conn.cursor()
+            try:
+                cur.execute(sql, params)
+                rows = cur.fetchall()
+            finally:
+                cur.close()
+        return self._frame(rows)
+
+    def iter_range(
+        self, symbol: str | None = None, start: Any = None, end: Any = None, chunksize: int = 50_000
+    ) -> Iterator[pd.DataFrame]:
+        """``read_range`` in frames of ``chunksize`` rows; Postgres streams them through a named cursor."""
+        params = self._params(symbol, start, end)
+        sql = self._select([self._mark] * len(params))
+        with self.pool.connection() as conn:
+            if self.dialect == "postgres":
+                cur = conn.cursor(name="ivtool_range")
+                cur.itersize = chunksize
+            else:
+                cur = conn.cursor()
+            try:
+                cur.execute(sql, params)
+                while True:
+                    rows = cur.fetchmany(chunksize)
+                    if not rows:
+                        break
+                    yield self._frame(rows)
+            finally:
+                cur.close()
+
+    def watermark(self, symbol: str) -> pd.Timestamp | None:
+        """Newest stored ``time`` of ``symbol``, or ``None`` without rows."""
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                cur.execute(f'SELECT MAX("time") FROM "{self.table}" WHERE "symbol" = {self._mark}', (symbol,))
+                (latest,) = cur.fetchone()
+            finally:
+                cur.close()
+        return None if latest is None else pd.to_datetime(latest, utc=True)
+
+    def existing_times(self, symbol: str, start: Any, end: Any) -> pd.DatetimeIndex:
+        return pd.DatetimeIndex(self.read_range(symbol, start, end)["time"])
+
+    # Writes
+
+    def insert(self, bars: pd.DataFrame) -> int:
+        """
+        Appends ``time``/``symbol``/``price`` rows, skipping ``(time, symbol)``
+        pairs already stored, and returns the number of rows actually inserted.
+        """
+        if bars.empty:
+            return 0
+        times = pd.to_datetime(bars["time"], utc=True)
+        if self.dialect == "sqlite":
+            times = times.dt.strftime(SQLITE_TIME_FORMAT)
+        else:
+            times = times.dt.to_pydatetime()
+        rows = list(zip(times, bars["symbol"], bars["price"].astype(float)))
+        insert = f'INSERT INTO "{self.table}" ("time", "symbol", "price") VALUES'
+        conflict = 'ON CONFLICT ("time", "symbol") DO NOTHING'
+        with self.pool.connection() as conn:
+            cur = conn.cursor()
+            try:
+                if self.dialect == "postgres":
+                    from psycopg2.extras import execute_values
+
+                    # One row back per inserted bar; conflicting rows return nothing.
+                    returned = execute_values(
+                        cur, f"{insert} %s {conflict} RETURNING 1", rows, page_size=10_000, fetch=True
+                    )
+                    inserted = len(returned)
+                else:
+                    cur.executemany(f"{insert} (?, ?, ?) {conflict}", rows)
+                    inserted = cur.rowcount
+            finally:
+                cur.close()
+        return inserted
+
+
+def connect_from_env() -> Any:
+    """A new psycopg2 connection to ``DATABASE_URL2``."""
+    import psycopg2
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database_url = os.getenv(DATABASE_URL_ENV)
+    if database_url is None:
+        raise ValueError(f"{DATABASE_URL_ENV} not found in environment variables")
+    return psycopg2.connect(database_url)
+
+
+def sqlite_store(path: str = ":memory:", table: str = DEFAULT_TABLE, index: str = "btree") -> PriceStore:
+    """In-process stand-in: a SQLite price table with the same schema and queries."""
+    connect = lambda: sqlite3.connect(path, check_same_thread=False)
+    # Every connection to ":memory:" is a separate database, so share one.
+    store = PriceStore(ConnectionPool(connect, maxsize=1 if path == ":memory:" else 4), table, dialect="sqlite")
+    store.ensure_schema(index)
+    return store
+
+
+_STORES: dict[tuple[str, str], PriceStore] = {}
+
+
+def store_from_env(table: str = DEFAULT_TABLE, maxsize: int = 4) -> PriceStore:
+    """
+    The process-wide store for ``DATABASE_URL2`` and ``table``; repeated
+    calls share its pool. ``sqlite:///<path>`` opens the SQLite stand-in.
+    """
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    database_url = os.getenv(DATABASE_URL_ENV)
+    if database_url is None:
+        raise ValueError(f"{DATABASE_URL_ENV} not found in environment variables")
+    key = (database_url, table)
+    if key not in _STORES:
+        if database_url.startswith("sqlite:///"):
+            _STORES[key] = sqlite_store(database_url[len("sqlite:///"):] or ":memory:", table)
+        else:
+            import psycopg2
+
+            _STORES[key] = PriceStore(ConnectionPool(lambda: psycopg2.connect(database_url), maxsize), table)
+    return _STORES[key]
@@ -0,0 +1,68 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.adaptive_bocpe import (
+    AdaptiveVolatilityBOCPE,
+    main_adaptive_bocpe_run,
+    run_adaptive_bocpe,
+)
+from src.ivtool.detectors.bocpe import VolatilityBOCPE
+from src.ivtool.pipeline.synthetic import regime_switching_prices, regime_switching_returns
+
+
+@pytest.mark.parametrize("kwargs", [{"hazards": []}, {"hazards": [0.0]}, {"prior_learning_rate": -1.0}, {"hazard_forgetting": 0.0}])
+def test_invalid_arguments_raise_value_error(kwargs):
+    with pytest.raises(ValueError):
+        AdaptiveVolatilityBOCPE(**kwargs)
+
+
+@pytest.mark.parametrize("max_run_length", [None, 80])
+def test_single_hazard_without_learning_matches_volatility_bocpe(max_run_length):
+    returns, _ = regime_switching_returns(1500, low_vol=0.02, high_vol=0.3, seed=3)
+    adaptive = AdaptiveVolatilityBOCPE(hazards=[1 / 200], prior_learning_rate=0.0, vol_threshold=0.01, max_run_length=max_run_length)
+    fixed = VolatilityBOCPE(hazard=1 / 200, vol_threshold=0.01, max_run_length=max_run_length)
+
+    adaptive_out = [adaptive.update(x) for x in returns]
+    fixed_out = [fixed.update(x) for x in returns]
+
+    assert any(triggered for triggered, _ in fixed_out)
+    assert adaptive_out == fixed_out
+    assert adaptive.state()["cp_prob"] == pytest.approx(fixed.state()["cp_prob"])
+
+
+def test_hazard_bank_prefers_the_generating_switch_rate():
+    # Regimes switch about every 50 bars; the bank should favour 1/50 over much rarer changes.
+    returns, _ = regime_switching_returns(4000, low_vol=0.02, high_vol=0.2, mean_low_duration=50, mean_high_duration=50, seed=1)
+    detector = AdaptiveVolatilityBOCPE(hazards=[1 / 50, 1 / 5000], prior_beta=0.001, vol_threshold=0.01, max_run_length=400)
+    for x in returns:
+        detector.update(x)
+
+    assert detector.hazard_weights[0] > 0.9
+    assert detector.hazard > 1 / 100
+
+
+def test_prior_scale_moves_towards_the_data_variance():
+    returns, _ = regime_switching_returns(3000, low_vol=0.0003, high_vol=0.0003, seed=2)
+    detector = AdaptiveVolatilityBOCPE(prior_beta=0.01, vol_threshold=1e-6, max_run_length=400)
+    for x in returns:
+        detector.update(x)
+
+    # The prior's expected variance beta / (alpha - 1) starts at 1e-2 and should end near 9e-8.
+    expected_variance = detector.prior_beta / (detector.prior_alpha - 1.0)
+    assert 1e-8 < expected_variance < 1e-5
+
+
+def test_run_functions_return_learned_trajectory():
+    df = regime_switching_prices(2, seed=4)
+    returns = np.log(df["price"]).diff().dropna().reset_index(drop=True)
+    alarms, regimes, learned = run_adaptive_bocpe(returns, vol_threshold=1e-7, max_run_length=300)
+
+    assert len(alarms) == len(regimes) == len(learned) == len(returns)
+    assert list(learned.columns) == ["hazard", "prior_beta"]
+    assert (learned["prior_beta"] > 0).all()
+
+    flagged = main_adaptive_bocpe_run(df, vol_threshold=1e-7, max_run_length=300)
+    assert list(flagged.columns) == ["timestamp", "alarm", "new_regime"]
+    assert len(flagged) == int(alarms.sum())
+    assert pd.Series(flagged["new_regime"]).isin(["High Volatility", "Low Volatility"]).all()
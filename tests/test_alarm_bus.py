@@ -0,0 +1,202 @@
+import asyncio
+import datetime
+import json
+import threading
+
+import pytest
+
+from src.ivtool.pipeline.alarm_bus import (
+    Alarm,
+    AlarmBus,
+    AlarmSink,
+    DatabaseAlarmSink,
+    FileAlarmSink,
+    WebhookAlarmSink,
+)
+from src.ivtool.pipeline.consensus import MINUTE_NS
+from src.ivtool.storage import ConnectionPool, sqlite_store
+
+T0 = 1_709_562_600 * 10**9  # 2024-03-04 14:30 UTC
+
+
+class ListSink(AlarmSink):
+    name = "list"
+
+    def __init__(self, delay=0.0):
+        self.batches = []
+        self.delay = delay
+
+    async def deliver(self, batch):
+        await asyncio.sleep(self.delay)
+        self.batches.append([(a.symbol, a.detector, a.timestamp, a.repeats) for a in batch])
+
+
+class FailingSink(AlarmSink):
+    name = "failing"
+
+    async def deliver(self, batch):
+        raise ConnectionError("down")
+
+
+def test_repeats_within_the_window_are_coalesced():
+    sink = ListSink()
+
+    async def run():
+        async with AlarmBus([sink], coalesce_ns=5 * MINUTE_NS, flush_interval_s=0.01) as bus:
+            # CUSUM re-firing every two bars, plus another detector and symbol.
+            for i in range(0, 12, 2):
+                bus.publish(Alarm("SPY", "cusum", T0 + i * MINUTE_NS))
+            bus.publish(Alarm("SPY", "page_hinkley", T0 + MINUTE_NS))
+            bus.publish(Alarm("QQQ", "cusum", T0 + MINUTE_NS))
+        return bus.metrics()
+
+    metrics = asyncio.run(run())
+    delivered = [alarm for batch in sink.batches for alarm in batch]
+    assert delivered == [
+        ("SPY", "cusum", T0, 2),
+        ("SPY", "cusum", T0 + 6 * MINUTE_NS, 2),
+        ("SPY", "page_hinkley", T0 + MINUTE_NS, 0),
+        ("QQQ", "cusum", T0 + MINUTE_NS, 0),
+    ]
+    assert (metrics.published, metrics.enqueued, metrics.coalesced, metrics.delivered) == (8, 4, 4, 4)
+    assert metrics.queue_depth == 0 and len(sink.batches) == 1
+
+
+def test_full_queue_drops_instead_of_blocking_the_publisher():
+    sink = ListSink(delay=0.05)
+
+    async def run(overflow):
+        async with AlarmBus([sink], maxsize=4, coalesce_ns=0, batch_size=2, overflow=overflow) as bus:
+            accepted = [bus.publish(Alarm("SPY", "cusum", T0 + i)) for i in range(10)]
+        return accepted, bus.metrics()
+
+    accepted, metrics = asyncio.run(run("drop_oldest"))
+    assert all(accepted) and metrics.dropped == 6 and metrics.max_queue_depth == 4
+    assert [alarm[2] - T0 for batch in sink.batches for alarm in batch] == [6, 7, 8, 9]
+
+    sink.batches.clear()
+    accepted, metrics = asyncio.run(run("drop_new"))
+    assert accepted == [True] * 4 + [False] * 6 and metrics.dropped == 6
+    assert [alarm[2] - T0 for batch in sink.batches for alarm in batch] == [0, 1, 2, 3]
+
+
+def test_put_waits_for_space_instead_of_dropping():
+    sink = ListSink(delay=0.01)
+
+    async def run():
+        async with AlarmBus([sink], maxsize=2, coalesce_ns=5, batch_size=2, flush_interval_s=0.01) as bus:
+            accepted = [await bus.put(Alarm("SPY", "cusum", T0 + 10 * i)) for i in range(10)]
+            accepted.append(await bus.put(Alarm("SPY", "cusum", T0 + 91)))
+        return accepted, bus.metrics()
+
+    accepted, metrics = asyncio.run(run())
+    assert accepted == [True] * 10 + [False]
+    assert metrics.dropped == 0 and metrics.max_queue_depth <= 2
+    assert (metrics.published, metrics.enqueued, metrics.coalesced, metrics.delivered) == (11, 10, 1, 10)
+    assert [alarm[2] - T0 for batch in sink.batches for alarm in batch] == list(range(0, 100, 10))
+
+
+def test_batches_fan_out_to_file_webhook_and_database_sinks(tmp_path):
+    posted = []
+
+    async def post(url, payload):
+        posted.append((url, payload))
+
+    store = sqlite_store()
+    path = tmp_path / "alarms.jsonl"
+    sinks = [
+        FileAlarmSink(str(path)),
+        WebhookAlarmSink("http://localhost/hook", post=post),
+        DatabaseAlarmSink(store.pool, dialect="sqlite"),
+        FailingSink(),
+    ]
+
+    async def run():
+        async with AlarmBus(sinks, coalesce_ns=0, batch_size=3, flush_interval_s=0.01) as bus:
+            for i in range(7):
+                bus.publish(Alarm("SPY", "bocpe", T0 + i * MINUTE_NS, kind="high"))
+        return bus.metrics()
+
+    metrics = asyncio.run(run())
+    lines = [json.loads(line) for line in path.read_text().splitlines()]
+    assert len(lines) == 7 and lines[0]["time"] == "2024-03-04T14:30:00+00:00" and lines[0]["kind"] == "high"
+    assert [len(payload["alarms"]) for _, payload in posted] == [3, 3, 1]
+    with store.pool.connection() as conn:
+        assert conn.execute('SELECT COUNT(*) FROM "ivm_alarms"').fetchone() == (7,)
+    assert metrics.batches == 3 and metrics.sink_errors == {"failing": 3}
+    store.pool.close()
+
+
+class _FlakyConnection:
+    """DB-API stand-in whose first ``fail_commits`` commits fail."""
+
+    def __init__(self, fail_commits):
+        self.fail_commits = fail_commits
+        self.statements = []
+
+    def cursor(self):
+        return self
+
+    def execute(self, sql, params=None):
+        self.statements.append((sql, params))
+
+    def executemany(self, sql, rows):
+        self.statements.append((sql, list(rows)))
+
+    def close(self):
+        pass
+
+    def commit(self):
+        if self.fail_commits:
+            self.fail_commits -= 1
+            raise ConnectionError("commit failed")
+
+    def rollback(self):
+        pass
+
+
+def test_database_sink_creates_a_timestamptz_table_until_it_is_committed():
+    conn = _FlakyConnection(fail_commits=1)
+    sink = DatabaseAlarmSink(ConnectionPool(lambda: conn, maxsize=1))
+    batch = [Alarm("SPY", "cusum", T0)]
+
+    with pytest.raises(ConnectionError):
+        asyncio.run(sink.deliver(batch))
+    asyncio.run(sink.deliver(batch))
+
+    sql = [statement for statement, _ in conn.statements]
+    assert [statement.split()[0] for statement in sql] == ["CREATE", "CREATE", "INSERT"]
+    assert '"time" TIMESTAMPTZ NOT NULL' in sql[0] and '"last_time" TIMESTAMPTZ NOT NULL' in sql[0]
+    (row,) = conn.statements[-1][1]
+    assert row[0] == row[-1] == datetime.datetime(2024, 3, 4, 14, 30, tzinfo=datetime.UTC)
+
+
+def test_a_slow_sink_does_not_stall_a_detection_thread():
+    sink = ListSink(delay=0.2)
+
+    async def run():
+        async with AlarmBus([sink], maxsize=16, coalesce_ns=0) as bus:
+            published = threading.Event()
+
+            def detect():
+                for i in range(100):
+                    bus.publish_threadsafe(Alarm("SPY", "cusum", T0 + i))
+                published.set()
+
+            await asyncio.get_running_loop().run_in_executor(None, detect)
+            assert published.is_set()
+            # The thread finished while the first batch was still being delivered.
+            assert sink.batches == []
+        return bus.metrics()
+
+    metrics = asyncio.run(run())
+    assert metrics.published == 100 and metrics.delivered + metrics.dropped == 100
+    assert metrics.dropped > 0
+
+
+def test_sinks_must_implement_deliver():
+    class Incomplete(AlarmSink):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
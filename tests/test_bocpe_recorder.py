@@ -0,0 +1,105 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.bocpe import VolatilityBOCPE, bocpe_trajectory
+from src.ivtool.detectors.bocpe_recorder import PosteriorRecorder, PosteriorStore
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+
+def _returns(n, seed=0):
+    rng = np.random.default_rng(seed)
+    return np.concatenate([rng.normal(0, 0.001, n // 2), rng.normal(0, 0.004, n - n // 2)])
+
+
+def test_recorded_ticks_match_the_full_posterior(tmp_path):
+    returns = _returns(120)
+    reference = VolatilityBOCPE(max_run_length=50)
+    with PosteriorRecorder(str(tmp_path), k=8, chunk_ticks=50) as recorder:
+        detector = VolatilityBOCPE(max_run_length=50, recorder=recorder)
+        for i, x in enumerate(returns):
+            detector.update(x)
+            reference.update(x)
+            if i == 99:
+                full = np.array(reference._state.run_length_probs)
+                alphas = np.array(reference._state.alpha_posteriors)
+                betas = np.array(reference._state.beta_posteriors)
+
+    store = PosteriorStore(str(tmp_path))
+    assert [chunk["rows"] for chunk in store.chunks] == [50, 50, 20]
+    ticks = store.load()
+    assert len(ticks) == 120 and ticks.run_length.dtype == np.uint16 and ticks.prob.dtype == np.float16
+    np.testing.assert_array_equal(ticks.time, np.arange(120))
+
+    top = np.argsort(-full, kind="stable")[:8]
+    np.testing.assert_array_equal(ticks.run_length[99], top)
+    np.testing.assert_allclose(ticks.prob[99], full[top], rtol=1e-3, atol=1e-6)
+    assert ticks.tail_mass[99] == pytest.approx(1.0 - full[top].sum(), abs=1e-3)
+    assert ticks.cp_prob[99] == pytest.approx(full[0], rel=1e-6)
+    assert ticks.expected_variance[99] == pytest.approx(full @ (betas / (alphas - 1.0)), rel=1e-6)
+    assert ticks.map_run_length[-1] == reference._map_run_length
+    assert np.all(ticks.log_evidence < 10) and np.all(np.isfinite(ticks.log_evidence))
+
+
+def test_trajectory_with_a_recorder_matches_the_kernel_path(tmp_path):
+    df = regime_switching_prices(3, seed=4)
+    _, plain = bocpe_trajectory(df, max_run_length=200, use_jit=False)
+    with PosteriorRecorder(str(tmp_path), k=4) as recorder:
+        times, recorded = bocpe_trajectory(df, max_run_length=200, recorder=recorder)
+
+    np.testing.assert_array_equal(recorded.cp_prob, plain.cp_prob)
+    store = PosteriorStore(str(tmp_path))
+    # One chunk per New York session.
+    assert store.days() == ["2015-01-02", "2015-01-05", "2015-01-06"]
+    ticks = store.load()
+    np.testing.assert_array_equal(ticks.map_run_length, plain.map_run_length)
+    assert pd.to_datetime(ticks.time[0], utc=True) == pd.Timestamp(times.iloc[0])
+
+
+def test_day_and_range_loads_are_memory_mapped(tmp_path):
+    df = regime_switching_prices(2, seed=1)
+    with PosteriorRecorder(str(tmp_path), k=4) as recorder:
+        times, _ = bocpe_trajectory(df, max_run_length=100, recorder=recorder)
+
+    store = PosteriorStore(str(tmp_path))
+    day = store.day("2015-01-05")
+    assert isinstance(day.prob, np.memmap) and len(day) == 390
+    assert pd.to_datetime(day.time, utc=True).tz_convert("America/New_York").strftime("%Y-%m-%d").unique().tolist() == ["2015-01-05"]
+
+    start, end = times.iloc[100], times.iloc[500]
+    window = store.load(start, end)
+    assert len(window) == 400
+    heatmap = window.heatmap(max_run_length=100)
+    assert heatmap.shape == (400, 101)
+    np.testing.assert_allclose(heatmap.sum(axis=1) + window.tail_mass, 1.0, atol=5e-3)
+    np.testing.assert_array_equal(heatmap[np.arange(400), window.map_run_length], window.prob[:, 0])
+    assert window.to_frame()["map_run_length"].tolist() == window.run_length[:, 0].tolist()
+    with pytest.raises(KeyError):
+        store.day("2015-01-07")
+
+
+def test_reopening_a_store_appends_chunks(tmp_path):
+    returns = _returns(30)
+    for _ in range(2):
+        with PosteriorRecorder(str(tmp_path), k=4, chunk_ticks=20) as recorder:
+            detector = VolatilityBOCPE(recorder=recorder)
+            for x in returns:
+                detector.update(x)
+
+    store = PosteriorStore(str(tmp_path))
+    assert [chunk["name"] for chunk in store.chunks] == ["chunk_000000", "chunk_000001", "chunk_000002", "chunk_000003"]
+    assert len(store) == 60 and store.load().run_length.dtype == np.int32
+    with pytest.raises(ValueError):
+        PosteriorRecorder(str(tmp_path), k=8)
+
+
+def test_run_length_dtype_comes_from_the_attached_detector(tmp_path):
+    with PosteriorRecorder(str(tmp_path), k=4) as recorder:
+        assert recorder.run_length_dtype == np.int32
+        detector = VolatilityBOCPE(max_run_length=50, recorder=recorder)
+        assert recorder.run_length_dtype == np.uint16
+        detector.update(0.001)
+        # Ticks are already recorded as uint16; an untruncated detector would overflow them.
+        with pytest.raises(ValueError):
+            VolatilityBOCPE(recorder=recorder)
+        VolatilityBOCPE(max_run_length=100, recorder=recorder)
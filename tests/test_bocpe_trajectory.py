@@ -0,0 +1,78 @@
+import contextlib
+import io
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.bocpe import VolatilityBOCPE, bocpe_trajectory, flag_bocpe, main_bocpe_run
+from src.ivtool.pipeline import main_factory
+from src.ivtool.pipeline.synthetic import regime_switching_prices, regime_switching_returns
+
+
+def _returns():
+    # Scaled up so the default prior (beta = 0.01) is informative.
+    returns, _ = regime_switching_returns(800, low_vol=0.02, high_vol=0.3, seed=5)
+    return returns
+
+
+@pytest.mark.parametrize("use_jit", [True, False])
+def test_rule_matrix_matches_one_run_per_rule(use_jit):
+    returns = _returns()
+    thresholds = np.array([0.3, 0.5, 0.7])
+    vol_thresholds = np.array([0.005, 0.01, 0.05])
+    trajectory = VolatilityBOCPE(hazard=1 / 200, max_run_length=150).trajectory(returns, use_jit=use_jit)
+
+    alarms = trajectory.alarms(thresholds)
+    high = trajectory.high_regime(vol_thresholds)
+    assert alarms.shape == high.shape == (3, returns.size)
+    for i, (threshold, vol_threshold) in enumerate(zip(thresholds, vol_thresholds)):
+        detector = VolatilityBOCPE(hazard=1 / 200, threshold=threshold, vol_threshold=vol_threshold, max_run_length=150)
+        expected = [detector.update(float(x)) for x in returns]
+        assert alarms[i].tolist() == [triggered for triggered, _ in expected]
+        assert high[i].tolist() == [regime == "High Volatility" for _, regime in expected]
+
+
+def test_trajectory_continues_from_detector_state():
+    returns = _returns()
+    detector = VolatilityBOCPE(hazard=1 / 200, vol_threshold=0.01)
+    head = detector.trajectory(returns[:300])
+    tail = detector.trajectory(returns[300:])
+    whole = VolatilityBOCPE(hazard=1 / 200, vol_threshold=0.01).trajectory(returns)
+
+    assert not tail.first_update
+    assert np.concatenate([head.alarms(0.5), tail.alarms(0.5)]).tolist() == whole.alarms(0.5).tolist()
+    assert np.concatenate([head.map_run_length, tail.map_run_length]).tolist() == whole.map_run_length.tolist()
+
+
+def test_flag_bocpe_matches_per_tick_updates():
+    df = regime_switching_prices(3, seed=2)
+    timestamps, trajectory = bocpe_trajectory(df, hazard=1 / 300, max_run_length=400, use_jit=False)
+    flagged = flag_bocpe(timestamps, trajectory, threshold=0.4, vol_threshold=2e-7)
+
+    detector = VolatilityBOCPE(hazard=1 / 300, threshold=0.4, vol_threshold=2e-7, max_run_length=400)
+    returns = np.log(df["price"]).diff().dropna().to_numpy()
+    expected = [(ts, regime) for ts, x in zip(df["time"].iloc[1:], returns) for triggered, regime in [detector.update(x)] if triggered]
+
+    assert len(expected) > 0
+    assert list(zip(flagged["timestamp"], flagged["new_regime"])) == expected
+    with pytest.raises(ValueError):
+        flag_bocpe(timestamps, trajectory, threshold=1.5)
+
+
+def test_calibration_shares_trajectories_across_decision_rules():
+    df = regime_switching_prices(3, seed=2)
+    grid = [
+        {"hazard": hazard, "threshold": threshold, "vol_threshold": vol_threshold, "max_run_length": 400}
+        for hazard in (1 / 300, 1 / 1000)
+        for threshold in (0.4, 0.6)
+        for vol_threshold in (1e-7, 2e-7)
+    ]
+    stdout = io.StringIO()
+    with contextlib.redirect_stdout(stdout):
+        shared = main_factory._shared_bocpe_outputs(df, grid)
+        separate = [main_bocpe_run(df, **params) for params in grid]
+
+    assert "2 posterior trajectories for 8 candidates" in stdout.getvalue()
+    for shared_frame, separate_frame in zip(shared, separate):
+        pd.testing.assert_frame_equal(shared_frame, separate_frame)
@@ -0,0 +1,83 @@
+import numpy as np
+import pytest
+
+from src.ivtool.detectors.bocpe import VolatilityBOCPE
+from src.ivtool.pipeline.cascade import alarm_recall, cascade_report, gate_windows, run_cascade
+from src.ivtool.pipeline.evaluation import DetectorSpec
+from src.ivtool.pipeline.synthetic import regime_switching_prices, regime_switching_returns
+
+BOCPE_PARAMS = {"hazard": 1 / 200, "threshold": 0.5, "vol_threshold": 0.01, "max_run_length": 100}
+
+
+def _returns(n=1500, seed=4):
+    # Scaled up so the default prior (beta = 0.01) is informative.
+    returns, _ = regime_switching_returns(n, low_vol=0.02, high_vol=0.3, seed=seed)
+    return returns
+
+
+def test_gate_windows_merge_overlapping_and_touching():
+    windows = gate_windows(np.array([50, 10, 12, 30]), n=60, pre=2, post=3)
+    # [8, 14) and [10, 16) overlap; [28, 34) and [48, 54) stand alone.
+    assert windows.tolist() == [[8, 16], [28, 34], [48, 54]]
+    assert gate_windows(np.array([0, 4]), n=6, pre=1, post=1).tolist() == [[0, 2], [3, 6]]
+    assert gate_windows(np.array([], dtype=np.int64), n=10, pre=1, post=1).shape == (0, 2)
+
+
+def test_checkpoint_mode_over_whole_series_matches_full_run():
+    returns = _returns()
+    full_alarms, full_high = VolatilityBOCPE(**BOCPE_PARAMS).run_array(returns)
+    gate = DetectorSpec("cusum", {"k": 0.0, "h": 1e-12})
+
+    result = run_cascade(returns, BOCPE_PARAMS, gate, pre=0, post=0, mode="checkpoint")
+
+    assert result.ticks_evaluated == returns.size
+    assert result.alarms.tolist() == full_alarms.tolist()
+    assert result.high_regime.tolist() == full_high.tolist()
+
+    # The final checkpoint carries the posterior into the next batch.
+    first = run_cascade(returns[:700], BOCPE_PARAMS, gate, pre=0, post=0, mode="checkpoint")
+    second = run_cascade(returns[700:], BOCPE_PARAMS, gate, pre=0, post=0, mode="checkpoint", resume=first.checkpoint)
+    assert np.concatenate([first.alarms, second.alarms]).tolist() == full_alarms.tolist()
+    assert second.checkpoint.t == returns.size
+
+
+@pytest.mark.parametrize("mode", ["reset", "checkpoint"])
+def test_cascade_only_alarms_inside_windows(mode):
+    returns = _returns()
+    gate = DetectorSpec("page_hinkley", {"alarm_threshold": 40.0})
+
+    result = run_cascade(returns, BOCPE_PARAMS, gate, pre=10, post=60, mode=mode, warmup=25)
+
+    inside = np.zeros(returns.size, dtype=bool)
+    for start, stop in result.windows:
+        inside[start:stop] = True
+    assert result.gate_alarms.size
+    assert not result.alarms[~inside].any()
+    assert result.evaluated[inside].all()
+    assert result.ticks_evaluated < returns.size
+
+
+def test_alarm_recall_uses_nearest_candidate():
+    assert alarm_recall(np.array([10, 50, 90]), np.array([12, 95]), tolerance=5) == pytest.approx(2 / 3)
+    assert alarm_recall(np.array([], dtype=np.int64), np.array([1]), tolerance=0) == 1.0
+    assert alarm_recall(np.array([3]), np.array([], dtype=np.int64), tolerance=10) == 0.0
+
+
+def test_cascade_report_rows():
+    report = cascade_report(_returns(n=800), BOCPE_PARAMS, pre=10, post=60, tolerance=10)
+
+    assert len(report) == 4
+    assert set(report["mode"]) == {"reset", "checkpoint"}
+    assert report["ticks_fraction"].between(0.0, 1.0).all()
+    assert report["recall"].between(0.0, 1.0).all()
+
+
+def test_default_gates_recover_full_run_alarms_on_a_fraction_of_ticks():
+    prices = regime_switching_prices(8, seed=0)
+    report = cascade_report(np.log(prices["price"]).diff().dropna().to_numpy())
+
+    assert (report["full_alarms"] >= 5).all()
+    assert (report["recall"] >= 0.8).all()
+    cusum = report[report["gate"].str.startswith("cusum")]
+    assert (cusum["ticks_fraction"] < 0.6).all()
+    assert (report["ticks_fraction"] < 0.8).all()
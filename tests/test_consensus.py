@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline import consensus
+from src.ivtool.pipeline.main_factory import high_risk_intervals, high_risk_regimes
+
+MINUTE = consensus.MINUTE_NS
+
+
+def _frame(minutes):
+    base = pd.Timestamp("2025-09-05 13:30", tz="UTC")
+    return pd.DataFrame({"timestamp": [base + pd.Timedelta(minutes=int(m)) for m in minutes]})
+
+
+def _exact_match_reference(*frames):
+    combined = pd.concat([frame["timestamp"] for frame in frames])
+    counts = combined.value_counts()
+    return sorted(counts[counts >= 2].index)
+
+
+def test_high_risk_regimes_matches_exact_timestamp_agreement():
+    rng = np.random.default_rng(0)
+    cusum = _frame(np.sort(rng.choice(390, 40, replace=False)))
+    bocpe = _frame(np.concatenate([np.arange(20, 90), np.arange(200, 260)]))
+    page_hinkley = _frame(np.concatenate([np.arange(50, 120), np.arange(300, 330)]))
+
+    result = high_risk_regimes(cusum, bocpe, page_hinkley)
+
+    assert result["timestamp"].tolist() == _exact_match_reference(cusum, bocpe, page_hinkley)
+    assert (result["regime"] == "high risk").all()
+
+
+def test_tolerance_window_matches_nearby_point_alarms():
+    cusum = _frame([10])
+    bocpe = _frame([12, 13])
+    page_hinkley = _frame([])
+
+    assert high_risk_intervals(cusum, bocpe, page_hinkley).empty
+    widened = high_risk_intervals(cusum, bocpe, page_hinkley, tolerance="2min")
+
+    assert len(widened) == 1
+    assert widened.loc[0, "detectors"] == 2
+
+
+def test_k_of_n_merges_overlapping_intervals():
+    intervals = {
+        "a": (np.array([0, 5]), np.array([10, 20])),
+        "b": (np.array([8]), np.array([30])),
+        "c": (np.array([25]), np.array([40])),
+    }
+
+    result = consensus.k_of_n(intervals, k=2)
+
+    assert result[["start", "end"]].values.tolist() == [[8, 20], [25, 30]]
+    assert consensus.k_of_n(intervals, k=3).empty
+    with pytest.raises(ValueError):
+        consensus.k_of_n(intervals, k=0)
+
+
+def test_runs_to_intervals_splits_on_gaps():
+    minutes = np.array([0, 1, 2, 5, 6, 10]) * MINUTE
+
+    starts, ends = consensus.runs_to_intervals(minutes)
+
+    assert (starts // MINUTE).tolist() == [0, 5, 10]
+    assert (ends // MINUTE).tolist() == [2, 6, 10]
+
+
+def test_streaming_engine_matches_batch_consensus():
+    rng = np.random.default_rng(4)
+    points = {name: np.sort(rng.choice(2000, 150, replace=False)) * MINUTE for name in "abc"}
+    tolerance = 2 * MINUTE
+    batch = consensus.k_of_n(
+        {name: consensus.points_to_intervals(ts, tolerance) for name, ts in points.items()}, k=2
+    )
+
+    engine = consensus.ConsensusEngine("abc", k=2, tolerance_ns=tolerance)
+    events = sorted((t, name) for name, ts in points.items() for t in ts)
+    emitted = []
+    for t, name in events:
+        engine.add(name, t)
+        emitted.append(engine.poll())
+    emitted.append(engine.close())
+    streamed = pd.concat(emitted, ignore_index=True)
+
+    pd.testing.assert_frame_equal(streamed[["start", "end"]], batch[["start", "end"]], check_dtype=False)
+
+
+def test_streaming_engine_rejects_out_of_order_alarms_and_honours_advance():
+    engine = consensus.ConsensusEngine(["a", "b", "c"], k=2)
+    engine.add("a", 100)
+    engine.add("b", 100)
+    with pytest.raises(ValueError):
+        engine.add("a", 50)
+
+    assert engine.poll().empty
+    engine.advance("c", 500)
+    engine.add("a", 400)
+    engine.add("b", 450)
+
+    assert engine.poll()[["start", "end"]].values.tolist() == [[100, 100]]
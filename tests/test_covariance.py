@@ -0,0 +1,106 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.covariance import (
+    CovarianceRegime,
+    asset_returns,
+    cholesky_update,
+    main_covariance_run,
+)
+
+
+def _correlated(n, n_assets, rho, vol, rng):
+    corr = np.full((n_assets, n_assets), rho)
+    np.fill_diagonal(corr, 1.0)
+    return rng.multivariate_normal(np.zeros(n_assets), corr * vol**2, size=n)
+
+
+def _shift(kind, n_assets=5, seed=0):
+    rng = np.random.default_rng(seed)
+    calm = {"rho": 0.2, "vol": 5e-4}
+    shifted = {"rho": 0.9, "vol": 5e-4} if kind == "correlation" else {"rho": 0.2, "vol": 1.5e-3}
+    return np.vstack([
+        _correlated(1000, n_assets, rng=rng, **calm),
+        _correlated(500, n_assets, rng=rng, **shifted),
+        _correlated(1000, n_assets, rng=rng, **calm),
+    ])
+
+
+def _stream(detector, returns):
+    scores, alarms = np.empty(len(returns)), np.zeros(len(returns), dtype=np.int8)
+    for i, r in enumerate(returns):
+        fired = detector.update(r)
+        scores[i] = detector.score
+        alarms[i] = 0 if fired is None else (1 if fired else -1)
+    return scores, alarms
+
+
+def test_rank_one_update_matches_a_full_factorisation():
+    rng = np.random.default_rng(1)
+    a = rng.standard_normal((6, 6))
+    cov = a @ a.T + np.eye(6)
+    x = rng.standard_normal(6)
+    L = np.linalg.cholesky(cov)
+    cholesky_update(L, x)
+    np.testing.assert_allclose(L, np.linalg.cholesky(cov + np.outer(x, x)), rtol=1e-10)
+
+
+@pytest.mark.parametrize("statistic", ["mahalanobis", "logdet"])
+def test_offline_blocks_match_the_streaming_updates(statistic):
+    returns = _shift("volatility", n_assets=4)[900:1300]
+    streaming = CovarianceRegime(4, statistic=statistic, prior_variance=2.5e-7)
+    offline = CovarianceRegime(4, statistic=statistic, prior_variance=2.5e-7)
+
+    expected_scores, expected_alarms = _stream(streaming, returns)
+    scores, alarms = offline.trajectory(returns[:250], block=64)
+    more_scores, more_alarms = offline.trajectory(returns[250:], block=64)
+
+    np.testing.assert_allclose(np.concatenate([scores, more_scores]), expected_scores, rtol=1e-8, atol=1e-10)
+    np.testing.assert_array_equal(np.concatenate([alarms, more_alarms]), expected_alarms)
+    assert expected_alarms.any()
+    np.testing.assert_allclose(offline.covariance, streaming.covariance, rtol=1e-8)
+    assert offline.state() == pytest.approx(streaming.state())
+
+
+def test_covariance_follows_the_exponential_recursion():
+    returns = np.random.default_rng(2).standard_normal((50, 3)) * 1e-3
+    detector = CovarianceRegime(3, decay=0.9, prior_variance=1e-6)
+    expected = np.eye(3) * 1e-6
+    for r in returns:
+        detector.update(r)
+        expected = 0.9 * expected + 0.1 * np.outer(r, r)
+    np.testing.assert_allclose(detector.covariance, expected, rtol=1e-10)
+
+
+def test_volatility_and_correlation_shifts_are_flagged():
+    _, alarms = CovarianceRegime(5, prior_variance=2.5e-7).trajectory(_shift("volatility"))
+    fired = np.flatnonzero(alarms)
+    assert alarms[fired[0]] == 1 and 1000 <= fired[0] < 1010
+    assert np.all(alarms[fired[fired < 1500]] == 1)
+
+    # Higher correlation shrinks the generalized variance.
+    _, alarms = CovarianceRegime(5, statistic="logdet", prior_variance=2.5e-7).trajectory(_shift("correlation"))
+    fired = np.flatnonzero(alarms)
+    assert 1000 <= fired[0] < 1100 and alarms[fired[0]] == -1
+    with pytest.raises(ValueError):
+        CovarianceRegime(5, statistic="trace")
+
+
+def test_main_run_flags_a_long_price_frame():
+    returns = _shift("volatility", n_assets=3, seed=3)
+    times = pd.date_range("2024-03-04 14:30", periods=len(returns) + 1, freq="1min", tz="UTC")
+    prices = 100.0 * np.exp(np.vstack([np.zeros(3), np.cumsum(returns, axis=0)]))
+    df = pd.concat([
+        pd.DataFrame({"time": times, "symbol": symbol, "price": prices[:, j]}) for j, symbol in enumerate(["SPY", "QQQ", "IWM"])
+    ], ignore_index=True).drop(index=5)
+
+    wide = asset_returns(df)
+    assert wide.columns.tolist() == ["IWM", "QQQ", "SPY"] and len(wide) == len(returns) - 2
+
+    flagged = main_covariance_run(df, symbols=["SPY", "QQQ", "IWM"])
+    assert flagged.columns.tolist() == ["timestamp", "alarm", "new_regime"]
+    assert flagged["new_regime"].iloc[0] == "High Volatility"
+    assert times[1000] <= flagged["timestamp"].iloc[0] < times[1020]
+    with pytest.raises(ValueError):
+        asset_returns(df.drop(columns="symbol"))
@@ -1,6 +1,5 @@
 import ast
 from pathlib import Path
-from typing import Dict
 
 
 def _load_cusum_class():
@@ -10,7 +9,7 @@ def _load_cusum_class():
         node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == "CUSUM"
     )
     module = ast.Module(body=[class_node], type_ignores=[])
-    namespace = {"Dict": Dict}
+    namespace = {"Dict": dict}
     exec(compile(module, str(source_path), "exec"), namespace)
     return namespace["CUSUM"]
 
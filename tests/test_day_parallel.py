@@ -0,0 +1,86 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.day_parallel import (
+    divergence_report,
+    mode_from_env,
+    run_day_parallel,
+    run_serial,
+    session_codes,
+    session_segments,
+)
+from src.ivtool.pipeline.evaluation import DetectorSpec
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+SPECS = [
+    DetectorSpec("cusum", {"k": 0.00005, "h": 0.0018}),
+    DetectorSpec("page_hinkley", {"alarm_threshold": 40.0}),
+    DetectorSpec("bocpe", {"hazard": 1 / 200, "threshold": 0.5, "vol_threshold": 0.0003, "max_run_length": 300}),
+]
+
+
+def _frame(n_sessions=4, seed=6):
+    return regime_switching_prices(n_sessions, seed=seed)
+
+
+def test_sessions_follow_the_new_york_calendar():
+    # 01:30 UTC belongs to the previous New York day.
+    times = pd.to_datetime(["2015-03-09 01:30", "2015-03-09 14:00", "2015-03-10 14:00"], utc=True)
+    codes, sessions = session_codes(times)
+
+    assert codes.tolist() == [0, 1, 2]
+    assert [str(day.date()) for day in sessions] == ["2015-03-08", "2015-03-09", "2015-03-10"]
+
+
+def test_session_segments_reset_and_warmup():
+    codes = np.array([0, 0, 0, 1, 1, 2, 2, 2])
+
+    assert session_segments(codes, 3).tolist() == [[0, 0, 3], [3, 3, 5], [5, 5, 8]]
+    assert session_segments(codes, 3, "warmup", 2).tolist() == [[0, 0, 3], [1, 3, 5], [3, 5, 8]]
+    with pytest.raises(ValueError):
+        session_segments(codes, 3, "stitch")
+
+
+def test_full_history_warmup_reproduces_the_serial_run():
+    df = _frame()
+    parallel = run_day_parallel(df, SPECS, boundary="warmup", warmup=len(df), workers=1)
+    serial = run_serial(df, SPECS)
+
+    pd.testing.assert_frame_equal(parallel[0], serial[0])
+    for parallel_frame, serial_frame in zip(parallel[1], serial[1]):
+        pd.testing.assert_frame_equal(parallel_frame, serial_frame)
+    pd.testing.assert_frame_equal(parallel[2], serial[2])
+
+    report = divergence_report(SPECS, serial, parallel)
+    assert report["serial"].sum() > 0
+    assert (report["only_serial"] == 0).all() and (report["only_parallel"] == 0).all()
+
+
+def test_reset_alarms_stay_inside_sessions_and_workers_agree():
+    df = _frame()
+    in_process = run_day_parallel(df, SPECS, boundary="reset", workers=1, sessions_per_task=1)
+    pooled = run_day_parallel(df, SPECS, boundary="reset", workers=2, sessions_per_task=1)
+
+    pd.testing.assert_frame_equal(in_process[0], pooled[0])
+    pd.testing.assert_frame_equal(in_process[2], pooled[2])
+
+    # Each session's CUSUM restarts from zero, so it matches a run over that session alone.
+    returns_time = df["time"].iloc[1:].reset_index(drop=True)
+    codes, _ = session_codes(returns_time)
+    first_session = df.iloc[: int(np.searchsorted(codes, 1)) + 1]
+    alone = run_serial(first_session, SPECS[:1])[0]
+    flagged = in_process[0]
+    pd.testing.assert_frame_equal(flagged[flagged["timestamp"].isin(first_session["time"])], alone)
+
+
+def test_mode_from_env(monkeypatch):
+    monkeypatch.delenv("IVTOOL_DAY_PARALLEL", raising=False)
+    assert mode_from_env() is None
+    monkeypatch.setenv("IVTOOL_DAY_PARALLEL", "warmup:90")
+    assert mode_from_env() == ("warmup", 90)
+    monkeypatch.setenv("IVTOOL_DAY_PARALLEL", "reset")
+    assert mode_from_env() == ("reset", 0)
+    monkeypatch.setenv("IVTOOL_DAY_PARALLEL", "threads")
+    with pytest.raises(ValueError):
+        mode_from_env()
@@ -0,0 +1,102 @@
+import numpy as np
+import pandas as pd
+
+from src.ivtool.pipeline.consensus import day_flag_matrix
+from src.ivtool.pipeline.main_factory import (
+    detector_disagreement_days,
+    disagreement_days,
+    model_pair_agreement,
+)
+
+
+def _timestamps(rng, days, n):
+    base = pd.Timestamp("2025-09-01 13:30", tz="UTC")
+    day = rng.choice(days, n)
+    minute = rng.integers(0, 390, n)
+    return pd.DataFrame({"timestamp": [base + pd.Timedelta(days=int(d), minutes=int(m)) for d, m in zip(day, minute)]})
+
+
+def _set_based_reference(cusum, bocpe, page_hinkley):
+    sets = [set(pd.to_datetime(frame["timestamp"], utc=True).dt.normalize()) for frame in (cusum, bocpe, page_hinkley)]
+    rows = []
+    for day in sorted(set().union(*sets)):
+        flags = [day in days for days in sets]
+        if len(set(flags)) > 1:
+            rows.append({
+                "date": day.date().isoformat(),
+                "cusum_flag": flags[0],
+                "bocpe_flag": flags[1],
+                "page_hinkley_flag": flags[2],
+                "models_flagging": sum(flags),
+            })
+    return pd.DataFrame(rows)
+
+
+def test_disagreement_days_matches_set_based_reference():
+    rng = np.random.default_rng(1)
+    cusum = _timestamps(rng, np.arange(0, 30), 60)
+    bocpe = _timestamps(rng, np.arange(10, 30), 20)
+    page_hinkley = _timestamps(rng, np.arange(0, 15), 25)
+
+    result = disagreement_days(cusum, bocpe, page_hinkley, bocpe.iloc[::4], page_hinkley.iloc[::4])
+    expected = _set_based_reference(cusum, bocpe, page_hinkley)
+
+    pd.testing.assert_frame_equal(result[expected.columns], expected, check_dtype=False)
+
+
+def test_day_flag_matrix_counts_and_first_alarms():
+    stamps = {
+        "a": pd.Series(pd.to_datetime(["2025-09-02 15:00", "2025-09-02 14:00", "2025-09-03 14:00"], utc=True)),
+        "b": pd.Series(pd.to_datetime(["2025-09-03 16:00"], utc=True)),
+    }
+
+    matrix = day_flag_matrix(stamps)
+    frame = matrix.to_frame()
+
+    assert frame["date"].tolist() == ["2025-09-02", "2025-09-03"]
+    assert matrix.alarm_counts.tolist() == [[2, 1], [0, 1]]
+    assert frame["a_first_alarm"].tolist() == list(pd.to_datetime(["2025-09-02 14:00", "2025-09-03 14:00"], utc=True))
+    assert pd.isna(frame.loc[0, "b_first_alarm"])
+    assert matrix.disagreement.tolist() == [True, False]
+
+    pairs = matrix.pairwise_agreement()
+    assert pairs.loc[0, ["both_flag", "either_flag", "jaccard", "agreement_rate"]].tolist() == [1, 2, 0.5, 0.5]
+
+
+def test_regime_minutes_flag_days_while_alarms_are_counted():
+    # One BOCPE change point opens a high regime that runs into the next day.
+    alarm = pd.DataFrame({"timestamp": pd.to_datetime(["2025-09-02 19:58"], utc=True), "new_regime": "High Volatility"})
+    minutes = pd.DataFrame({"timestamp": pd.date_range("2025-09-02 19:58", "2025-09-03 00:02", freq="1min", tz="UTC")})
+    empty = pd.DataFrame({"timestamp": pd.to_datetime([], utc=True)})
+
+    result = disagreement_days(empty, minutes, empty, alarm, empty)
+
+    assert result["date"].tolist() == ["2025-09-02", "2025-09-03"]
+    assert result["bocpe_flag"].all()
+    assert result["bocpe_alarms"].tolist() == [1, 0]
+    assert result.loc[0, "bocpe_first_alarm"] == alarm.loc[0, "timestamp"]
+    assert pd.isna(result.loc[1, "bocpe_first_alarm"])
+
+
+def test_detector_disagreement_days_handles_any_number_of_detectors():
+    day = pd.Series(pd.to_datetime(["2025-09-02 14:00"], utc=True))
+    other = pd.Series(pd.to_datetime(["2025-09-04 14:00"], utc=True))
+
+    result = detector_disagreement_days({"a": day, "b": day, "c": day, "d": other})
+
+    assert result["models_flagging"].tolist() == [3, 1]
+    assert result["d_flag"].tolist() == [False, True]
+
+
+def test_model_pair_agreement_covers_each_detector_pair():
+    day = pd.DataFrame({"timestamp": pd.to_datetime(["2025-09-02 14:00"], utc=True)})
+    other = pd.DataFrame({"timestamp": pd.to_datetime(["2025-09-03 14:00"], utc=True)})
+
+    pairs = model_pair_agreement(day, day, other)
+
+    assert list(zip(pairs["detector_a"], pairs["detector_b"])) == [
+        ("cusum", "bocpe"),
+        ("cusum", "page_hinkley"),
+        ("bocpe", "page_hinkley"),
+    ]
+    assert pairs["jaccard"].tolist() == [1.0, 0.0, 0.0]
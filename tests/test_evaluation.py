@@ -0,0 +1,68 @@
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.evaluation import (
+    DetectorSpec,
+    ShiftScenario,
+    detector_alarms,
+    evaluate,
+    run_trial,
+)
+
+SCENARIO = ShiftScenario(n_bars=800, change_point=400, base_vol=0.0003, shift_factor=4.0)
+SPECS = [
+    DetectorSpec("cusum", {"k": 0.00005, "h": 0.0023}),
+    DetectorSpec("page_hinkley", {"alarm_threshold": 60.0}),
+    DetectorSpec("bocpe", {"hazard": 1 / 200, "threshold": 0.5, "vol_threshold": 1e-7, "max_run_length": 50}),
+]
+
+
+def test_detector_alarms_rejects_unknown_detector():
+    with pytest.raises(ValueError):
+        detector_alarms(DetectorSpec("ewma"), np.zeros(10))
+
+
+def test_page_hinkley_alarms_are_indexed_into_returns():
+    returns = np.concatenate([np.full(200, 0.0001), np.full(200, 0.003)]) * np.tile([1, -1], 200)
+
+    alarms = detector_alarms(DetectorSpec("page_hinkley", {"alarm_threshold": 20.0}), returns)
+
+    assert alarms.size
+    assert alarms.min() >= 200
+
+
+def test_run_trial_measures_delay_after_change_point():
+    records = run_trial(SPECS[:2], SCENARIO, seed=3)
+
+    for record in records:
+        assert record["bars"] == SCENARIO.n_bars
+        assert math.isnan(record["delay"]) or record["delay"] >= 0.0
+    assert not math.isnan(records[1]["delay"])
+
+
+def test_evaluate_is_independent_of_worker_count():
+    serial = evaluate(SPECS, SCENARIO, n_trials=6, seed=5, workers=1, batch_size=2)
+    parallel = evaluate(SPECS, SCENARIO, n_trials=6, seed=5, workers=2, batch_size=2)
+
+    columns = ["trial", "label", "null_alarms", "pre_change_alarms", "delay"]
+    pd.testing.assert_frame_equal(
+        serial.trials[columns].sort_values(["trial", "label"]).reset_index(drop=True),
+        parallel.trials[columns].sort_values(["trial", "label"]).reset_index(drop=True),
+    )
+    assert len(serial.summary) == len(SPECS)
+    assert set(serial.summary.columns) >= {"arl0", "detection_rate", "delay_median", "delay_p90", "us_per_tick"}
+
+
+def test_evaluate_can_resample_historical_returns():
+    history = np.random.default_rng(0).standard_normal(5000) * 0.0002
+
+    result = evaluate(SPECS[:1], SCENARIO, n_trials=4, workers=1, base_returns=history)
+
+    assert result.summary.loc[0, "trials"] == 4
+    with pytest.raises(ValueError):
+        evaluate(SPECS[:1], SCENARIO, n_trials=1, workers=1, base_returns=history[:100])
+    with pytest.raises(ValueError):
+        evaluate(SPECS[:1], SCENARIO, n_trials=0, workers=1)
@@ -0,0 +1,55 @@
+import subprocess
+import sys
+from pathlib import Path
+
+import pytest
+
+REPO_ROOT = Path(__file__).resolve().parents[1]
+
+# Self time of the ivtool modules themselves, excluding NumPy.
+IMPORT_BUDGET_US = 100_000
+HEAVY_MODULES = {"pandas", "psycopg2", "dotenv", "matplotlib", "numba", "scipy"}
+
+
+def _importtime(statement):
+    result = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", statement],
+        cwd=REPO_ROOT,
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    modules = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "self [us]" in line:
+            continue
+        self_us, _cumulative_us, name = line[len("import time:"):].split("|")
+        modules[name.strip()] = int(self_us)
+    return modules
+
+
+@pytest.mark.parametrize(
+    "statement",
+    [
+        "import src.ivtool",
+        "import src.ivtool.detectors.cusum, src.ivtool.detectors.page_hinkley, src.ivtool.detectors.bocpe",
+        "import src.ivtool.detectors.kernels",
+        "import src.ivtool.detectors.base",
+        "import src.ivtool.pipeline.main_factory",
+    ],
+)
+def test_import_does_not_load_heavy_dependencies(statement):
+    modules = _importtime(statement)
+
+    loaded = {name.split(".")[0] for name in modules}
+    assert not loaded & HEAVY_MODULES
+
+
+def test_detector_import_time_within_budget():
+    modules = _importtime(
+        "import src.ivtool.detectors.cusum, src.ivtool.detectors.page_hinkley, "
+        "src.ivtool.detectors.bocpe, src.ivtool.pipeline.main_factory"
+    )
+
+    own_time = sum(us for name, us in modules.items() if name.startswith("src"))
+    assert own_time < IMPORT_BUDGET_US
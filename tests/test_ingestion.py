@@ -0,0 +1,134 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.ingestion import append_runs, ingest, session_ranges
+from src.ivtool.storage import sqlite_store
+
+
+class _Data:
+    def __init__(self, frame):
+        self._frame = frame
+
+    def to_df(self):
+        return self._frame
+
+
+class _Timeseries:
+    def __init__(self, client):
+        self.client = client
+
+    def get_range(self, dataset, symbols, schema, start, end):
+        self.client.requests.append((symbols[0], start, end))
+        # Pre- and post-market bars too, as the real feed returns them.
+        index = pd.date_range(start, end, freq="1min", inclusive="left", tz="UTC")
+        index = index[index < self.client.available_until]
+        frame = pd.DataFrame(
+            {"symbol": symbols[0], "close": 400.0 + np.arange(len(index)) * 0.01},
+            index=pd.Index(index, name="ts_event"),
+        )
+        return _Data(frame)
+
+
+class FakeDatabento:
+    def __init__(self, available_until="2100-01-01"):
+        self.requests = []
+        self.available_until = pd.Timestamp(available_until, tz="UTC")
+        self.timeseries = _Timeseries(self)
+
+
+@pytest.fixture
+def store():
+    store = sqlite_store()
+    yield store
+    store.pool.close()
+
+
+def _rows(store):
+    return len(store.read_range())
+
+
+def test_session_ranges_skip_weekends_and_start_after_the_watermark():
+    # Friday 2024-03-08 12:00 New York (17:00 UTC) to Tuesday 2024-03-12 midnight UTC.
+    ranges = session_ranges(pd.Timestamp("2024-03-08 17:00", tz="UTC"), pd.Timestamp("2024-03-12", tz="UTC"))
+
+    assert [(str(start), str(end)) for start, end in ranges] == [
+        ("2024-03-08 17:01:00+00:00", "2024-03-08 21:01:00+00:00"),
+        # New York is on daylight time from Sunday 2024-03-10.
+        ("2024-03-11 13:30:00+00:00", "2024-03-11 20:01:00+00:00"),
+    ]
+    assert session_ranges(pd.Timestamp("2024-03-08 21:00", tz="UTC"), pd.Timestamp("2024-03-09", tz="UTC")) == []
+
+
+def test_backfill_then_incremental_runs_fetch_only_new_sessions(store):
+    client = FakeDatabento()
+    (first,) = ingest(client, store, until=pd.Timestamp("2024-03-09", tz="UTC"), backfill_days=7)
+
+    # Five weekday sessions of 391 regular-hours bars (09:30 to 16:00 inclusive).
+    assert first.watermark is None
+    assert first.sessions == 5 and len(client.requests) == 5
+    assert first.rows_inserted == _rows(store) == 5 * 391
+    assert first.new_watermark == "2024-03-08T21:00:00+00:00"
+
+    client.requests.clear()
+    (second,) = ingest(client, store, until=pd.Timestamp("2024-03-12", tz="UTC"))
+
+    assert second.watermark == first.new_watermark
+    assert second.sessions == 1 and client.requests[0][1].startswith("2024-03-11T13:30")
+    assert second.rows_inserted == 391 and _rows(store) == 6 * 391
+
+    client.requests.clear()
+    (idle,) = ingest(client, store, until=pd.Timestamp("2024-03-12", tz="UTC"))
+    assert idle.sessions == 0 and client.requests == [] and idle.rows_inserted == 0
+
+
+def test_rows_already_stored_are_filtered_before_the_insert(store):
+    client = FakeDatabento()
+    ingest(client, store, until=pd.Timestamp("2024-03-07", tz="UTC"), backfill_days=3)
+    # Punch a hole into the stored history, then repair it from an earlier time.
+    with store.pool.connection() as conn:
+        conn.execute('DELETE FROM "SPY_DATA_V2" WHERE "time" LIKE \'2024-03-05 15:%\'')
+
+    (repair,) = ingest(client, store, until=pd.Timestamp("2024-03-07", tz="UTC"), since=pd.Timestamp("2024-03-05", tz="UTC"))
+
+    assert repair.sessions == 2 and repair.rows_fetched == 2 * 391
+    assert repair.rows_new == repair.rows_inserted == 60
+    assert _rows(store) == 3 * 391
+    assert repair.new_watermark == repair.watermark
+
+
+def test_partial_session_resumes_after_the_last_bar(store):
+    client = FakeDatabento(available_until="2024-03-04 15:00")
+    (first,) = ingest(client, store, until=pd.Timestamp("2024-03-05", tz="UTC"), backfill_days=1)
+    assert first.rows_inserted == 30
+
+    client.available_until = pd.Timestamp("2100-01-01", tz="UTC")
+    (second,) = ingest(client, store, until=pd.Timestamp("2024-03-05", tz="UTC"))
+    assert second.rows_inserted == 391 - 30
+    assert _rows(store) == 391
+
+
+def test_run_metrics_are_logged_as_json_lines(store, tmp_path):
+    ticks = iter(np.arange(0.0, 100.0, 0.5))
+    runs = ingest(FakeDatabento(), store, symbols=["SPY", "QQQ"], until=pd.Timestamp("2024-03-05", tz="UTC"),
+                  backfill_days=1, clock=lambda: next(ticks))
+    path = tmp_path / "runs.jsonl"
+    append_runs(runs, str(path))
+
+    records = [json.loads(line) for line in path.read_text().splitlines()]
+    assert [record["symbol"] for record in records] == ["SPY", "QQQ"]
+    assert all(record["rows_inserted"] == 391 for record in records)
+    assert all(record["rows_per_s"] == pytest.approx(391 / record["wall_s"]) for record in records)
+    assert all(record["fetch_latency_s"] > 0 for record in records)
+
+
+def test_iso_strings_with_an_offset_are_converted_to_utc(store):
+    by_stamp, by_string = FakeDatabento(), FakeDatabento()
+    other = sqlite_store()
+    ingest(by_stamp, other, until=pd.Timestamp("2024-03-07", tz="UTC"), since=pd.Timestamp("2024-03-05", tz="UTC"))
+    other.pool.close()
+    ingest(by_string, store, until="2024-03-06T19:00-05:00", since="2024-03-05T01:00+01:00")
+    assert by_string.requests == by_stamp.requests
+    assert len(by_string.requests) == 2
@@ -0,0 +1,128 @@
+import json
+
+import pytest
+
+from src.ivtool.pipeline import instrumentation, main_factory
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+
+def test_spans_nest_and_record_rows():
+    timer = instrumentation.start_run("test-run")
+
+    with instrumentation.span("outer", rows=10), instrumentation.span("inner", detector="cusum") as inner:
+        inner.rows = 3
+
+    outer, inner = timer.spans
+    assert (outer.name, outer.parent, outer.depth, outer.rows) == ("outer", None, 0, 10)
+    assert (inner.name, inner.parent, inner.depth, inner.rows) == ("inner", "outer", 1, 3)
+    assert inner.attrs == {"detector": "cusum"}
+    assert outer.wall_s >= inner.wall_s >= 0.0
+
+
+def test_report_can_leave_out_open_spans():
+    timer = instrumentation.start_run("test-run")
+
+    with instrumentation.span("outer"):
+        with instrumentation.span("done"):
+            pass
+        report = timer.report(include_open=False)
+
+    assert [record["name"] for record in report["spans"]] == ["done"]
+    assert set(report["totals"]) == {"done"}
+    assert [record["name"] for record in timer.report()["spans"]] == ["outer", "done"]
+
+
+def test_timed_decorator_counts_result_rows():
+    timer = instrumentation.start_run()
+
+    @instrumentation.timed("stage")
+    def stage():
+        return [1, 2, 3]
+
+    @instrumentation.timed("other", rows=lambda result: result["n"])
+    def other():
+        return {"n": 7}
+
+    stage()
+    stage()
+    other()
+
+    assert [record.rows for record in timer.spans] == [3, 3, 7]
+    assert timer.totals()["stage"]["calls"] == 2
+
+
+def test_spans_outside_a_run_are_not_kept():
+    timer = instrumentation.start_run()
+    assert instrumentation.end_run() is timer
+
+    with instrumentation.span("ignored", rows=2) as record:
+        record.rows = 5
+
+    assert timer.spans == [] and instrumentation.current_timer() is None
+
+
+def test_report_is_json_serialisable(tmp_path):
+    timer = instrumentation.start_run("abc")
+    with instrumentation.span("load", rows=1):
+        pass
+
+    path = timer.write_json(tmp_path / "report.json")
+    report = json.loads(path.read_text())
+
+    assert report["run_id"] == "abc"
+    assert report["spans"][0]["name"] == "load"
+    assert "load" in report["totals"]
+
+
+@pytest.mark.parametrize("mode", ["cprofile", "tracemalloc", ""])
+def test_profiling_hook_is_driven_by_environment(tmp_path, monkeypatch, mode):
+    monkeypatch.setenv(instrumentation.PROFILE_ENV, mode)
+    timer = instrumentation.start_run()
+    report_path = tmp_path / "report.json"
+
+    with instrumentation.profiling(timer, report_path):
+        sum(range(1000))
+
+    if mode == "cprofile":
+        assert (tmp_path / "report.pstats").exists()
+    elif mode == "tracemalloc":
+        assert timer.extra["tracemalloc"]["peak_mb"] >= 0.0
+    else:
+        assert timer.extra == {}
+
+
+def test_main_writes_timing_report(tmp_path, monkeypatch):
+    df = regime_switching_prices(n_sessions=21, seed=1).drop(columns="regime")
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(main_factory, "get_data", lambda: df)
+    monkeypatch.setattr(
+        main_factory,
+        "CALIBRATION_GRID",
+        {
+            "cusum": [main_factory.DEFAULT_CUSUM_PARAMS],
+            "bocpe": [main_factory.DEFAULT_BOCPE_PARAMS],
+            "page_hinkley": [main_factory.DEFAULT_PAGE_HINKLEY_PARAMS],
+        },
+    )
+
+    main_factory.main()
+    assert instrumentation.current_timer() is None
+
+    report = json.loads((tmp_path / "timing_report.json").read_text())
+    names = {record["name"] for record in report["spans"]}
+    assert {
+        "main",
+        "calibration.cusum_candidate",
+        "calibration.bocpe_candidate",
+        "calibration.page_hinkley_candidate",
+        "calibration.score",
+        "regimes.high_risk",
+        "write.results",
+    } <= names
+
+    metadata = json.loads((tmp_path / "run_metadata.json").read_text())
+    timed = {record["name"] for record in metadata["timing"]["spans"]}
+    assert "regimes.high_risk" in timed and not {"main", "write.results"} & timed
+    assert metadata["timing"]["report_path"] == "timing_report.json"
+    assert metadata["table_rows"]["model_pair_agreement"] == 3
+    assert (tmp_path / "model_pair_agreement.csv").exists()
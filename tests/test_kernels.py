@@ -0,0 +1,130 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors import kernels
+from src.ivtool.detectors.bocpe import VolatilityBOCPE, run_bocpe
+from src.ivtool.detectors.cusum import CUSUM, run_cusum
+from src.ivtool.detectors.page_hinkley import Page_Hinkley, run_page_hinkley
+
+
+def _kernel_variants(name):
+    variants = [pytest.param(kernels._KERNELS[name], id="python")]
+    variants.append(
+        pytest.param(
+            "compiled",
+            id="numba",
+            marks=pytest.mark.skipif(not kernels.jit_available(), reason="numba not installed"),
+        )
+    )
+    return variants
+
+
+def _resolve(kernel, name):
+    return kernels.get_kernel(name) if kernel == "compiled" else kernel
+
+
+def _regime_switching_returns(n=1500, seed=7, low=0.0001, high=0.0008):
+    rng = np.random.default_rng(seed)
+    scale = np.where((np.arange(n) // 250) % 2 == 0, low, high)
+    return rng.standard_normal(n) * scale
+
+
+def _price_frame(returns):
+    prices = 500.0 * np.exp(np.concatenate([[0.0], np.cumsum(returns)]))
+    times = pd.date_range("2025-09-02 13:30", periods=len(prices), freq="1min", tz="UTC")
+    return pd.DataFrame({"time": times, "price": prices})
+
+
+@pytest.mark.parametrize("kernel", _kernel_variants("cusum"))
+def test_cusum_kernel_matches_reference(kernel):
+    returns = _regime_switching_returns()
+    detector = CUSUM(k=0.00005, h=0.0023)
+    expected = np.array([detector.update(float(x)) for x in returns])
+
+    alarms = _resolve(kernel, "cusum")(returns, 0.00005, 0.0023, 0.0)
+
+    assert expected.any()
+    np.testing.assert_array_equal(alarms, expected)
+
+
+@pytest.mark.parametrize("kernel", _kernel_variants("page_hinkley"))
+def test_page_hinkley_kernel_matches_reference(kernel):
+    std_series = pd.Series(_regime_switching_returns()).rolling(30).std().dropna().to_numpy()
+    detector = Page_Hinkley(alarm_threshold=40.0)
+    for i, x_std in enumerate(std_series):
+        detector.update(float(x_std), i)
+
+    high, low = _resolve(kernel, "page_hinkley")(std_series, 40.0)
+
+    assert detector.high_indices and detector.low_indices
+    assert high.tolist() == detector.high_indices
+    assert low.tolist() == detector.low_indices
+
+
+@pytest.mark.parametrize("kernel", _kernel_variants("bocpe"))
+@pytest.mark.parametrize("max_run_length", [None, 60])
+def test_bocpe_kernel_matches_reference(kernel, max_run_length):
+    # Scaled up so the default prior (beta = 0.01) is informative.
+    returns = _regime_switching_returns(n=600, low=0.02, high=0.3)
+    detector = VolatilityBOCPE(hazard=1 / 200, threshold=0.5, vol_threshold=0.01, max_run_length=max_run_length)
+    kernel_args = detector._kernel_args(returns.size)
+    expected = []
+    for x in returns:
+        triggered, regime = detector.update(float(x))
+        expected.append((detector._cp_prob, detector._map_run_length, triggered, regime))
+
+    cp_prob, map_run_length, expected_variance, *_ = _resolve(kernel, "bocpe")(returns, *kernel_args)
+
+    # Compiled lgamma/exp may differ from the math module in the last ulp.
+    np.testing.assert_allclose(cp_prob, [cp for cp, _, _, _ in expected], rtol=1e-12, atol=1e-300)
+    assert map_run_length.tolist() == [run_length for _, run_length, _, _ in expected]
+    assert any(triggered for _, _, triggered, _ in expected)
+    assert (expected_variance > 0.01).tolist() == [regime == "High Volatility" for _, _, _, regime in expected]
+
+
+def test_run_functions_agree_with_and_without_jit():
+    returns = pd.Series(_regime_switching_returns(n=800))
+    df = _price_frame(returns.to_numpy())
+
+    pd.testing.assert_series_equal(
+        run_cusum(returns, k=0.00005, h=0.0023, use_jit=True),
+        run_cusum(returns, k=0.00005, h=0.0023, use_jit=False),
+    )
+    for jit_frame, ref_frame in zip(
+        run_page_hinkley(df, alarm_threshold=40.0, use_jit=True),
+        run_page_hinkley(df, alarm_threshold=40.0, use_jit=False),
+    ):
+        pd.testing.assert_frame_equal(jit_frame, ref_frame)
+    scaled = returns * 100
+    for jit_series, ref_series in zip(
+        run_bocpe(scaled, vol_threshold=0.01, max_run_length=100, use_jit=True),
+        run_bocpe(scaled, vol_threshold=0.01, max_run_length=100, use_jit=False),
+    ):
+        pd.testing.assert_series_equal(jit_series, ref_series, check_dtype=False)
+
+
+def test_jit_can_be_disabled_by_environment(monkeypatch):
+    monkeypatch.setenv("IVTOOL_JIT", "0")
+
+    assert not kernels.jit_available()
+    assert kernels.get_kernel("cusum") is kernels.cusum_kernel
+
+
+@pytest.mark.parametrize("use_jit", [True, False])
+@pytest.mark.parametrize("max_run_length", [None, 60])
+def test_bocpe_run_array_resumes_from_checkpoint(use_jit, max_run_length):
+    returns = _regime_switching_returns(n=600, low=0.02, high=0.3)
+    params = {"hazard": 1 / 200, "threshold": 0.5, "vol_threshold": 0.01, "max_run_length": max_run_length}
+    whole = VolatilityBOCPE(**params)
+    alarms, high = whole.run_array(returns, use_jit=use_jit)
+
+    first = VolatilityBOCPE(**params)
+    head_alarms, head_high = first.run_array(returns[:250], use_jit=use_jit)
+    second = VolatilityBOCPE(**params)
+    second.restore(first.checkpoint())
+    tail_alarms, tail_high = second.run_array(returns[250:], use_jit=use_jit)
+
+    assert np.concatenate([head_alarms, tail_alarms]).tolist() == alarms.tolist()
+    assert np.concatenate([head_high, tail_high]).tolist() == high.tolist()
+    assert second.checkpoint() == whole.checkpoint()
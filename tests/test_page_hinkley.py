@@ -2,7 +2,6 @@ import ast
 import math
 from datetime import datetime
 from pathlib import Path
-from typing import Dict
 
 
 def _load_page_hinkley_class():
@@ -12,7 +11,7 @@ def _load_page_hinkley_class():
         node for node in tree.body if isinstance(node, ast.ClassDef) and node.name == "Page_Hinkley"
     )
     module = ast.Module(body=[class_node], type_ignores=[])
-    namespace = {"Dict": Dict, "math": math}
+    namespace = {"Dict": dict, "math": math}
     exec(compile(module, str(source_path), "exec"), namespace)
     return namespace["Page_Hinkley"]
 
@@ -0,0 +1,120 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.cusum import main_cusum_run
+from src.ivtool.detectors.inputs import detector_inputs
+from src.ivtool.pipeline.quality import POLICY_ENV, policy_from_env, prepare_prices
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+# The synthetic sessions run 13:30-20:00 UTC.
+CALENDAR = {"calendar_tz": "UTC", "session_open": "13:30", "session_close": "20:00"}
+
+
+def _dirty_frame():
+    df = regime_switching_prices(3, seed=0)
+    df = pd.concat([df, df.iloc[[5, 6]]]).reset_index(drop=True)  # two duplicated bars
+    df.loc[10, "price"] = -1.0
+    df = df.drop(index=range(50, 60))  # ten missing minutes in session 0
+    df.loc[100:120, "price"] = df.loc[100, "price"]  # a 21-bar stale run
+    outside = df.iloc[[0]].assign(time=pd.Timestamp("2015-01-02 21:00", tz="UTC"))
+    return pd.concat([df, outside]).sample(frac=1.0, random_state=0)
+
+
+def test_summary_counts_duplicates_invalid_gaps_and_stale_runs():
+    summary = prepare_prices(_dirty_frame(), "mask", **CALENDAR).summary
+
+    assert summary.duplicates == 2
+    assert summary.invalid_prices == 1
+    assert summary.outside_session == 1
+    assert summary.sessions == 3
+    assert summary.missing_minutes == 11
+    assert summary.intraday_gaps == 2
+    assert summary.largest_gap_minutes == 10
+    assert summary.stale_runs == 1
+    assert summary.stale_minutes == 20
+    assert summary.masked_returns == 3 + 2 + 20
+    assert summary.rows_out == 3 * 390 - 11
+
+
+def test_mask_policy_drops_overnight_gap_and_stale_returns():
+    prepared = prepare_prices(_dirty_frame(), "mask", **CALENDAR)
+    frame = prepared.frame
+
+    assert frame["time"].is_monotonic_increasing and frame["time"].is_unique
+    starts = frame["session"].diff().fillna(1).ne(0)
+    assert frame.loc[starts, "log_return"].isna().all()
+    assert np.isfinite(frame.loc[~frame["log_return"].isna(), "log_return"]).all()
+    assert not prepared.reset_sessions
+
+
+def test_fill_policy_completes_the_session_grid():
+    prepared = prepare_prices(_dirty_frame(), "fill", **CALENDAR)
+    frame = prepared.frame
+
+    assert len(frame) == 3 * 390
+    assert prepared.summary.filled_minutes == 11
+    assert (frame.groupby("session")["time"].diff().dropna() == pd.Timedelta("1min")).all()
+    assert (frame.loc[frame["filled"], "log_return"] == 0.0).all()
+    assert prepared.summary.masked_returns == 3
+
+
+@pytest.mark.parametrize("policy", ["mask", "fill", "reset"])
+def test_empty_and_out_of_session_input_prepare_to_empty_frames(policy):
+    df = _dirty_frame()
+    overnight = df.assign(time=df["time"].dt.normalize() + pd.Timedelta(hours=2))
+    for frame in (df.iloc[:0], overnight):
+        prepared = prepare_prices(frame, policy, **CALENDAR)
+        assert prepared.frame.empty and "log_return" in prepared.frame
+        assert prepared.summary.rows_out == prepared.summary.masked_returns == 0
+
+
+def test_reset_policy_flags_session_restarts():
+    assert prepare_prices(_dirty_frame(), "reset", **CALENDAR).reset_sessions
+
+
+def test_clean_data_keeps_legacy_detector_inputs_within_sessions():
+    df = regime_switching_prices(2, seed=1)
+    prepared = prepare_prices(df, **CALENDAR)
+    legacy = detector_inputs(df.drop(columns="regime"))
+    inputs = detector_inputs(prepared.frame)
+
+    # Only the overnight return is dropped.
+    assert len(inputs) == len(legacy) - 1
+    overnight = legacy["prev_time"].dt.date != legacy["time"].dt.date
+    np.testing.assert_allclose(inputs["log_return"], legacy.loc[~overnight, "log_return"])
+    assert inputs["time"].tolist() == legacy.loc[~overnight, "time"].tolist()
+
+
+def test_detectors_skip_masked_returns():
+    prepared = prepare_prices(_dirty_frame(), "mask", **CALENDAR)
+    flagged = main_cusum_run(prepared.frame, k=0.00005, h=0.0018)
+
+    masked = prepared.frame.loc[prepared.frame["log_return"].isna(), "time"]
+    assert not flagged["timestamp"].isin(masked).any()
+
+
+def test_rejects_unknown_policy_and_mixed_symbols():
+    df = regime_switching_prices(1, seed=0)
+    with pytest.raises(ValueError):
+        prepare_prices(df, "interpolate")
+    with pytest.raises(ValueError):
+        prepare_prices(df.assign(symbol=["SPY", "QQQ"] * (len(df) // 2)))
+
+
+def test_policy_from_env(monkeypatch):
+    monkeypatch.delenv(POLICY_ENV, raising=False)
+    assert policy_from_env() == "mask"
+    monkeypatch.setenv(POLICY_ENV, " Reset ")
+    assert policy_from_env() == "reset"
+
+
+def test_early_close_session_is_not_counted_as_missing():
+    df = regime_switching_prices(2, seed=0)
+    day = df["time"].dt.normalize()
+    early = (day == day.iloc[-1]) & (df["time"].dt.hour >= 17)  # second session closes at 17:00
+    summary = prepare_prices(df[~early], "mask", **CALENDAR).summary
+
+    assert summary.sessions == 2
+    assert summary.expected_minutes == 390 + 210
+    assert summary.missing_minutes == 0
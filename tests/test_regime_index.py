@@ -0,0 +1,137 @@
+import http.client
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.consensus import MINUTE_NS
+from src.ivtool.pipeline.regime_index import (
+    RegimeIndex,
+    RegimeService,
+    UnixHTTPConnection,
+    index_from_csv,
+)
+
+
+def _minutes(start, periods):
+    return pd.date_range(start, periods=periods, freq="1min", tz="UTC")
+
+
+def _frame(*runs):
+    return pd.DataFrame({"timestamp": np.concatenate([_minutes(start, n) for start, n in runs]), "regime": "high risk"})
+
+
+def _brute_force(bars, t0, t1):
+    """Flagged bars whose minute overlaps [t0, t1]."""
+    return [b for b in bars if b <= t1 and b + MINUTE_NS > t0]
+
+
+def test_bars_collapse_into_half_open_intervals():
+    index = RegimeIndex()
+    index.add_frame("high_risk", _frame(("2024-03-04 14:30", 5), ("2024-03-04 15:00", 2)))
+
+    starts, stops = index.intervals("high_risk")
+    assert pd.to_datetime(starts, utc=True).strftime("%H:%M").tolist() == ["14:30", "15:00"]
+    assert pd.to_datetime(stops, utc=True).strftime("%H:%M").tolist() == ["14:35", "15:02"]
+    assert index.contains("high_risk", "2024-03-04 14:34:59")
+    assert not index.contains("high_risk", "2024-03-04 14:35")
+    assert index.contains("high_risk", f'ns:{pd.Timestamp("2024-03-04 15:01", tz="UTC").value}')
+    assert index.at("2024-03-04 09:30") == []
+    with pytest.raises(KeyError):
+        index.at("2024-03-04 14:30", source="bocpe")
+    index.add_interval("session", "2024-03-04", "2024-03-05")
+    assert index.contains("session", "20240304")  # a date, not nanoseconds after the epoch
+
+
+def test_point_and_range_queries_match_a_scan():
+    rng = np.random.default_rng(3)
+    day = pd.Timestamp("2024-03-04 13:30", tz="UTC").value
+    bars = np.unique(day + rng.choice(390, size=150, replace=False) * MINUTE_NS)
+    index = RegimeIndex()
+    index.add_bars("bocpe", bars)
+
+    for _ in range(200):
+        t0 = day + int(rng.integers(-30, 420)) * MINUTE_NS + int(rng.integers(0, MINUTE_NS))
+        t1 = t0 + int(rng.integers(0, 20)) * MINUTE_NS
+        assert index.contains("bocpe", t0) == bool(_brute_force(bars, t0, t0))
+        covered = [(s, e) for _, s, e in index.overlapping(t0, t1)]
+        flagged = _brute_force(bars, t0, t1)
+        assert all(any(s <= b < e for s, e in covered) for b in flagged)
+        assert all(any(s <= b < e for b in flagged) for s, e in covered)
+
+
+def test_incremental_alarms_extend_the_tail_and_merge_late_ones():
+    index = RegimeIndex()
+    for minute in _minutes("2024-03-04 14:30", 40):
+        index.add_bars("cusum", [minute])
+    index.add_interval("cusum", "2024-03-04 16:00", "2024-03-04 16:30")
+    assert len(index) == 2
+
+    # A late alarm bridging the gap merges both intervals.
+    index.add_interval("cusum", "2024-03-04 15:05", "2024-03-04 16:10")
+    starts, stops = index.intervals("cusum")
+    assert starts.size == 1
+    assert pd.Timestamp(starts[0], tz="UTC") == pd.Timestamp("2024-03-04 14:30", tz="UTC")
+    assert pd.Timestamp(stops[0], tz="UTC") == pd.Timestamp("2024-03-04 16:30", tz="UTC")
+    assert index.version == 42
+
+
+def test_index_from_csv_names_sources_after_files(tmp_path):
+    path = tmp_path / "high_risk_regimes.csv"
+    _frame(("2024-03-04 14:30", 3)).to_csv(path, index=False)
+
+    index = index_from_csv([str(path)])
+    assert index.sources == ["high_risk_regimes"]
+    assert index.to_frame()["stop"].iloc[0] == pd.Timestamp("2024-03-04 14:33", tz="UTC")
+
+
+def _get(conn, path):
+    conn.request("GET", path)
+    response = conn.getresponse()
+    return response.status, json.loads(response.read())
+
+
+def test_http_service_answers_caches_and_accepts_alarms():
+    index = RegimeIndex()
+    index.add_frame("high_risk", _frame(("2024-03-04 14:30", 5)))
+    service = RegimeService(index, port=0).start()
+    try:
+        host, port = service.address
+        conn = http.client.HTTPConnection(host, port, timeout=5)
+
+        status, body = _get(conn, "/regime?t=2024-03-04T14:32:00Z")
+        assert status == 200 and body["in_regime"]
+        assert body["regimes"] == [{"source": "high_risk", "start": "2024-03-04T14:30:00+00:00", "end": "2024-03-04T14:35:00+00:00"}]
+        assert _get(conn, "/regime?t=2024-03-04T14:32:00Z")[1] == body
+        assert service.cache.hits == 1
+
+        conn.request("POST", "/alarms", body=json.dumps({"source": "high_risk", "timestamps": ["2024-03-04T14:35:00Z"]}))
+        response = conn.getresponse()
+        assert response.status == 200 and json.loads(response.read())["intervals"] == 1
+
+        status, body = _get(conn, "/overlaps?start=2024-03-04T14:35:30Z&end=2024-03-04T15:00:00Z")
+        assert [regime["end"] for regime in body["regimes"]] == ["2024-03-04T14:36:00+00:00"]
+        assert _get(conn, "/regime?t=2024-03-04T14:32:00Z")[0] == 200
+        assert service.cache.hits == 1
+
+        assert _get(conn, "/regime")[0] == 400
+        assert _get(conn, "/regime?t=2024-03-04&source=nope")[0] == 404
+        assert _get(conn, "/stats")[1]["sources"] == {"high_risk": 1}
+        conn.close()
+    finally:
+        service.close()
+
+
+def test_unix_socket_service(tmp_path):
+    index = RegimeIndex()
+    index.add_frame("high_risk", _frame(("2024-03-04 14:30", 5)))
+    path = str(tmp_path / "regimes.sock")
+    service = RegimeService(index, unix_socket=path).start()
+    try:
+        conn = UnixHTTPConnection(path)
+        status, body = _get(conn, "/overlaps?start=2024-03-04T14:00Z&end=2024-03-04T14:30Z")
+        assert status == 200 and len(body["regimes"]) == 1
+        conn.close()
+    finally:
+        service.close()
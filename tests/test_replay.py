@@ -0,0 +1,158 @@
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.replay import (
+    ReplayProgress,
+    csv_chunks,
+    db_chunks,
+    main,
+    paced,
+    parquet_chunks,
+    replay,
+    sorted_csv_chunks,
+    ticks,
+)
+from src.ivtool.pipeline.resample import MultiScaleMonitor, ScaleAlarm
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+from src.ivtool.storage import sqlite_store
+
+FAST = ("cusum", "page_hinkley")
+
+
+def _alarms(events):
+    return [event for event in events if isinstance(event, ScaleAlarm)]
+
+
+def _write_csv(tmp_path, n_sessions, seed=3):
+    df = regime_switching_prices(n_sessions, seed=seed)
+    path = tmp_path / f"prices_{n_sessions}.csv"
+    df[["time", "symbol", "price"]].to_csv(path, index=False)
+    return df, path
+
+
+def test_csv_replay_matches_monitor_over_whole_frame(tmp_path):
+    df, path = _write_csv(tmp_path, 3)
+    timestamps = df["time"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    monitor = MultiScaleMonitor(scales=(1, 5))
+    expected = monitor.run(timestamps, df["price"].to_numpy())
+
+    events = list(replay(csv_chunks(path, chunksize=500), scales=(1, 5), progress_every=400))
+    alarms = _alarms(events)
+    progress = [event for event in events if isinstance(event, ReplayProgress)]
+
+    assert len(alarms) == len(expected) > 0
+    got = pd.DataFrame([(a.timestamp, a.minutes, a.detector, a.kind) for a in alarms], columns=["timestamp", "minutes", "detector", "kind"])
+    got["timestamp"] = pd.to_datetime(got["timestamp"], utc=True)
+    got = got.sort_values(["timestamp", "minutes", "detector"], kind="stable").reset_index(drop=True)
+    pd.testing.assert_frame_equal(got, expected)
+    assert progress[-1].ticks == len(df)
+    assert progress[-1].alarms == len(alarms)
+    assert [p.ticks for p in progress[:-1]] == list(range(400, len(df), 400))
+
+
+def test_parquet_and_db_sources_match_csv(tmp_path):
+    df, path = _write_csv(tmp_path, 2)
+    parquet_path = tmp_path / "prices.parquet"
+    df[["time", "price"]].to_parquet(parquet_path, row_group_size=300)
+    store = sqlite_store()
+    store.insert(df)
+
+    from_csv = _alarms(replay(csv_chunks(path, chunksize=250), detectors=FAST))
+    from_parquet = _alarms(replay(parquet_chunks(parquet_path, batch_size=250), detectors=FAST))
+    from_db = _alarms(replay(db_chunks(store, "SPY", chunksize=250, start="2015-01-01"), detectors=FAST))
+
+    assert from_csv and from_csv == from_parquet == from_db
+
+
+def test_out_of_order_input_is_rejected():
+    chunks = [(np.array([1, 2, 3]), np.ones(3)), (np.array([2, 4]), np.ones(2))]
+    with pytest.raises(ValueError):
+        list(ticks(chunks))
+
+
+def test_pacing_follows_speed_and_caps_pauses():
+    now = [0.0]
+    slept = []
+
+    def sleep(seconds):
+        slept.append(seconds)
+        now[0] += seconds
+
+    minute = 60 * 10**9
+    stream = [(0, 1.0), (minute, 1.0), (2 * minute, 1.0), (2 * minute + 3600 * 10**9, 1.0)]
+    out = list(paced(iter(stream), speed=60.0, max_pause_s=5.0, clock=lambda: now[0], sleep=sleep))
+
+    assert out == stream
+    assert slept == pytest.approx([1.0, 1.0, 5.0])
+    assert list(paced(iter(stream), speed=None)) == stream
+
+
+@pytest.mark.parametrize("progress_every", [1000, 0])
+def test_memory_does_not_grow_with_history(tmp_path, progress_every):
+    def peak(n_sessions):
+        _, path = _write_csv(tmp_path, n_sessions)
+        tracemalloc.start()
+        for _ in replay(csv_chunks(path, chunksize=1000), detectors=FAST, progress_every=progress_every):
+            pass
+        _, peak_bytes = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+        return peak_bytes
+
+    peak(2)  # warm caches and lazy imports
+    # The CSV reader's buffers set the peak once the file outgrows them; history length does not.
+    assert peak(72) < 1.25 * peak(24)
+
+
+def test_newest_first_sample_is_replayed_oldest_first(tmp_path):
+    path = "data/samples/prices.csv"
+    expected = pd.read_csv(path, skipinitialspace=True).iloc[::-1]
+    for chunksize in (4, 1000):
+        chunks = list(csv_chunks(path, chunksize=chunksize))
+        times = np.concatenate([timestamps for timestamps, _ in chunks])
+        prices = np.concatenate([values for _, values in chunks])
+        assert np.all(np.diff(times) > 0) and len(times) == len(expected)
+        np.testing.assert_array_equal(prices, expected["price"].to_numpy())
+
+    out = tmp_path / "alarms.csv"
+    final = main(["--csv", path, "--chunksize", "5", "--out", str(out)])
+    assert final.ticks == len(expected)
+    assert out.read_text().splitlines()[0] == "timestamp,minutes,detector,kind"
+
+
+def test_failed_replay_leaves_no_output(tmp_path):
+    path = tmp_path / "shuffled.csv"
+    path.write_text("time,price\n2024-03-04 14:31:00,1.0\n2024-03-04 14:30:00,1.0\n2024-03-04 14:32:00,1.0\n")
+    out = tmp_path / "alarms.csv"
+    with pytest.raises(ValueError):
+        main(["--csv", str(path), "--chunksize", "1", "--out", str(out)])
+    assert not out.exists()
+
+
+def test_interrupted_replay_keeps_the_alarms_written_so_far(tmp_path, monkeypatch):
+    def interrupted(*args, **kwargs):
+        yield ScaleAlarm(0, 1, "cusum", "alarm")
+        raise KeyboardInterrupt
+
+    monkeypatch.setattr("src.ivtool.pipeline.replay.replay", interrupted)
+    _, path = _write_csv(tmp_path, 1)
+    out = tmp_path / "alarms.csv"
+    with pytest.raises(KeyboardInterrupt):
+        main(["--csv", str(path), "--out", str(out)])
+    assert out.read_text().splitlines()[1] == "1970-01-01T00:00:00+00:00,1,cusum,alarm"
+
+
+def test_sort_requires_a_csv_source(tmp_path):
+    with pytest.raises(SystemExit):
+        main(["--parquet", str(tmp_path / "prices.parquet"), "--sort"])
+
+
+def test_overlapping_exports_are_sorted_and_deduplicated():
+    path = "research/test_prices.csv"
+    with pytest.raises(ValueError):
+        list(ticks(csv_chunks(path)))
+    times = np.concatenate([timestamps for timestamps, _ in sorted_csv_chunks(path, chunksize=50)])
+    expected = pd.to_datetime(pd.read_csv(path, skipinitialspace=True)["timestamp"], utc=True)
+    assert np.all(np.diff(times) > 0) and len(times) == expected.nunique()
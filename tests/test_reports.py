@@ -0,0 +1,85 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.detectors.base import date_slices, plot_daily_volatility
+from src.ivtool.pipeline.reports import day_slices, lttb, render_reports, report_jobs
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+
+def test_day_slices_match_per_day_filters():
+    df = regime_switching_prices(5, seed=2)
+    dates = pd.DatetimeIndex(df["time"]).tz_convert("America/New_York").date
+    index = day_slices(df["time"])
+
+    assert len(index) == 5
+    for day, rows in index.items():
+        assert np.array_equal(np.arange(len(df))[rows], np.flatnonzero(dates.astype(str) == day))
+
+
+def test_base_date_slices_match_the_date_filter():
+    df = pd.DataFrame({"date": ["a", "a", "b", "c", "c", "c"], "price": np.arange(6.0)})
+    index = date_slices(df)
+
+    for day, rows in index.items():
+        pd.testing.assert_frame_equal(df.iloc[rows], df[df["date"] == day])
+    with pytest.raises(ValueError):
+        date_slices(pd.DataFrame({"date": ["a", "b", "a"]}))
+
+
+def test_lttb_keeps_endpoints_and_spikes():
+    x = np.arange(10_000, dtype=float)
+    y = np.sin(x / 500.0)
+    y[4321] = 25.0
+    keep = lttb(x, y, 200)
+
+    assert keep.size == 200 and keep[0] == 0 and keep[-1] == x.size - 1
+    assert np.all(np.diff(keep) > 0)
+    assert 4321 in keep
+    assert np.array_equal(lttb(x[:50], y[:50], 200), np.arange(50))
+
+
+def test_report_jobs_downsample_and_place_alarms_by_day():
+    df = regime_switching_prices(3, seed=2)
+    alarms = {"cusum": df["time"].iloc[[10, 400, 401]], "bocpe": df["time"].iloc[[800]]}
+    jobs = report_jobs(df, alarms, max_points=100)
+
+    assert [job.points for job in jobs] == [390, 390, 390]
+    assert all(job.times.size == 100 for job in jobs)
+    assert [job.alarms["cusum"][0].size for job in jobs] == [1, 2, 0]
+    assert [job.alarms["bocpe"][0].size for job in jobs] == [0, 0, 1]
+    np.testing.assert_allclose(jobs[1].alarms["cusum"][1], df["price"].iloc[[400, 401]])
+    assert jobs[0].threshold == pytest.approx(df["price"].pct_change().rolling(30).std().quantile(0.95))
+
+    (only,) = report_jobs(df, alarms, days=[jobs[2].day])
+    assert only.day == jobs[2].day
+
+
+def test_render_reports_writes_png_and_html(tmp_path):
+    pytest.importorskip("matplotlib")
+    df = regime_switching_prices(2, seed=2)
+    alarms = {"cusum": df["time"].iloc[[10, 500]], "page_hinkley": df["time"].iloc[[20]]}
+
+    paths = render_reports(df, alarms, str(tmp_path), formats=("png", "html"), workers=2)
+
+    assert sorted(p.rsplit("/", 1)[-1] for p in paths) == ["2015-01-02.html", "2015-01-02.png", "2015-01-05.html", "2015-01-05.png"]
+    assert (tmp_path / "2015-01-02.png").read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
+    page = (tmp_path / "2015-01-02.html").read_text()
+    assert "<td>cusum</td><td>1</td>" in page and "data:image/png;base64," in page
+    with pytest.raises(ValueError):
+        render_reports(df, alarms, str(tmp_path), formats=("svg",))
+
+
+def test_saved_plots_leave_the_pyplot_backend_alone(tmp_path):
+    matplotlib = pytest.importorskip("matplotlib")
+    backend = matplotlib.get_backend()
+    df = regime_switching_prices(1, seed=2)
+    render_reports(df, {}, str(tmp_path), workers=1)
+    frame = pd.DataFrame({
+        "date": "2015-01-02", "timestamp": df["time"], "price": df["price"],
+        "rolling_std": df["price"].pct_change().rolling(30).std(), "alarm": False,
+    })
+    plot_daily_volatility("2015-01-02", frame, 0.01, path=str(tmp_path / "day.png"))
+
+    assert matplotlib.get_backend() == backend
+    assert (tmp_path / "day.png").read_bytes()[:8] == b"\x89PNG\r\n\x1a\n"
@@ -0,0 +1,112 @@
+import numpy as np
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline.resample import (
+    DETECTORS,
+    BarAggregator,
+    MultiScaleMonitor,
+    aggregate_bars,
+    run_multiscale,
+    scale_params,
+)
+from src.ivtool.pipeline.synthetic import regime_switching_prices
+
+
+def _arrays(n_sessions=3, seed=2):
+    df = regime_switching_prices(n_sessions=n_sessions, seed=seed)
+    timestamps = df["time"].to_numpy(dtype="datetime64[ns]").astype(np.int64)
+    return df, timestamps, df["price"].to_numpy()
+
+
+@pytest.mark.parametrize("minutes", [1, 5, 15, 30])
+def test_incremental_aggregation_matches_vectorized(minutes):
+    _, timestamps, prices = _arrays()
+    log_returns = np.concatenate([[np.nan], np.diff(np.log(prices))])
+
+    aggregator = BarAggregator(minutes)
+    bars = [aggregator.update(t, p, r) for t, p, r in zip(timestamps, prices, log_returns)]
+    bars = [bar for bar in bars if bar is not None] + [aggregator.flush()]
+    expected = aggregate_bars(timestamps, prices, minutes)
+
+    assert [bar.start for bar in bars] == expected["start"].tolist()
+    np.testing.assert_allclose([bar.realized_variance for bar in bars], expected["realized_variance"], rtol=1e-12)
+    np.testing.assert_allclose([bar.log_return for bar in bars], expected["log_return"], rtol=1e-9, atol=1e-15)
+    assert [bar.count for bar in bars] == expected["count"].tolist()
+
+
+def test_bar_log_returns_telescope_to_close_to_close():
+    _, timestamps, prices = _arrays(n_sessions=1)
+
+    bars = aggregate_bars(timestamps, prices, 15)
+
+    assert len(bars) == 390 // 15
+    np.testing.assert_allclose(bars["log_return"].iloc[1:], np.diff(np.log(bars["close"])), atol=1e-12)
+
+
+def test_empty_input_aggregates_to_no_bars():
+    bars = aggregate_bars(np.empty(0, dtype=np.int64), np.empty(0), 5)
+
+    assert len(bars) == 0
+    assert bars.columns.tolist() == ["start", "close", "log_return", "realized_variance", "count"]
+    assert run_multiscale(pd.DataFrame({"time": pd.to_datetime([], utc=True), "price": []}), scales=(1, 5)).empty
+
+
+def test_scale_shorter_than_page_hinkley_window_has_no_alarms():
+    df, _, _ = _arrays(n_sessions=1)
+    # 20 one-minute bars and 4 five-minute bars, both short of the 30-minute window.
+    alarms = run_multiscale(df.iloc[:20], scales=(1, 5), detectors=("page_hinkley",))
+
+    assert alarms.empty
+
+
+def test_scale_params_rescales_thresholds():
+    assert scale_params("cusum", {"k": 1.0, "h": 2.0}, 4) == {"k": 2.0, "h": 4.0}
+    bocpe = scale_params("bocpe", {"hazard": 0.01, "vol_threshold": 0.001, "max_run_length": 1200}, 5)
+    assert bocpe == pytest.approx({"hazard": 0.05, "vol_threshold": 0.005, "max_run_length": 240})
+    assert scale_params("page_hinkley", {"alarm_threshold": 250.0}, 30) == {"alarm_threshold": 250.0}
+
+
+def test_streaming_monitor_matches_offline_run():
+    df, timestamps, prices = _arrays(n_sessions=5, seed=4)
+    params = {"page_hinkley": {"alarm_threshold": 40.0}}
+
+    offline = run_multiscale(df, scales=(5, 15), params=params)
+    streamed = MultiScaleMonitor(scales=(5, 15), params=params).run(timestamps, prices)
+
+    assert len(offline)
+    pd.testing.assert_frame_equal(streamed, offline)
+
+
+def test_escalation_only_runs_fine_scale_after_coarse_alarm():
+    df, timestamps, prices = _arrays(n_sessions=5, seed=4)
+
+    monitor = MultiScaleMonitor(
+        scales=(15,),
+        detectors=("cusum",),
+        params={"cusum": {"k": 0.00005, "h": 0.001}},
+        escalate_to=1,
+        escalation_minutes=20,
+    )
+    alarms = monitor.run(timestamps, prices)
+
+    coarse = alarms[alarms["minutes"] == 15]["timestamp"]
+    fine = alarms[alarms["minutes"] == 1]["timestamp"]
+    assert len(coarse) and len(fine)
+    assert 0 < monitor.bars_evaluated[1] < len(df)
+    # Every fine alarm falls inside an escalation window opened by a coarse alarm.
+    window = pd.Timedelta(minutes=15 + 20)
+    assert all(((ts - coarse) >= pd.Timedelta(0)).any() and ((ts - coarse) <= window).any() for ts in fine)
+
+
+@pytest.mark.parametrize("detectors", [("cusum",), DETECTORS])
+def test_offline_escalation_matches_the_streaming_monitor(detectors):
+    df, timestamps, prices = _arrays(n_sessions=5, seed=4)
+    params = {"cusum": {"k": 0.00005, "h": 0.001}, "page_hinkley": {"alarm_threshold": 40.0}}
+    kwargs = {"detectors": detectors, "params": params, "escalate_to": 1, "escalation_minutes": 20}
+
+    offline = run_multiscale(df, scales=(15, 5), **kwargs)
+    streamed = MultiScaleMonitor(scales=(15, 5), **kwargs).run(timestamps, prices)
+
+    assert (offline["minutes"] == 1).any()
+    pd.testing.assert_frame_equal(streamed, offline)
@@ -0,0 +1,156 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.ivtool.pipeline import sinks
+
+
+def _tables():
+    return {
+        "high_risk_regimes": pd.DataFrame({
+            "timestamp": pd.to_datetime(["2025-09-05 14:01", "2025-09-05 14:16"], utc=True),
+            "regime": "high risk",
+        }),
+        "detector_calibration": pd.DataFrame([{"model": "cusum", "k": 0.00005, "h": 0.0023}]),
+    }
+
+
+def _metadata(run_id="run1", created="2025-09-06T01:00:00+00:00"):
+    return sinks.RunMetadata(
+        run_id=run_id,
+        params={"cusum": {"k": 0.00005, "h": 0.0023}},
+        data_fingerprint="abc",
+        input_rows=10,
+        created=created,
+    )
+
+
+def test_data_fingerprint_tracks_prices_and_times():
+    df = pd.DataFrame({"time": pd.date_range("2025-09-05", periods=3, freq="1min", tz="UTC"), "price": [1.0, 2.0, 3.0]})
+
+    assert sinks.data_fingerprint(df) == sinks.data_fingerprint(df.copy())
+    assert sinks.data_fingerprint(df) != sinks.data_fingerprint(df.assign(price=[1.0, 2.0, 3.5]))
+
+
+def test_csv_sink_writes_legacy_files(tmp_path):
+    sinks.CsvSink(tmp_path).write(_tables(), _metadata())
+
+    assert pd.read_csv(tmp_path / "high_risk_regimes.csv")["regime"].tolist() == ["high risk", "high risk"]
+    assert json.loads((tmp_path / "run_metadata.json").read_text())["run_id"] == "run1"
+
+
+def test_parquet_sink_appends_partitions(tmp_path):
+    pytest.importorskip("pyarrow")
+    sink = sinks.ParquetSink(tmp_path)
+
+    sink.write(_tables(), _metadata("run1", "2025-09-06T01:00:00+00:00"))
+    sink.write(_tables(), _metadata("run2", "2025-09-07T01:00:00+00:00"))
+
+    everything = sinks.ParquetSink.read(tmp_path, "high_risk_regimes")
+    latest = sinks.ParquetSink.read(tmp_path, "high_risk_regimes", since="2025-09-07")
+    assert len(everything) == 4
+    assert latest["run_id"].unique().tolist() == ["run2"]
+    assert (tmp_path / "runs" / "run_date=2025-09-07" / "run-run2.json").exists()
+
+
+class _FakeCursor:
+    def __init__(self, log, columns):
+        self.log = log
+        self.columns = columns
+        self.rows = []
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        return False
+
+    def execute(self, sql, params=None):
+        self.log.append(("execute", sql, params))
+        if "information_schema" in sql:
+            self.rows = list(self.columns.get(params[0], {}).items())
+
+    def fetchall(self):
+        return self.rows
+
+    def copy_expert(self, sql, buffer):
+        self.log.append(("copy", sql, buffer.read()))
+
+
+class _FakeConnection:
+    def __init__(self, columns=None):
+        self.log = []
+        self.columns = columns or {}
+        self.committed = False
+        self.closed = False
+
+    def cursor(self):
+        return _FakeCursor(self.log, self.columns)
+
+    def commit(self):
+        self.committed = True
+
+    def rollback(self):
+        pass
+
+    def close(self):
+        self.closed = True
+
+
+def test_postgres_sink_bulk_copies_each_table():
+    conn = _FakeConnection()
+
+    sinks.PostgresCopySink(connect=lambda: conn).write(_tables(), _metadata())
+
+    copies = [entry for entry in conn.log if entry[0] == "copy"]
+    assert [sql.split('"')[1] for _, sql, _ in copies] == ["ivm_high_risk_regimes", "ivm_detector_calibration"]
+    assert copies[0][2].splitlines()[0].startswith("run1,2025-09-05 14:01:00")
+    assert any('"timestamp" TIMESTAMPTZ' in entry[1] for entry in conn.log if entry[0] == "execute")
+    assert conn.committed and conn.closed
+
+
+def test_postgres_sink_adds_new_columns_and_skips_empty_frames():
+    existing = {"run_id": "text", "timestamp": "timestamp with time zone"}
+    conn = _FakeConnection({"ivm_high_risk_regimes": existing})
+    tables = {**_tables(), "model_flag_disagreements": pd.DataFrame(columns=["date", "cusum_alarms"])}
+
+    sinks.PostgresCopySink(connect=lambda: conn).write(tables, _metadata())
+
+    ddl = [entry[1] for entry in conn.log if entry[0] == "execute" and "ivm_runs" not in entry[1]]
+    assert 'ALTER TABLE "ivm_high_risk_regimes" ADD COLUMN "regime" TEXT' in ddl
+    assert not any("model_flag_disagreements" in entry[1] for entry in conn.log)
+    assert any(sql.startswith('CREATE TABLE IF NOT EXISTS "ivm_detector_calibration"') for sql in ddl)
+
+
+def test_postgres_sink_rejects_changed_column_types():
+    conn = _FakeConnection({"ivm_high_risk_regimes": {"run_id": "text", "timestamp": "bigint"}})
+
+    with pytest.raises(ValueError, match="timestamp"):
+        sinks.PostgresCopySink(connect=lambda: conn).write(_tables(), _metadata())
+    assert not conn.committed and not any(entry[0] == "copy" for entry in conn.log)
+
+
+@pytest.mark.parametrize(
+    "spec, expected",
+    [("", sinks.CsvSink), ("parquet:/tmp/out", sinks.ParquetSink), ("postgres", sinks.PostgresCopySink)],
+)
+def test_sink_from_env(monkeypatch, spec, expected):
+    monkeypatch.setenv(sinks.SINK_ENV, spec or "csv")
+
+    assert isinstance(sinks.sink_from_env(), expected)
+
+
+def test_sink_from_env_rejects_unknown_sink(monkeypatch):
+    monkeypatch.setenv(sinks.SINK_ENV, "s3")
+
+    with pytest.raises(ValueError):
+        sinks.sink_from_env()
+
+
+def test_results_sink_requires_write():
+    class NoWrite(sinks.ResultsSink):
+        pass
+
+    with pytest.raises(TypeError):
+        NoWrite()
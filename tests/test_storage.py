@@ -0,0 +1,217 @@
+import threading
+
+import pandas as pd
+import pytest
+
+from src.ivtool import storage
+from src.ivtool.storage import ConnectionPool, PriceStore, sqlite_store, store_from_env
+
+
+def _bars(symbol, start, periods, price=100.0):
+    return pd.DataFrame({
+        "time": pd.date_range(start, periods=periods, freq="1min", tz="UTC"),
+        "symbol": symbol,
+        "price": price,
+    })
+
+
+@pytest.fixture
+def store():
+    store = sqlite_store()
+    store.insert(_bars("SPY", "2024-03-04 14:30", 60))
+    store.insert(_bars("QQQ", "2024-03-04 14:30", 30, price=300.0))
+    yield store
+    store.pool.close()
+
+
+def test_range_reads_filter_by_symbol_and_half_open_bounds(store):
+    frame = store.read_range("SPY", "2024-03-04 14:40", pd.Timestamp("2024-03-04 09:50", tz="America/New_York"))
+
+    assert frame.columns.tolist() == ["time", "symbol", "price"]
+    assert len(frame) == 10 and set(frame["symbol"]) == {"SPY"}
+    assert frame["time"].iloc[0] == pd.Timestamp("2024-03-04 14:40", tz="UTC")
+    assert frame["time"].is_monotonic_increasing
+    assert len(store.read_range()) == 90
+    assert len(store.read_range("QQQ", start="2024-03-04 14:50")) == 10
+
+
+def test_insert_skips_stored_rows(store):
+    # 30 of the 60 bars overlap the fixture's, so only 30 are new.
+    assert store.insert(_bars("SPY", "2024-03-04 15:00", 60)) == 30
+    assert store.insert(_bars("SPY", "2024-03-04 15:00", 60)) == 0
+    assert len(store.read_range("SPY")) == 90
+    assert store.watermark("SPY") == pd.Timestamp("2024-03-04 15:59", tz="UTC")
+    assert store.watermark("IWM") is None
+
+
+def test_iter_range_chunks_match_read_range(store):
+    chunks = list(store.iter_range("SPY", chunksize=25))
+
+    assert [len(chunk) for chunk in chunks] == [25, 25, 10]
+    pd.testing.assert_frame_equal(pd.concat(chunks, ignore_index=True), store.read_range("SPY"))
+
+
+def test_schema_has_symbol_time_index(store):
+    with store.pool.connection() as conn:
+        indexes = [row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'index'")]
+        plan = " ".join(
+            str(row[-1]) for row in conn.execute(
+                'EXPLAIN QUERY PLAN SELECT "time" FROM "SPY_DATA_V2" WHERE "symbol" = ? AND "time" >= ? ORDER BY "time"',
+                ("SPY", "2024"),
+            )
+        )
+    assert "SPY_DATA_V2_symbol_time_idx" in indexes
+    assert "SPY_DATA_V2_symbol_time_idx" in plan
+    with pytest.raises(ValueError):
+        store.ensure_schema("brin")
+
+
+def test_pool_reuses_connections_and_bounds_concurrency():
+    opened = []
+    active = []
+    peak = [0]
+    lock = threading.Lock()
+
+    class Conn:
+        closed = False
+
+        def commit(self):
+            pass
+
+        def rollback(self):
+            pass
+
+        def close(self):
+            self.closed = True
+
+    def connect():
+        opened.append(Conn())
+        return opened[-1]
+
+    pool = ConnectionPool(connect, maxsize=2)
+
+    def work():
+        with pool.connection() as conn:
+            with lock:
+                active.append(conn)
+                peak[0] = max(peak[0], len(active))
+            threading.Event().wait(0.01)
+            with lock:
+                active.remove(conn)
+
+    threads = [threading.Thread(target=work) for _ in range(8)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert peak[0] <= 2 and pool.created == len(opened) <= 2
+
+    # A connection closed while in use is dropped and replaced.
+    with pool.connection() as conn:
+        conn.close()
+    with pool.connection() as conn:
+        assert not conn.closed
+    pool.close()
+    assert all(conn.closed for conn in opened)
+
+
+def test_pool_rolls_back_on_error():
+    calls = []
+
+    class Conn:
+        def commit(self):
+            calls.append("commit")
+
+        def rollback(self):
+            calls.append("rollback")
+
+    pool = ConnectionPool(Conn)
+    with pytest.raises(RuntimeError), pool.connection():
+        raise RuntimeError("boom")
+    with pool.connection():
+        pass
+    assert calls == ["rollback", "commit"] and pool.created == 1
+
+
+class _PgCursor:
+    def __init__(self, conn, name=None):
+        self.conn = conn
+        self.name = name
+        self.rows = []
+
+    def execute(self, sql, params=None):
+        self.conn.statements.append((self.name, sql, params))
+        if sql.startswith("EXECUTE") or self.name:
+            self.rows = list(self.conn.rows)
+
+    def fetchall(self):
+        return self.rows
+
+    def fetchmany(self, size):
+        batch, self.rows = self.rows[:size], self.rows[size:]
+        return batch
+
+    def close(self):
+        pass
+
+
+class _PgConnection:
+    closed = 0
+
+    def __init__(self, rows):
+        self.rows = rows
+        self.statements = []
+
+    def cursor(self, name=None):
+        return _PgCursor(self, name)
+
+    def commit(self):
+        pass
+
+    def rollback(self):
+        pass
+
+
+def test_postgres_range_reads_are_prepared_once_per_connection():
+    conn = _PgConnection([(pd.Timestamp("2024-03-04 14:30", tz="UTC").to_pydatetime(), "SPY", 1.0)])
+    store = PriceStore(ConnectionPool(lambda: conn, maxsize=1))
+
+    store.read_range("SPY", "2024-03-04")
+    store.read_range("SPY", end="2024-03-05")
+    store.read_range()
+
+    sql = [statement for _, statement, _ in conn.statements]
+    assert sql[0].startswith("PREPARE ivtool_spy_data_v2_range_3 (text, timestamptz, timestamptz) AS SELECT")
+    assert '"symbol" = $1 AND "time" >= $2 AND "time" < $3' in sql[0]
+    assert sql[1] == sql[2] == "EXECUTE ivtool_spy_data_v2_range_3 (%s, %s, %s)"
+    assert conn.statements[2][2][1] == "-infinity"
+    assert sql[3].startswith("PREPARE ivtool_spy_data_v2_range_2 (timestamptz, timestamptz)")
+    assert conn.statements[4][2] == ("-infinity", "infinity")
+    assert len(sql) == 5
+
+
+def test_postgres_iter_range_uses_a_named_cursor():
+    conn = _PgConnection([(pd.Timestamp("2024-03-04 14:30", tz="UTC").to_pydatetime(), "SPY", 1.0)] * 5)
+    store = PriceStore(ConnectionPool(lambda: conn, maxsize=1))
+
+    chunks = list(store.iter_range("SPY", chunksize=2))
+
+    assert [len(chunk) for chunk in chunks] == [2, 2, 1]
+    name, sql, params = conn.statements[-1]
+    assert name == "ivtool_range"
+    assert '"symbol" = %s AND "time" >= %s AND "time" < %s' in sql and params[0] == "SPY"
+
+
+def test_store_from_env_shares_one_store(monkeypatch, tmp_path):
+    pytest.importorskip("dotenv")
+    monkeypatch.setenv(storage.DATABASE_URL_ENV, f"sqlite:///{tmp_path / 'prices.db'}")
+    monkeypatch.setattr(storage, "_STORES", {})
+
+    first = store_from_env()
+    first.insert(_bars("SPY", "2024-03-04 14:30", 5))
+
+    assert store_from_env() is first
+    from src.ivtool.pipeline.main_factory import get_data
+
+    assert len(get_data("SPY")) == 5
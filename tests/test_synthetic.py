@@ -0,0 +1,64 @@
+import json
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from benchmarks import run as bench
+from src.ivtool.pipeline.synthetic import (
+    BARS_PER_SESSION,
+    regime_switching_prices,
+    regime_switching_returns,
+    scale_prices,
+)
+
+
+def test_regime_switching_prices_are_deterministic():
+    first = regime_switching_prices(n_sessions=3, seed=11)
+    second = regime_switching_prices(n_sessions=3, seed=11)
+
+    pd.testing.assert_frame_equal(first, second)
+    assert not first["price"].equals(regime_switching_prices(n_sessions=3, seed=12)["price"])
+
+
+def test_regime_switching_prices_follow_session_calendar():
+    df = regime_switching_prices(n_sessions=5)
+    times = df["time"]
+
+    assert len(df) == 5 * BARS_PER_SESSION
+    assert times.is_monotonic_increasing
+    assert (times.dt.weekday < 5).all()
+    assert times.dt.strftime("%H:%M").min() == "13:30"
+    assert times.dt.strftime("%H:%M").max() == "19:59"
+    assert list(df.columns) == ["time", "symbol", "price", "regime"]
+
+
+def test_regime_switching_returns_scale_with_regime():
+    returns, regime = regime_switching_returns(200_000, low_vol=0.0003, high_vol=0.0012, seed=3)
+
+    assert set(np.unique(regime)) == {0, 1}
+    assert returns[regime == 0].std() == pytest.approx(0.0003, rel=0.05)
+    assert returns[regime == 1].std() == pytest.approx(0.0012, rel=0.05)
+
+
+def test_scale_prices_rejects_unknown_scale():
+    with pytest.raises(ValueError):
+        scale_prices("week")
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_a_single_session_still_switches_regimes(seed):
+    switches = scale_prices("day", seed=seed)["regime"].diff()
+
+    assert (switches > 0).any() and (switches < 0).any()
+
+
+def test_benchmark_results_round_trip_and_flag_regressions(tmp_path):
+    results = bench.run_benchmarks(["day"], ["run_cusum"], repeat=1)
+    path = bench.save_results(results, tmp_path / "baseline.json")
+
+    assert json.loads(path.read_text())["results"][0]["stage"] == "run_cusum"
+    assert bench.compare_results(results, path) == []
+
+    slower = [bench.BenchmarkResult(**{**vars(results[0]), "ticks_per_sec": results[0].ticks_per_sec / 10})]
+    assert len(bench.compare_results(slower, path)) == 1